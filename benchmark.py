@@ -0,0 +1,496 @@
+# Mesures de performance des sous-systèmes du jeu, sans affichage
+# Utilisation: python benchmark.py pathfinding --map Town --queries 200
+#              python benchmark.py load --map Town --zombies 200 --ticks 600 [--draw] [--script fichier.txt]
+#              python benchmark.py workers --map Town --queries 2000 --workers 1 2 4
+#              python benchmark.py replanning --map Town --chases 50 --steps 30
+import argparse
+import collections
+import heapq
+import math
+import os
+import random
+import statistics
+import time
+import tracemalloc
+
+import pygame
+
+import utilities as ut
+
+
+class LegacyPathFinder: # Copie de l'ancien PathFinder (recherche linéaire), conservée uniquement comme référence de comparaison
+        def __init__(self, hitboxes, precision, maxRadius):
+                self.start = None # Le point de départ
+                self.finish = None # Le point d'arrivé
+                self.hitboxes = hitboxes # Les hitboxes a prendre en compte 
+                self.precision = precision # La précision de la recherche 
+                self.maxRadius = maxRadius # Radius maximale a ne pas dépasser pour la recherche 
+                self.nodes = [] # La liste des "nodes"
+                self.path = [] # Liste de "nodes" correspondant au chemin le plus rapide. Seulement aggrémenter avec findBest()
+
+        def __nodeInHitbox(self, rect): # Vérifie si le rectangle d'un node se trouve sur des hitboxes
+                if rect.collidelistall(self.hitboxes):
+                                return True
+                return False
+
+        def __addNeighbourNodes(self, node): # Ajoute 8 nodes à la liste de nodes autour du node précisé si ils n'existent pas déjà et ne se trouvent pas sur des hitboxes
+                # Vérifie que le node à la droite n'existe pas déja
+                nextNodeCoords = (node.rect.x + node.rect.width, node.rect.y) # Position du prochain node 
+                if (not [x for x in self.nodes if nextNodeCoords == x.rect.topleft] and not self.__nodeInHitbox(pygame.Rect(nextNodeCoords, (node.rect.width, node.rect.height)))) or pygame.Rect(nextNodeCoords, (node.rect.width, node.rect.height)).collidepoint(self.finish): # Si le node ne se trouve pas déjà sur l'emplacement d'un autre node et qu'il ne collisionne pas avec des hitboxes ou si un joueur se trouve dedans
+                        # Ajoute le node de droite si elle n'existe pas déja
+                        self.nodes.append(self.Node(nextNodeCoords, node.rect.width, node, 1, self.start, self.finish))
+                        
+                # Vérifie que le node à la gauche n'existe pas déja
+                nextNodeCoords = (node.rect.x - node.rect.width, node.rect.y) # Position du prochain node 
+                if (not [x for x in self.nodes if nextNodeCoords == x.rect.topleft] and not self.__nodeInHitbox(pygame.Rect(nextNodeCoords, (node.rect.width, node.rect.height)))) or pygame.Rect(nextNodeCoords, (node.rect.width, node.rect.height)).collidepoint(self.finish): # Si le node ne se trouve pas déjà sur l'emplacement d'un autre node et qu'il ne collisionne pas avec des hitboxes ou si un joueur se trouve dedans
+                        # Ajoute le node de gauche si elle n'existe pas déja
+                        self.nodes.append(self.Node(nextNodeCoords, node.rect.width, node, 1, self.start, self.finish))
+
+                # Vérifie que le node au dessus n'existe pas déja
+                nextNodeCoords = (node.rect.x, node.rect.y - node.rect.width) # Position du prochain node 
+                if (not [x for x in self.nodes if nextNodeCoords == x.rect.topleft] and not self.__nodeInHitbox(pygame.Rect(nextNodeCoords, (node.rect.width, node.rect.height)))) or pygame.Rect(nextNodeCoords, (node.rect.width, node.rect.height)).collidepoint(self.finish): # Si le node ne se trouve pas déjà sur l'emplacement d'un autre node et qu'il ne collisionne pas avec des hitboxes ou si un joueur se trouve dedans
+                        # Ajoute le node au dessus si elle n'existe pas déja
+                        self.nodes.append(self.Node(nextNodeCoords, node.rect.width, node, 1, self.start, self.finish))
+
+                # Vérifie que le node en dessous n'existe pas déja
+                nextNodeCoords = (node.rect.x, node.rect.y + node.rect.width) # Position du prochain node 
+                if (not [x for x in self.nodes if nextNodeCoords == x.rect.topleft] and not self.__nodeInHitbox(pygame.Rect(nextNodeCoords, (node.rect.width, node.rect.height)))) or pygame.Rect(nextNodeCoords, (node.rect.width, node.rect.height)).collidepoint(self.finish): # Si le node ne se trouve pas déjà sur l'emplacement d'un autre node et qu'il ne collisionne pas avec des hitboxes ou si un joueur se trouve dedans
+                        # Ajoute le node en dessous si elle n'existe pas déja
+                        self.nodes.append(self.Node(nextNodeCoords, node.rect.width, node, 1, self.start, self.finish))
+
+                # Vérifie que le node à la droite en haut n'existe pas déja
+                nextNodeCoords = (node.rect.x + node.rect.width, node.rect.y - node.rect.width) # Position du prochain node 
+                if (not [x for x in self.nodes if nextNodeCoords == x.rect.topleft] and not self.__nodeInHitbox(pygame.Rect(nextNodeCoords, (node.rect.width, node.rect.height)))) or pygame.Rect(nextNodeCoords, (node.rect.width, node.rect.height)).collidepoint(self.finish): # Si le node ne se trouve pas déjà sur l'emplacement d'un autre node et qu'il ne collisionne pas avec des hitboxes ou si un joueur se trouve dedans
+                        # Ajoute le node à la droite en haut si elle n'existe pas déja
+                        self.nodes.append(self.Node(nextNodeCoords, node.rect.width, node, 1, self.start, self.finish))
+
+                # Vérifie que le node à la droite en bas n'existe pas déja
+                nextNodeCoords = (node.rect.x + node.rect.width, node.rect.y + node.rect.width) # Position du prochain node 
+                if (not [x for x in self.nodes if nextNodeCoords == x.rect.topleft] and not self.__nodeInHitbox(pygame.Rect(nextNodeCoords, (node.rect.width, node.rect.height)))) or pygame.Rect(nextNodeCoords, (node.rect.width, node.rect.height)).collidepoint(self.finish): # Si le node ne se trouve pas déjà sur l'emplacement d'un autre node et qu'il ne collisionne pas avec des hitboxes ou si un joueur se trouve dedans
+                        # Ajoute le node à la droite en bas si elle n'existe pas déja
+                        self.nodes.append(self.Node(nextNodeCoords, node.rect.width, node, 1, self.start, self.finish))
+
+                # Vérifie que le node à la gauche en haut n'existe pas déja
+                nextNodeCoords = (node.rect.x - node.rect.width, node.rect.y - node.rect.width) # Position du prochain node 
+                if (not [x for x in self.nodes if nextNodeCoords == x.rect.topleft] and not self.__nodeInHitbox(pygame.Rect(nextNodeCoords, (node.rect.width, node.rect.height)))) or pygame.Rect(nextNodeCoords, (node.rect.width, node.rect.height)).collidepoint(self.finish): # Si le node ne se trouve pas déjà sur l'emplacement d'un autre node et qu'il ne collisionne pas avec des hitboxes ou si un joueur se trouve dedans
+                        # Ajoute le node à la gauche en haut si elle n'existe pas déja
+                        self.nodes.append(self.Node(nextNodeCoords, node.rect.width, node, 1, self.start, self.finish))
+
+                # Vérifie que le node à la gauche en bas n'existe pas déja
+                nextNodeCoords = (node.rect.x - node.rect.width, node.rect.y + node.rect.width) # Position du prochain node 
+                if (not [x for x in self.nodes if nextNodeCoords == x.rect.topleft] and not self.__nodeInHitbox(pygame.Rect(nextNodeCoords, (node.rect.width, node.rect.height)))) or pygame.Rect(nextNodeCoords, (node.rect.width, node.rect.height)).collidepoint(self.finish): # Si le node ne se trouve pas déjà sur l'emplacement d'un autre node et qu'il ne collisionne pas avec des hitboxes ou si un joueur se trouve dedans
+                        # Ajoute le node à la gauche en bas si elle n'existe pas déja
+                        self.nodes.append(self.Node(nextNodeCoords, node.rect.width, node, 1, self.start, self.finish))
+
+                node.state = 2 # Change l'état du node pour qu'il ne soit pas pris en compte une deuxième fois par closestNode()
+
+        def __closestNode(self, includeChecked): # Indique le node le plus proche du point de fin dans la liste de nodes
+                tempNodes = list(filter(lambda x: x.state == 1, self.nodes)) 
+                if includeChecked:
+                        smallestTLList = self.nodes
+                else:
+                        smallestTLList = [] # "Smallest Total Lengths List" - liste des nodes dont la longueur totale (longueur au début + longueur à la fin) est la plus courte
+                        for node in tempNodes: # Itère les nodes qui n'ont pas encore été les plus proche
+                                if smallestTLList: # Si un node se trouve déjà dans la liste
+                                        if node.totalLength < smallestTLList[0].totalLength:
+                                                smallestTLList = [node] # Si un node est plus petits que les autres nodes de la liste, il les remplace
+                                        elif node.totalLength == smallestTLList[0].totalLength:
+                                                smallestTLList.append(node) # Si un node a la même longueur totale que les autres nodes il est seulement ajouté
+                                else:
+                                        smallestTLList.append(node) # On ajoute le premier node du "for" pour avoir quelque chose à comparer
+                if len(smallestTLList) > 1: # Si plusieurs nodes ont la même longueur totale 
+                        smallestELList = [] # "Smallest End Lenghts List" - liste des nodes, qui ont la même longueur totale, dont la longueur à la fin est la plus courte
+                        for node in smallestTLList:
+                                if smallestELList:
+                                        if node.endLength < smallestELList[0].endLength:
+                                                smallestELList = [node] # Si un node est plus petits que les autres nodes de la liste, il les remplace
+                                        elif node.endLength == smallestELList[0].endLength:
+                                                smallestELList.append(node) # Si un node a la même longueur à la fin que les autres nodes il est seulement ajouté
+                                else:
+                                        smallestELList.append(node) # On ajoute le premier node du "for" pour avoir quelque chose à comparer
+                        return smallestELList[0] # On retourne le premier node de la liste de nodes ayant la même longueur totale et à la fin
+                else:
+                        return smallestTLList[0] # Retourne l'unique node le plus proche
+
+        def findBest(self, start, finish): # Trouve le chemin le plus rapide du point début au point fin en tenant compte des obstacles
+                self.start = start
+                self.finish = finish
+                self.path = [] # Initialise la liste contenant le meilleur chemin a prendre
+                self.nodes = [self.Node((self.start[0] - self.precision / 2, self.start[1] - self.precision / 2), self.precision, None, 1, self.start, finish)] # Initialise la liste de tout les nodes avec un node centré sur le point de départ
+                closest = None
+
+                while not [x for x in self.nodes if x.rect.colliderect(pygame.Rect(self.finish[0] - self.precision / 2, self.finish[1] - self.precision / 2, self.precision, self.precision))] and not len(self.nodes) > self.maxRadius / 6: # Tant qu'un node n'est pas en collision avec le rectangle centré sur le point de fin et qu'aucun node n'excède le radius maximale précisé, on continue à chercher
+                        closest = self.__closestNode(False) # On cherche le node le plus proche
+                        self.__addNeighbourNodes(closest) # On ajoute les nodes voisin au node le plus proche
+                if len(self.nodes) > self.maxRadius / 6: # Si un node se trouve en dehors du radius maximale
+                        current_node = self.__closestNode(True) # On retrace le chemin le plus court à l'envers (en incluant les nodes déjà vérifié) en partant du node le plus proche du point de fin 
+                else:
+                        current_node = self.__closestNode(False) # On retrace le chemin le plus court à l'envers en partant du node le plus proche du point de fin 
+                while current_node != self.nodes[0]: # Tant que l'on a pas atteint le node de départ
+                        self.path.append(current_node) # On ajoute le node parent au dernier
+                        current_node = current_node.parent
+                return self.path.reverse() # On retoune la liste du chemin le plus court après l'avoir inversé
+
+        class Node: # Classe définissant un node
+                def __init__(self, coords, precision, parent, state, startPoint, endPoint):
+                        self.rect = pygame.Rect(coords, (precision, precision)) # Rectangle définissant le node
+                        self.parent = parent # Node parent
+                        self.state = state # Etat du node. 1: à analyser        2: déjà analysé
+                        self.startLength = math.sqrt(pow(startPoint[0] - self.rect.centerx, 2) + pow(startPoint[1] - self.rect.centery, 2)) # Distance du node au point de départ
+                        self.endLength = math.sqrt(pow(endPoint[0] - self.rect.centerx, 2) + pow(endPoint[1] - self.rect.centery, 2)) # Distance du node au point d'arrivée
+                        self.totalLength = self.startLength + self.endLength # Distance totale du node (distance au départ + distance à l'arrivée)
+
+
+def loadMapHitboxes(mapName): # Reconstruit les hitboxes d'une map comme le fait ut.Map, sans avoir besoin d'une fenêtre
+        size = pygame.image.load("Resources/Maps/Sprites/" + mapName + ".png").get_size()
+        obstacleHitboxes = {}
+        with open("Resources/Obstacles/Data.txt") as obstaclesFile:
+                for line in obstaclesFile.readlines():
+                        if line.strip():
+                                data = line.split(',')
+                                obstacleHitboxes[data[0]] = pygame.Rect(int(data[1]), int(data[2]), int(data[3]), int(data[4]))
+        hitboxes = []
+        with open("Resources/Maps/Hitboxes/" + mapName + ".txt") as hitboxFile:
+                for line in hitboxFile.readlines():
+                        if line.strip():
+                                data = line.split(',')
+                                hitboxes.append(ut.Hitbox((int(data[0]), int(data[1])), (int(data[2]), int(data[3]))))
+        hitboxes.append(ut.Hitbox((0, -1000), (size[0], 1000)))
+        hitboxes.append(ut.Hitbox((0, size[1]), (size[0], 1000)))
+        hitboxes.append(ut.Hitbox((-1000, -1000), (1000, size[1] + 2000)))
+        hitboxes.append(ut.Hitbox((size[0], -1000), (1000, size[1] + 2000)))
+        with open("Resources/Maps/Obstacles/" + mapName + ".txt") as obstaclesFile:
+                for line in obstaclesFile.readlines():
+                        if line.strip():
+                                data = line.strip().split(',')
+                                if data[0] in obstacleHitboxes:
+                                        rect = obstacleHitboxes[data[0]]
+                                        hitboxes.append(ut.Hitbox((rect.left + int(data[1]), rect.top + int(data[2])), rect.size))
+        return size, hitboxes
+
+def randomQueries(size, hitboxes, count, radius, seed): # Tire des couples départ/arrivée libres, séparés au plus par le radius de visibilité
+        rng = random.Random(seed)
+        queries = []
+        while len(queries) < count:
+                start = (rng.randint(0, size[0]), rng.randint(0, size[1]))
+                angle = rng.uniform(0, 2 * math.pi)
+                distance = rng.uniform(radius / 4, radius)
+                finish = (round(start[0] + distance * math.cos(angle)), round(start[1] + distance * math.sin(angle)))
+                if not any(x.rect.collidepoint(start) or x.rect.collidepoint(finish) for x in hitboxes):
+                        queries.append((start, finish))
+        return queries
+
+def timeQueries(pathFinder, queries): # Retourne la durée de chaque recherche en millisecondes et le nombre de recherches ayant échoué
+        durations = []
+        failures = 0
+        for start, finish in queries:
+                startTime = time.perf_counter()
+                try:
+                        pathFinder.findBest(start, finish)
+                except IndexError: # L'ancienne recherche plante lorsqu'il ne reste plus aucun node à analyser
+                        failures += 1
+                durations.append((time.perf_counter() - startTime) * 1000)
+        return durations, failures
+
+def timeHierarchical(pathFinder, queries): # Comme timeQueries, en parcourant tous les tronçons d'un trajet hiérarchique. Échec: le chemin n'arrive pas près de la destination
+        durations = []
+        failures = 0
+        for start, finish in queries:
+                startTime = time.perf_counter()
+                pathFinder.findBest(start, finish)
+                end = pathFinder.path[-1].rect.center if pathFinder.path else start
+                while pathFinder.route and pathFinder.path:
+                        pathFinder.findBest(end, pathFinder.route[0], pathFinder.route[1:])
+                        end = pathFinder.path[-1].rect.center if pathFinder.path else end
+                durations.append((time.perf_counter() - startTime) * 1000)
+                failures += math.dist(end, finish) > 1.5 * pathFinder.precision
+        return durations, failures
+
+def report(name, durations, failures = 0):
+        durations = sorted(durations)
+        print("{:<10} moyenne {:8.3f} ms   médiane {:8.3f} ms   p99 {:8.3f} ms   total {:9.1f} ms   échecs {}".format(name, statistics.mean(durations), statistics.median(durations), durations[int(len(durations) * 0.99) - 1], sum(durations), failures))
+
+def benchPathfinding(args):
+        size, hitboxes = loadMapHitboxes(args.map)
+        queries = randomQueries(size, hitboxes, args.queries, args.radius, args.seed)
+        print("Map {} ({}x{}), {} hitboxes, {} recherches, précision {} px, radius {} px".format(args.map, size[0], size[1], len(hitboxes), len(queries), args.precision, args.radius))
+        legacy, legacyFailures = timeQueries(LegacyPathFinder(hitboxes, args.precision, args.radius), queries)
+        startTime = time.perf_counter()
+        navGrid = ut.NavGrid(size, args.precision, hitboxes)
+        print("Grille de marche {}x{} calculée en {:.2f} ms".format(navGrid.width, navGrid.height, (time.perf_counter() - startTime) * 1000))
+        current, currentFailures = timeQueries(ut.PathFinder(navGrid, args.radius), queries)
+        startTime = time.perf_counter()
+        clusterGraph = ut.ClusterGraph(navGrid)
+        print("Graphe de clusters {}x{} calculé en {:.2f} ms".format(clusterGraph.columns, clusterGraph.rows, (time.perf_counter() - startTime) * 1000))
+        startTime = time.perf_counter()
+        clusterGraph.prepare(None) # Comme en jeu une fois le graphe complet: les recherches qui atteignent leur limite de nodes passent par le graphe
+        print("Arêtes des clusters calculées en {:.2f} ms".format((time.perf_counter() - startTime) * 1000))
+        flat, flatFailures = timeHierarchical(ut.PathFinder(navGrid, args.radius), queries)
+        hierarchical, hierarchicalFailures = timeHierarchical(ut.PathFinder(navGrid, args.radius, clusterGraph), queries)
+        report("ancien", legacy, legacyFailures)
+        report("A*", current, currentFailures)
+        print("Accélération: x{:.1f}".format(sum(legacy) / sum(current)))
+        report("A* arrivé", flat, flatFailures)
+        report("HPA*", hierarchical, hierarchicalFailures)
+
+def benchWorkers(args): # Débit de recherches de chemin selon le nombre de processus de recherche
+        size, hitboxes = loadMapHitboxes(args.map)
+        queries = randomQueries(size, hitboxes, args.queries, args.radius, args.seed)
+        navGrid = ut.NavGrid(size, args.precision, hitboxes)
+        print("Map {} ({}x{}), {} recherches, précision {} px, radius {} px, {} processeurs".format(args.map, size[0], size[1], len(queries), args.precision, args.radius, os.cpu_count()))
+        pathFinder = ut.PathFinder(navGrid, args.radius)
+        startTime = time.perf_counter()
+        expected = [[node.rect.topleft for node in pathFinder.findBest(start, finish)] for start, finish in queries]
+        reference = len(queries) / (time.perf_counter() - startTime)
+        print("{:<12} {:8.0f} recherches/s".format("dans le jeu", reference))
+        for processes in args.workers:
+                workers = ut.PathWorkerPool(processes)
+                for result in [workers.submit(navGrid, args.radius, start, finish) for start, finish in queries[:2 * processes]]: # Chaque processus ouvre la grille partagée avant la mesure
+                        result.get()
+                startTime = time.perf_counter()
+                results = [workers.submit(navGrid, args.radius, start, finish) for start, finish in queries]
+                paths = [x.get() for x in results]
+                throughput = len(queries) / (time.perf_counter() - startTime)
+                workers.close()
+                print("{:<12} {:8.0f} recherches/s   x{:.2f}   {} chemins différents".format("{} processus".format(processes), throughput, throughput / reference, sum(x != y for x, y in zip(paths, expected))))
+
+def walkPath(position, path, distance): # Position après avoir parcouru une distance le long d'un chemin de nodes
+        for node in path:
+                length = math.dist(position, node.rect.center)
+                if length > distance:
+                        return (round(position[0] + (node.rect.centerx - position[0]) * distance / length), round(position[1] + (node.rect.centery - position[1]) * distance / length))
+                position = node.rect.center
+                distance -= length
+        return position
+
+def octileDistance(cellA, cellB): # Distance entre deux cellules sans obstacles, avec les coûts de FlowField.neighbours
+        dx = abs(cellA[0] - cellB[0])
+        dy = abs(cellA[1] - cellB[1])
+        return 10 * max(dx, dy) + 4 * min(dx, dy)
+
+def shortestDistance(navGrid, source, target, passable): # Longueur exacte du plus court chemin entre deux cellules (Dijkstra guidé par la distance octile, qui ne surestime jamais). passable: cellules traversables même si elles ne sont pas praticables
+        distances = {source: 0}
+        openHeap = [(octileDistance(source, target), 0, source)]
+        while openHeap:
+                total, distance, cell = heapq.heappop(openHeap)
+                if cell == target:
+                        return distance
+                if distance > distances[cell]:
+                        continue
+                for offsetX, offsetY, cost in ut.FlowField.neighbours:
+                        nextCell = (cell[0] + offsetX, cell[1] + offsetY)
+                        if nextCell != target and nextCell not in passable and not navGrid.isWalkable(nextCell):
+                                continue
+                        if distance + cost < distances.get(nextCell, math.inf):
+                                distances[nextCell] = distance + cost
+                                heapq.heappush(openHeap, (distance + cost + octileDistance(nextCell, target), distance + cost, nextCell))
+        return math.inf
+
+def checkPlannerPath(navGrid, planner): # Vérifie le chemin d'un DStarLite: cellules voisines et traversables jusqu'au joueur, longueur comprise entre celle du plus court chemin et la distance calculée (égale si la recherche n'a pas atteint sa limite de nodes). Retourne (valide, longueur, plus courte longueur)
+        cells = [planner.start] + planner.path()
+        length = 0
+        for cellA, cellB in zip(cells, cells[1:]):
+                dx = abs(cellA[0] - cellB[0])
+                dy = abs(cellA[1] - cellB[1])
+                if max(dx, dy) != 1 or not (cellB in planner.roots or navGrid.isWalkable(cellB)):
+                        return False, 0, 0
+                length += 14 if dx and dy else 10
+        shortest = shortestDistance(navGrid, planner.goal, planner.start, planner.roots)
+        return cells[-1] == planner.goal and shortest <= length <= planner.g.get(planner.start, math.inf) - planner.roots[planner.goal][0], length, shortest
+
+def benchReplanning(args): # Poursuites simulées: le joueur suit des chemins A* vers des points au hasard et l'ennemis suit son chemin. Compare une nouvelle recherche A* à chaque pas à la réparation du chemin (DStarLite), et vérifie chaque chemin réparé
+        size, hitboxes = loadMapHitboxes(args.map)
+        navGrid = ut.NavGrid(size, args.precision, hitboxes)
+        chases = randomQueries(size, hitboxes, args.chases, args.radius, args.seed)
+        print("Map {} ({}x{}), {} poursuites de {} pas de {} à {} px, précision {} px, radius {} px".format(args.map, size[0], size[1], len(chases), args.steps, args.step, 3 * args.step, args.precision, args.radius))
+        rng = random.Random(args.seed)
+        counters = collections.Counter()
+        fresh = ut.PathFinder(navGrid, args.radius)
+        replanning = ut.PathFinder(navGrid, args.radius)
+        player = ut.PathFinder(navGrid, 10 * args.radius)
+        durations = {"A*": [], "D* Lite": []}
+        failures = {"A*": 0, "D* Lite": 0}
+        freshNodes = 0
+        invalid = 0 # Chemins réparés qui ne sont pas une suite de cellules voisines traversables, ou dont la longueur est fausse
+        ratios = [] # Longueur des chemins réparés divisée par celle du plus court chemin
+        for start, finish in chases:
+                replanning.planner = ut.DStarLite(navGrid, args.radius / 6, counters)
+                player.path = []
+                for step in range(args.steps):
+                        if navGrid.lineOfSight(start, finish): # Le jeu ne cherche pas de chemin quand le joueur est en vue
+                                start = walkPath(start, [ut.PathFinder.Node(navGrid.cellRect(navGrid.cellOf(finish)).topleft, args.precision, None, 2, 0, 0)], args.step)
+                        else:
+                                usesPlanner = not replanning.planner.abandoned # Sinon PathFinder cherche directement avec A*
+                                abandons = counters["abandons"]
+                                for name, pathFinder in (("A*", fresh), ("D* Lite", replanning)): # Les deux recherches reçoivent les mêmes positions
+                                        startTime = time.perf_counter()
+                                        pathFinder.findBest(start, finish)
+                                        durations[name].append((time.perf_counter() - startTime) * 1000)
+                                        end = pathFinder.path[-1].rect.center if pathFinder.path else start
+                                        failures[name] += math.dist(end, finish) > 1.5 * args.precision
+                                freshNodes += len(fresh.nodes)
+                                if usesPlanner and counters["abandons"] == abandons: # Le chemin vient du planificateur, qui n'a pas laissé la place à A* pendant la recherche
+                                        valid, length, shortest = checkPlannerPath(navGrid, replanning.planner)
+                                        invalid += not valid
+                                        if valid and shortest:
+                                                ratios.append(length / shortest)
+                                start = walkPath(start, replanning.path, args.step) # L'ennemis avance d'autant que le joueur
+                        attempts = 20 # Le joueur part vers un point libre au hasard. Il reste sur place si aucun n'est atteignable
+                        while not player.path and attempts:
+                                attempts -= 1
+                                angle = rng.uniform(0, 2 * math.pi)
+                                target = (round(finish[0] + args.radius * math.cos(angle)), round(finish[1] + args.radius * math.sin(angle)))
+                                if 0 <= target[0] < size[0] and 0 <= target[1] < size[1] and not any(x.rect.collidepoint(target) for x in hitboxes):
+                                        player.findBest(finish, target)
+                        distance = rng.uniform(args.step, 3 * args.step) # La recherche demandée peut attendre quelques ticks dans la file: le joueur avance plus que le temps de réaction
+                        while player.path and math.dist(finish, player.path[0].rect.center) <= distance: # Enlève les nodes dépassés
+                                distance -= math.dist(finish, player.path[0].rect.center)
+                                finish = player.path.pop(0).rect.center
+                        finish = walkPath(finish, player.path[:1], distance)
+        for name in durations:
+                report(name, durations[name], failures[name])
+        print("Durée totale A* / D* Lite: x{:.2f} (au dessus de 1, la réparation est plus rapide qu'une nouvelle recherche)".format(sum(durations["A*"]) / sum(durations["D* Lite"])))
+        print("A*: {:.1f} nodes créés par recherche".format(freshNodes / len(durations["A*"])))
+        print("D* Lite: {} réparations x {:.1f} nodes analysés, {} depuis zéro x {:.1f} nodes, {} abandons".format(counters["réparations"], counters["nodes réparations"] / max(1, counters["réparations"]), counters["recherches"], counters["nodes recherches"] / max(1, counters["recherches"]), counters["abandons"]))
+        print("D* Lite: {} chemins vérifiés, {} chemins invalides, longueur x{:.3f} du plus court chemin en moyenne, x{:.3f} au plus".format(len(ratios) + invalid, invalid, statistics.mean(ratios or [1]), max(ratios or [1])))
+
+defaultScript = [ # Le joueur tourne en carré en tirant devant lui (ticks, touches, tir, coordonnées écran de la souris)
+        (120, "d", True, (1160, 540)),
+        (120, "s", True, (960, 740)),
+        (120, "a", True, (760, 540)),
+        (120, "w", True, (960, 340))]
+
+def percentile(sortedValues, ratio):
+        return sortedValues[min(len(sortedValues) - 1, int(len(sortedValues) * ratio))]
+
+def benchLoad(args): # Fait tourner la simulation du jeu sans fenêtre avec un nombre fixe de zombies et des entrées scriptées
+        os.environ["SDL_VIDEODRIVER"] = "dummy" # Doit être défini avant jeu.setupScreen(), qui crée l'écran
+        os.environ["SDL_AUDIODRIVER"] = "dummy"
+        if args.tracemalloc:
+                tracemalloc.start()
+        import jeu
+
+        random.seed(args.seed)
+        jeu.setupScreen()
+        jeu.loadResources()
+        ut.profiler.reset(args.ticks) # Garde tous les ticks de la mesure
+        jeu.selectedMap = next(i for i, x in enumerate(jeu.maps) if x.name == args.map)
+        jeu.mapSetup()
+        jeu.map.pursuitMode = args.pursuit
+        jeu.map.replanning = not args.noReplanning
+        for enemy in jeu.map.enemies: # Les ennemis de la map ont été créés avant le choix du mode de recherche
+                enemy.pathFinder = jeu.map.newPathFinder(enemy)
+        jeu.map.pathScheduler.budget = args.pathBudget if args.pathBudget > 0 else None
+        if args.workers:
+                jeu.map.pathScheduler.workers = ut.PathWorkerPool(args.workers)
+        jeu.dirtyRendering = not args.fullRedraw
+        jeu.map.useChunks = not args.noChunks
+        ut.controls = ut.ScriptedControls.fromFile(args.script) if args.script else ut.ScriptedControls(defaultScript)
+        if args.weapon:
+                jeu.char.items.append(ut.prototypes.spawn(args.weapon))
+                jeu.inventoryBar.selectionIndex = len(jeu.char.items) - 1
+                jeu.char.ammoObject.value = 10 ** 9
+
+        deaths = [0]
+        def respawn(): # Remplace le menu de fin: le joueur réapparaît pour que la mesure continue
+                deaths[0] += 1
+                jeu.char.health = 100
+                jeu.char.rect.topleft = jeu.map.spawnCoords
+        jeu.menuFin = respawn
+        jeu.menuDepart = respawn
+
+        while len(jeu.map.enemies) < args.zombies: # Zombies placés aléatoirement autour du point d'apparition, hors des hitboxes
+                angle = random.uniform(0, 2 * math.pi)
+                distance = random.uniform(150, 900)
+                center = (round(jeu.map.spawnCoords[0] + distance * math.cos(angle)), round(jeu.map.spawnCoords[1] + distance * math.sin(angle)))
+                if jeu.map.rect.collidepoint(center) and not jeu.map.hitboxHash.collidePoint(center):
+                        jeu.spawnEnemy(center)
+        print("Map {}, {} zombies, {} ticks, mode {}, affichage {}".format(args.map, len(jeu.map.enemies), args.ticks, args.pursuit, "oui" if args.draw else "non"))
+
+        durations = []
+        startTime = time.perf_counter()
+        for tick in range(args.ticks):
+                tickStart = time.perf_counter()
+                if args.draw:
+                        jeu.draw() # Affiche dans la surface écran en mémoire, ce qui met aussi à jour la caméra
+                else:
+                        jeu.screenRect = pygame.Rect((0, 0), jeu.screenSize) # Caméra centrée sur le joueur, utilisée pour viser
+                        jeu.screenRect.center = jeu.char.rect.center
+                with ut.profiler.phase("react"):
+                        jeu.react()
+                durations.append((time.perf_counter() - tickStart) * 1000)
+                ut.profiler.endFrame()
+        total = time.perf_counter() - startTime
+
+        durations.sort()
+        print("{:.1f} ticks/s   moyenne {:.3f} ms   p50 {:.3f} ms   p95 {:.3f} ms   p99 {:.3f} ms   max {:.3f} ms".format(args.ticks / total, statistics.mean(durations), percentile(durations, 0.5), percentile(durations, 0.95), percentile(durations, 0.99), durations[-1]))
+        for line in ut.profiler.lines() + jeu.map.pathScheduler.lines(): # Détail par phase et file des recherches de chemin
+                print("  " + line)
+        if args.csv:
+                ut.profiler.dumpCSV(args.csv)
+        print("{} zombies restants, score {}, {} morts du joueur".format(len(jeu.map.enemies), jeu.char.score, deaths[0]))
+        if args.tracemalloc:
+                print("Mémoire Python maximale: {:.1f} Mo".format(tracemalloc.get_traced_memory()[1] / (1024 * 1024)))
+        try:
+                import resource
+                print("Mémoire maximale du processus: {:.1f} Mo".format(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)) # En Ko sous Linux
+        except ImportError: # Le module resource n'existe pas sous Windows
+                pass
+        print(ut.assets.report())
+        print(jeu.char.animations.report()) # Atlas d'animations du personnage joué
+        if jeu.map.pathScheduler.workers:
+                jeu.map.pathScheduler.workers.close()
+
+
+if __name__ == "__main__":
+        parser = argparse.ArgumentParser(description = "Mesures de performance du jeu")
+        subparsers = parser.add_subparsers(dest = "benchmark")
+        subparsers.required = True
+
+        pathfindingParser = subparsers.add_parser("pathfinding", help = "Compare le PathFinder actuel à l'ancienne recherche linéaire et à la recherche hiérarchique")
+        pathfindingParser.add_argument("--map", default = "Town")
+        pathfindingParser.add_argument("--queries", type = int, default = 200)
+        pathfindingParser.add_argument("--precision", type = int, default = 26) # Taille d'un zombie
+        pathfindingParser.add_argument("--radius", type = int, default = 300) # Radius de visibilité d'un zombie
+        pathfindingParser.add_argument("--seed", type = int, default = 0)
+        pathfindingParser.set_defaults(run = benchPathfinding)
+
+        workersParser = subparsers.add_parser("workers", help = "Mesure le débit de recherches de chemin selon le nombre de processus de recherche")
+        workersParser.add_argument("--map", default = "Town")
+        workersParser.add_argument("--queries", type = int, default = 1000)
+        workersParser.add_argument("--precision", type = int, default = 26)
+        workersParser.add_argument("--radius", type = int, default = 300)
+        workersParser.add_argument("--workers", type = int, nargs = "+", default = [1, 2, 4])
+        workersParser.add_argument("--seed", type = int, default = 0)
+        workersParser.set_defaults(run = benchWorkers)
+
+        replanningParser = subparsers.add_parser("replanning", help = "Compare la réparation des chemins (D* Lite) à une nouvelle recherche A* quand le joueur poursuivi bouge")
+        replanningParser.add_argument("--map", default = "Town")
+        replanningParser.add_argument("--chases", type = int, default = 50)
+        replanningParser.add_argument("--steps", type = int, default = 30) # Recherches par poursuite
+        replanningParser.add_argument("--step", type = int, default = 30) # Déplacement du joueur entre deux recherches, égal au temps de réaction d'un zombie
+        replanningParser.add_argument("--precision", type = int, default = 26)
+        replanningParser.add_argument("--radius", type = int, default = 300)
+        replanningParser.add_argument("--seed", type = int, default = 0)
+        replanningParser.set_defaults(run = benchReplanning)
+
+        loadParser = subparsers.add_parser("load", help = "Fait tourner le jeu sans fenêtre avec N zombies et des entrées scriptées")
+        loadParser.add_argument("--map", default = "Town")
+        loadParser.add_argument("--zombies", type = int, default = 100)
+        loadParser.add_argument("--ticks", type = int, default = 600)
+        loadParser.add_argument("--draw", action = "store_true") # Mesure aussi l'affichage, dans une surface en mémoire
+        loadParser.add_argument("--full-redraw", dest = "fullRedraw", action = "store_true") # Redessine tout l'écran à chaque image, sans zones modifiées
+        loadParser.add_argument("--no-chunks", dest = "noChunks", action = "store_true") # Redessine le fond et tous les obstacles à chaque image
+        loadParser.add_argument("--script", default = None) # Fichier d'entrées: une étape par ligne "ticks,touches,tir,x souris,y souris"
+        loadParser.add_argument("--weapon", default = "Minigun") # Arme donnée au joueur pour que le script puisse tirer
+        loadParser.add_argument("--pursuit", default = "auto", choices = ["auto", "pathfinding", "flowfield"])
+        loadParser.add_argument("--path-budget", dest = "pathBudget", type = float, default = 2) # Temps maximum en ms de recherche de chemin par tick, 0 pour ne pas limiter
+        loadParser.add_argument("--no-replanning", dest = "noReplanning", action = "store_true") # Chaque recherche de chemin repart de zéro au lieu de réparer la précédente (DStarLite)
+        loadParser.add_argument("--workers", type = int, default = 0) # Nombre de processus de recherche de chemin, 0 pour chercher dans le jeu
+        loadParser.add_argument("--tracemalloc", action = "store_true") # Mesure la mémoire Python maximale (ralentit la simulation)
+        loadParser.add_argument("--csv", default = None) # Fichier où écrire les temps de chaque phase pour chaque tick
+        loadParser.add_argument("--seed", type = int, default = 0)
+        loadParser.set_defaults(run = benchLoad)
+
+        args = parser.parse_args()
+        args.run(args)
@@ -0,0 +1,20 @@
+# Compile les maps de Resources/Maps (fichiers texte) en fichiers binaires dans Resources/Maps/Bundles
+# Le jeu recompile automatiquement une map dont les sources ont changé. Utilisation: python compileMaps.py [--force]
+import sys
+import time
+
+import utilities as ut
+
+
+if __name__ == "__main__":
+        force = "--force" in sys.argv # Recompile aussi les maps à jour
+        with open("Resources/Maps/Data.txt") as mapsFile:
+                names = [line.split(',')[0] for line in mapsFile.readlines() if line.strip()]
+        for name in names:
+                if force or ut.MapBundle.isStale(name):
+                        startTime = time.perf_counter()
+                        ut.MapBundle.compile(name)
+                        bundle = ut.MapBundle(name)
+                        print("{}: {} hitboxes, {} obstacles, {} items, {} ennemis, {} octets, compilée en {:.1f} ms".format(name, len(bundle.hitboxes), len(bundle.obstacles), len(bundle.items), len(bundle.enemies), len(bundle.data), (time.perf_counter() - startTime) * 1000))
+                else:
+                        print(name + ": à jour")
@@ -8,21 +8,43 @@ import utilities as ut
 import os
 import time
 import ctypes
-from ctypes import *
-import copy
-import math
-import random
 #endregion
 
 #region screen and pygame setup
-pg.init() # Initialise pg
-pg.event.set_allowed([QUIT, KEYUP, MOUSEBUTTONDOWN]) # Limite la détection de touches
-ctypes.windll.user32.SetProcessDPIAware() # Enlève le redimensionnement de l'image sous Windows (https://gamedev.stackexchange.com/a/105820)
-screenSize = (windll.user32.GetSystemMetrics(0),windll.user32.GetSystemMetrics(1)) # Récupère la résolution a utilisé ensuite
-screen = pg.display.set_mode(screenSize, DOUBLEBUF | FULLSCREEN | HWACCEL | HWSURFACE) # Crée la surface écran avec la résolution indiquée, en plein écran et avec une performance doublé
-screen.set_alpha(None) # Enlève la couche alpha de l'écran afin d'améliorer la performance du jeu
-alphaSurface = pg.Surface(screenSize, pg.SRCALPHA) # Crée une surface qui servira a dessiner des objets avec de la transparence au dessus de l'écran définit auparavant (https://stackoverflow.com/a/6350227)
-alphaSurface.fill((255,255,255,0)) # Rend la surface semi-transparente
+def setupScreen(): # Initialise pygame et crée l'écran. Appelé au lancement du jeu seulement: les processus de recherche de chemin réimportent ce module et ne doivent pas ouvrir de fenêtre
+      global screen
+      global screenSize
+      global alphaSurface
+      global headless
+      global coordsHealthRect
+      global sizeHealthRect
+      global hudRect
+      global inventoryBar
+      global fpsFont
+      global gameFont
+
+      pg.init() # Initialise pg
+      pg.event.set_allowed([QUIT, KEYUP, MOUSEBUTTONDOWN]) # Limite la détection de touches
+      headless = os.environ.get("SDL_VIDEODRIVER") == "dummy" # Sans fenêtre: l'affichage se fait dans une surface en mémoire (mesures de performance, serveurs sans écran)
+      if headless:
+            screenSize = (1920, 1080) # Résolution fixe pour que les mesures soient comparables
+            screen = pg.display.set_mode(screenSize)
+      else:
+            if hasattr(ctypes, "windll"):
+                  ctypes.windll.user32.SetProcessDPIAware() # Enlève le redimensionnement de l'image sous Windows (https://gamedev.stackexchange.com/a/105820)
+                  screenSize = (ctypes.windll.user32.GetSystemMetrics(0), ctypes.windll.user32.GetSystemMetrics(1)) # Récupère la résolution a utilisé ensuite
+            else:
+                  screenSize = (pg.display.Info().current_w, pg.display.Info().current_h) # Résolution de l'écran sur les autres systèmes
+            screen = pg.display.set_mode(screenSize, DOUBLEBUF | FULLSCREEN | HWACCEL | HWSURFACE) # Crée la surface écran avec la résolution indiquée, en plein écran et avec une performance doublé
+      screen.set_alpha(None) # Enlève la couche alpha de l'écran afin d'améliorer la performance du jeu
+      alphaSurface = pg.Surface(screenSize, pg.SRCALPHA) # Crée une surface qui servira a dessiner des objets avec de la transparence au dessus de l'écran définit auparavant (https://stackoverflow.com/a/6350227)
+      alphaSurface.fill((255,255,255,0)) # Rend la surface semi-transparente
+      coordsHealthRect=(screenSize[0]/4, 98 * screenSize[1] / 100)
+      sizeHealthRect=(screenSize[0]/2, 2 * screenSize[1] / 100) 
+      hudRect = pg.Rect(screenSize[0] / 4 - 50, 90 * screenSize[1] / 100 - 25, screenSize[0] / 2 + 100, 10 * screenSize[1] / 100 + 25) # Zone de la vie et de l'inventaire, textes compris
+      inventoryBar = ut.List((screenSize[0] / 4, 90 * screenSize[1] / 100), (screenSize[0] / 2,  8 * screenSize[1] / 100), None, screen, 0)
+      fpsFont = pg.font.SysFont("Roboto", 10, False, False) # La police utilisé pour afficher les FPS
+      gameFont = pg.font.SysFont("Roboto", 50, False, False) # La police utilisé pour afficher les textes du jeu
 #endregion
 
 #region variables
@@ -33,19 +55,35 @@ characters = []
 maps = []
 char = None
 map = None
-mapObjects = [] # Liste de tout les objets de la map
 widthSmaller = None # Booléen définissant si la largeur de la map est plus petite que celle de l'écran
 heightSmaller = None # Booléen définissant si la hauteur de la map est plus petite que celle de l'écran
-coordsHealthRect=(screenSize[0]/4, 98 * screenSize[1] / 100)
-sizeHealthRect=(screenSize[0]/2, 2 * screenSize[1] / 100) 
-inventoryBar = ut.List((screenSize[0] / 4, 90 * screenSize[1] / 100), (screenSize[0] / 2,  8 * screenSize[1] / 100), None, screen, 0)
+screen = None # Surface écran, créée par setupScreen()
+screenSize = None # Résolution de l'écran
+alphaSurface = None # Surface transparente dessinée au dessus de l'écran
+headless = False # Vrai sans fenêtre (SDL_VIDEODRIVER=dummy)
+coordsHealthRect = None # Position de la barre de vie
+sizeHealthRect = None # Taille de la barre de vie
+hudRect = None # Zone de la vie et de l'inventaire, textes compris
+inventoryBar = None # ut.List de l'inventaire
 drawHitboxes = False # Booléen définissant si l'on voit les hitboxes ou non
 drawPaths = False # Booléen définissant si l'on voit les chemins ou non
 drawFPS = False # Booléen définissant si l'on voit les FPS ou non
 placeObjects = False # Booléen activant le mode construction
-lastFPS = 0.0
-fpsFont = pg.font.SysFont("Roboto", 10, False, False) # La police utilisé pour afficher les FPS
-gameFont = pg.font.SysFont("Roboto", 50, False, False) # La police utilisé pour afficher les FPS
+lastFPS = 0.0 # Nombre d'images affichées par seconde
+tickRate = 60 # Nombre de ticks de simulation par seconde, indépendant du nombre d'images affichées
+maxFPS = 120 # Nombre maximum d'images affichées par seconde
+maxTicksPerFrame = 5 # Nombre maximum de ticks rattrapés entre deux images, pour qu'une image lente ne bloque pas le jeu
+dirtyRendering = True # Ne redessine que les zones qui ont changé lorsque la caméra ne bouge pas
+pathWorkers = 0 # Nombre de processus de recherche de chemin des ennemis. 0: les recherches sont faites dans le jeu
+workerPool = None # ut.PathWorkerPool partagé par les maps lorsque pathWorkers est positif
+maxChunkAreas = 64 # Au delà de ce nombre de zones d'objets qui bougent, les morceaux pré-dessinés ne sont pas utilisés
+lastScreenRect = None # Rectangle écran de la dernière image entièrement dessinée ou mise à jour. None force un affichage complet
+lastStaticKey = None # Objets qui ne bougent pas lors de la dernière image
+lastDynamicRects = [] # Rectangles écran des objets qui bougent lors de la dernière image
+lastHudRects = [] # Rectangles écran de l'interface lors de la dernière image
+previousPositions = {} # Position de chaque objet qui bouge avant le dernier tick, pour interpoler l'affichage entre deux ticks
+fpsFont = None # La police utilisé pour afficher les FPS
+gameFont = None # La police utilisé pour afficher les textes du jeu
 gamemode = "Classic" # Mode de jeu. Classic: ramasser le plus possible de drapeau avant de mourrir. Against the Clock: Récupérer le plus de drapeau possible dans un temps imparti
 gm2TimeLeft = 60 # Secondes restante au joueur pour atteindre le prochain drapeau
 gm2StartTime = None # Le temps de la dernière mise à jour
@@ -83,17 +121,13 @@ def loadObstacles(): # Charge les obstacles dans une liste
                         tempObstacles.append(ut.Obstacle(data[0], ut.Hitbox((int(data[1]), int(data[2])), (int(data[3]), int(data[4])))))
       return tempObstacles
 
-def loadMaps(): # Charge les maps dans une liste
-      global items
-      global obstacles
-      global enemies
-
+def loadMaps(): # Déclare les maps dans une liste. Elles ne sont chargées que lorsqu'elles sont jouées ou préchargées
       tempMaps = [] # Liste temporaire des maps
       with open("Resources/Maps/Data.txt") as mapsFile:
             for line in mapsFile.readlines():
                   if line.strip() and not line.strip().isspace():
                         data = line.split(',')
-                        tempMaps.append(ut.Map(data[0], screen, items, obstacles, (int(data[1]), int(data[2])), enemies))
+                        tempMaps.append(ut.MapDescriptor(data[0], (int(data[1]), int(data[2]))))
       return tempMaps
 
 def loadCharacters(): # Charge les différents charactères dans une liste
@@ -125,6 +159,7 @@ def loadResources():
       items = loadItems()
       obstacles = loadObstacles()
       enemies = loadEnemies()
+      ut.prototypes.register(items + obstacles + enemies) # Modèles à partir desquels les instances sont créées
       maps = loadMaps()
       characters = loadCharacters()
 
@@ -135,9 +170,17 @@ def mapSetup():
       global characters
       global gm2StartTime
       global gm2TimeLeft
-
-      loadMaps()
-      map = maps[selectedMap] # Map choisie par l'utilisateur
+      global widthSmaller
+      global heightSmaller
+      global lastScreenRect
+
+      for index, descriptor in enumerate(maps): # Seule la map choisie reste en mémoire
+            if index != selectedMap:
+                  descriptor.evict()
+      if maps[selectedMap].map: # La map a déjà été jouée: elle retrouve ses ennemis et ses items d'origine
+            maps[selectedMap].map.reset(enemies, items, False)
+      map = maps[selectedMap].materialize(screen, items, obstacles, enemies) # Map choisie par l'utilisateur
+      map.pathScheduler.workers = workerPool
       char = characters[selectedChar] # Perso choisi par l'utilisateur
       map.players = [char]
       char.map = map
@@ -147,7 +190,7 @@ def mapSetup():
       gm2StartTime = time.time()
       for player in map.players:
             player.rect.topleft = map.spawnCoords
-      updateMapOBJs() # Récupère tous les objets de la map active et les tris
+      lastScreenRect = None
       if map.size[0] < screenSize[0]:
             widthSmaller = True # La largeur de la map est plus petite que celle de l'écran
       else:
@@ -159,20 +202,32 @@ def mapSetup():
 
 
 screenRect = None
-def draw(noFlip = False): # Retrace tout les éléments du jeu. Ordre important
+def interpolatedRects(alpha): # Positions d'affichage des objets qui bougent, entre leur position avant et après le dernier tick
+      renderRects = {}
+      for obj in [char] + map.enemies:
+            previous = previousPositions.get(id(obj))
+            if previous and previous != obj.rect.topleft and abs(previous[0] - obj.rect.x) + abs(previous[1] - obj.rect.y) < 64: # Les téléportations (réapparition, apparition à l'objectif) ne sont pas interpolées
+                  renderRects[id(obj)] = obj.rect.move(round((previous[0] - obj.rect.x) * (1 - alpha)), round((previous[1] - obj.rect.y) * (1 - alpha)))
+      return renderRects
+
+def draw(noFlip = False, alpha = 1.0): # Retrace tout les éléments du jeu. Ordre important. alpha: avancement entre le dernier tick et le prochain, de 0 à 1
       global screenRect
-      global mapObjects
+      global lastScreenRect
+      global lastStaticKey
+      global lastDynamicRects
+      global lastHudRects
+
+      renderRects = interpolatedRects(alpha)
+      charRect = renderRects.get(id(char), char.rect) # Position d'affichage du joueur, suivie par la caméra
 
       if widthSmaller: # Lorsque la largeur de la map est plus petite que la largeur de l'écran
             chosenX = map.size[0] / 2 - screenSize[0] / 2 # L'emplacement X du rectangle écran définit par rapport à la map pour que celle-ci soit centré
-            pg.draw.rect(screen, pg.Color(0, 0, 0), pg.Rect((0, 0), screenSize)) # Déssine le fond de l'écran en noir pour que les anciens éléments ne réapparaisse pas
       else:
-            chosenX = char.rect.left - screenSize[0] / 2 # L'emplacement X du rectangle écran définit par rapport au charactère pour que celui-ci soit centré
+            chosenX = charRect.left - screenSize[0] / 2 # L'emplacement X du rectangle écran définit par rapport au charactère pour que celui-ci soit centré
       if heightSmaller: # Lorsque l'hauteur de la map est plus petite que l'hauteur de l'écran
             chosenY = map.size[1] / 2 - screenSize[1] / 2 # L'emplacement X du rectangle écran définit par rapport à la map pour que celle-ci soit centré
-            pg.draw.rect(screen, pg.Color(0, 0, 0), pg.Rect((0, 0), screenSize)) # Déssine le fond de l'écran en noir pour que les anciens éléments ne réapparaisse pas
       else:
-            chosenY = char.rect.top - screenSize[1] / 2 # L'emplacement X du rectangle écran définit par rapport au charactère pour que celui-ci soit centré
+            chosenY = charRect.top - screenSize[1] / 2 # L'emplacement X du rectangle écran définit par rapport au charactère pour que celui-ci soit centré
 
       screenRect = pg.Rect((chosenX, chosenY), screenSize) # Détermine la taille et les coordonnées de l'écran selon la map choisie et le charactère
 
@@ -187,47 +242,134 @@ def draw(noFlip = False): # Retrace tout les éléments du jeu. Ordre important
             elif screenRect.bottom > map.size[1]: # Evite que l'écran dépasse le bord gauche de la map
                   screenRect.y = map.size[1] - screenRect.height
 
-      mapObjects.sort(key = lambda x: x.rect.bottom) # Trie les objets par rapport à leur position la plus basse: du plus petit au plus grand
-      map.draw(screenRect, widthSmaller, heightSmaller) # Dessine la map
-      map.drawObjects([obj for obj in mapObjects if obj.rect.bottom <= char.rect.bottom], screenRect) # Dessine les objets devont se trouver "en dessous" du joueur
-      char.draw(screenRect, walkDirection + action +str(walkIncrease)) # dessine le perso à ses nouvelles coordonnées
-      char.drawBullets(screenRect, screen) # Dessine les balles
-      map.drawObjects([obj for obj in mapObjects if char.rect.bottom < obj.rect.bottom], screenRect) # Dessine les obstacles devont se trouver "au dessus" du joueur
+      staticKey = (tuple(id(x) for x in map.items), len(map.obstacles), map.objectifObject.rect.topleft) # Change lorsqu'un objet qui ne bouge pas apparaît, disparaît ou se déplace
+      dynamicRects = dynamicScreenRects(renderRects, charRect)
+      partial = dirtyRendering and not noFlip and screenRect == lastScreenRect and staticKey == lastStaticKey and not (drawHitboxes or drawPaths or placeObjects) # La caméra n'a pas bougé: seules les zones des objets qui bougent et de l'interface sont redessinées
+      if partial:
+            dirtyRects = mergeRects(lastDynamicRects + dynamicRects + lastHudRects) # Anciennes et nouvelles positions
+            if sum(x.w * x.h for x in dirtyRects) > screenSize[0] * screenSize[1] / 2: # Redessiner tout l'écran est alors plus rapide
+                  partial = False
+      lastScreenRect = screenRect.copy()
+      lastStaticKey = staticKey
+      lastDynamicRects = dynamicRects
+
+      map.updateRenderList() # Trie les objets qui bougent par rapport à leur position la plus basse, les objets fixes sont déjà triés
+      if partial:
+            drawAreas(dirtyRects, renderRects, charRect)
+      else:
+            movingAreas = None
+            if map.useChunks:
+                  movingAreas = mergeRects(dynamicRects + [obj.rect.move(-screenRect.x, -screenRect.y) for obj in map.items + [map.objectifObject] if screenRect.colliderect(obj.rect)]) # Zones des objets qui bougent ou qui ne sont pas pré-dessinés
+                  if len(movingAreas) > maxChunkAreas: # Trop de zones à redessiner: tout redessiner est alors plus rapide
+                        movingAreas = None
+            if movingAreas is not None:
+                  with ut.profiler.phase("carte"):
+                        if widthSmaller or heightSmaller:
+                              screen.fill(pg.Color(0, 0, 0)) # Déssine le fond de l'écran en noir pour que les anciens éléments ne réapparaisse pas
+                        map.drawChunks(screen, screenRect, widthSmaller, heightSmaller) # Le fond et les obstacles fixes sont déjà dessinés dans les morceaux
+                  drawAreas(movingAreas, renderRects, charRect) # Redessine dans l'ordre les zones des objets qui bougent, pour que les obstacles puissent passer devant eux
+            else:
+                  drawWorld(map.renderList.below(char.rect.bottom), map.renderList.above(char.rect.bottom), renderRects, charRect)
+            with ut.profiler.phase("debug"):
+                  drawDebug()
+
+      with ut.profiler.phase("hud"):
+            hudRects = drawHud()
 
+      if not noFlip:
+            with ut.profiler.phase("affichage"):
+                  if partial:
+                        pg.display.update(dirtyRects + hudRects) # Rafraichi seulement les zones redessinées
+                  else:
+                        pg.display.flip() # Rafraichi le jeu
+      if noFlip or drawHitboxes or drawPaths or placeObjects:
+            lastScreenRect = None # Un menu ou une couche de debug recouvre le jeu: la prochaine image doit tout redessiner
+      lastHudRects = hudRects
+
+def dynamicScreenRects(renderRects, charRect): # Rectangles écran du joueur, des ennemis visibles et des balles
+      rects = [char.animations.get(walkDirection + action + str(walkIncrease)).get_rect(topleft = (charRect.x - screenRect.x, charRect.y - screenRect.y))] # Taille de l'image qui va être affichée
+      for enemy in map.enemies:
+            rect = renderRects.get(id(enemy), enemy.rect)
+            if screenRect.colliderect(rect):
+                  rects.append(rect.move(-screenRect.x, -screenRect.y))
+      rects += char.bullets.screenRects(screenRect)
+      return rects
+
+def mergeRects(rects): # Fusionne les rectangles qui se touchent, pour redessiner moins de zones
+      merged = []
+      for rect in rects:
+            index = rect.collidelist(merged)
+            while index != -1:
+                  rect = rect.union(merged.pop(index))
+                  index = rect.collidelist(merged)
+            merged.append(rect)
+      return merged
+
+def drawAreas(areas, renderRects, charRect): # Redessine seulement les zones écran indiquées, avec les objets qui les touchent
+      with ut.profiler.phase("zones"):
+            objects = list(map.renderList.ordered())
+            objectRects = [renderRects.get(id(obj), obj.rect) for obj in objects]
+            for area in areas:
+                  screen.set_clip(area) # Les dessins sont limités à la zone
+                  areaObjects = [objects[i] for i in area.move(screenRect.topleft).collidelistall(objectRects)] # Dans l'ordre d'affichage
+                  split = next((i for i, obj in enumerate(areaObjects) if char.rect.bottom < obj.rect.bottom), len(areaObjects))
+                  drawWorld(areaObjects[:split], areaObjects[split:], renderRects, charRect)
+            screen.set_clip(None)
+
+def drawWorld(below, above, renderRects, charRect): # Dessine la map puis les objets triés se trouvant "en dessous" du joueur, le joueur, les balles et les objets "au dessus"
+      with ut.profiler.phase("carte"):
+            if widthSmaller or heightSmaller:
+                  screen.fill(pg.Color(0, 0, 0)) # Déssine le fond de l'écran en noir pour que les anciens éléments ne réapparaisse pas
+            map.draw(screenRect, widthSmaller, heightSmaller) # Dessine la map
+      with ut.profiler.phase("objets"):
+            map.drawObjects(below, screenRect, renderRects = renderRects) # Dessine les objets devont se trouver "en dessous" du joueur
+            char.draw(screenRect, walkDirection + action +str(walkIncrease), charRect) # dessine le perso à ses nouvelles coordonnées
+            char.drawBullets(screenRect, screen) # Dessine les balles
+            map.drawObjects(above, screenRect, renderRects = renderRects) # Dessine les obstacles devont se trouver "au dessus" du joueur
+
+def drawDebug(): # Dessine les hitboxes, les chemins et l'objet à placer
       if drawHitboxes or drawPaths or placeObjects:
             alphaSurface.fill((255,255,255,0)) # Enlève ce qu'il se trouvait sur la surface alpha auparavant
-      if drawHitboxes:
+      if drawHitboxes and map.useChunks:
+            map.drawChunks(screen, screenRect, widthSmaller, heightSmaller, "hitboxes") # Hitboxes pré-dessinées par morceaux
+      elif drawHitboxes:
             map.drawObjects(map.hitboxes, screenRect, True, alphaSurface) # Déssine les hitbox de la map si ils ne sont pas déjà affichés
       if drawPaths:
             map.drawObjects([item for sublist in [x.nodes for x in [x.pathFinder for x in map.enemies]] for item in sublist], screenRect, True, alphaSurface) # Récupère tous les nodes de tous les pathFinder d'ennemis et les dessine en transparence (https://stackoverflow.com/a/952952)
             for enemy in map.enemies:
                   enemy.pathFinder.drawPath(alphaSurface, screenRect.topleft) # Affiche les chemins de tous les ennemis de la map
-      if drawFPS:
-            fpsSurface = fpsFont.render(str(lastFPS), True, pg.Color("black"), pg.Color("white")) # Crée le texte pour afficher les FPS
-            screen.blit(fpsSurface, (screenSize[0] - fpsSurface.get_size()[0], 0)) # Ajoute se texte au coin en haut à droite de l'écran
       if placeObjects:
             if type(map.objectToPlace[0]) is pg.Rect:
                   pg.draw.rect(alphaSurface, pg.Color(191, 63, 63, 127), map.objectToPlace[0].move(-screenRect[0], -screenRect[1]))
             elif map.objectToPlace[0] == "delete":
-                  screen.blit(pg.image.load("Resources/Menus/Supprimer.png").convert_alpha(), (map.objectToPlace[1][0] - screenRect[0], map.objectToPlace[1][1] - screenRect[1]))
+                  screen.blit(ut.assets.load("Resources/Menus/Supprimer.png"), (map.objectToPlace[1][0] - screenRect[0], map.objectToPlace[1][1] - screenRect[1]))
             else:
                   screen.blit(map.objectToPlace[0].sprite, (map.objectToPlace[1][0] - screenRect[0], map.objectToPlace[1][1] - screenRect[1]))
       if drawHitboxes or drawPaths or placeObjects:
             screen.blit(alphaSurface, (0, 0)) # Dessine la couche semi-transparente qui contient les hitbox et les chemins
 
+def drawHud(): # Dessine la vie, l'inventaire, le score et les FPS. Retourne les rectangles écran modifiés
+      rects = [hudRect]
       pg.draw.rect(screen,pg.Color("grey"),pg.Rect(coordsHealthRect,sizeHealthRect)) 
       pg.draw.rect(screen,pg.Color(255,0,0),pg.Rect(coordsHealthRect,(sizeHealthRect[0]*char.health/100, sizeHealthRect[1]))) 
       inventoryBar.setItems(char.items)
       inventoryBar.draw()
 
       scoreSurface = gameFont.render("Score : " + str(char.score), True, pg.Color("black"), pg.Color("white")) # Crée le texte pour afficher le temp restant
-      screen.blit(scoreSurface, (screenSize[0] / 2 - scoreSurface.get_size()[0] / 2, 0)) # Ajoute ce texte au millieu en haut de l'écran
+      rects.append(screen.blit(scoreSurface, (screenSize[0] / 2 - scoreSurface.get_size()[0] / 2, 0))) # Ajoute ce texte au millieu en haut de l'écran
 
       if gamemode == "Against the Clock" and gm2StartTime:
             timeSurface = gameFont.render(str(round(gm2TimeLeft - (time.time() - gm2StartTime))), True, pg.Color("black"), pg.Color("white")) # Crée le texte pour afficher le temp restant
-            screen.blit(timeSurface, (screenSize[0] / 2 - timeSurface.get_size()[0] / 2, scoreSurface.get_size()[1])) # Ajoute ce texte au millieu en haut de l'écran
-      if not noFlip:
-            pg.display.flip() # Rafraichi le jeu
+            rects.append(screen.blit(timeSurface, (screenSize[0] / 2 - timeSurface.get_size()[0] / 2, scoreSurface.get_size()[1]))) # Ajoute ce texte au millieu en haut de l'écran
+      if drawFPS:
+            fpsSurface = fpsFont.render(str(lastFPS), True, pg.Color("black"), pg.Color("white")) # Crée le texte pour afficher les FPS
+            rects.append(screen.blit(fpsSurface, (screenSize[0] - fpsSurface.get_size()[0], 0))) # Ajoute se texte au coin en haut à droite de l'écran
+            lineY = fpsSurface.get_size()[1]
+            for line in ut.profiler.lines() + map.pathScheduler.lines(): # Temps passé dans chaque phase de l'image et file des recherches de chemin, sous les FPS
+                  lineSurface = fpsFont.render(line, True, pg.Color("black"), pg.Color("white"))
+                  rects.append(screen.blit(lineSurface, (screenSize[0] - lineSurface.get_size()[0], lineY)))
+                  lineY += lineSurface.get_size()[1]
+      return rects
 
 def react():
       global f1Pressed
@@ -240,20 +382,22 @@ def react():
       global currentSteps
       global action
 
-      char.mouvBullets()
+      map.updateDynamicHashes() # Réindexe les objets qui bougent avant de tester les collisions
+      with ut.profiler.phase("balles"):
+            char.mouvBullets(tickRate)
 
-      key=pg.key.get_pressed() # liste les appui sur le clavier
+      key=ut.controls.keys() # liste les appui sur le clavier
       if key[K_w]: # Appui sur la flèche du haut
-            char.mouv("haut", screenRect, 0, lastFPS)
+            char.mouv("haut", screenRect, 0, tickRate)
             walkDirection = "Back"
       if key[K_s]: # Appui sur la flèche du bas
-            char.mouv("bas", screenRect, 0, lastFPS)
+            char.mouv("bas", screenRect, 0, tickRate)
             walkDirection = "Front"
       if key[K_a]: # Appui sur la flèche de gauche
-            char.mouv("gauche", screenRect, 0, lastFPS)
+            char.mouv("gauche", screenRect, 0, tickRate)
             walkDirection = "Left"
       if key[K_d]: # Appui sur la flèche de droite
-            char.mouv("droite", screenRect, 0, lastFPS)
+            char.mouv("droite", screenRect, 0, tickRate)
             walkDirection = "Right"
       if key[K_e]: #Ramasser un item
             char.mouv("ramasser", screenRect)
@@ -274,7 +418,7 @@ def react():
             walkIncrease = 1
             
       if gunCooldown <= 0:
-            if char.items[selectedItem].type == "WEAPON" and pg.mouse.get_pressed()[0] == 1:
+            if char.items[selectedItem].type == "WEAPON" and ut.controls.mouseButtons()[0] == 1:
                   if char.items[selectedItem].characteristics.isAutomatic:
                         char.mouv('tirer', screenRect, selectedItem)
                         gunCooldown = char.items[selectedItem].characteristics.cooldown
@@ -282,9 +426,10 @@ def react():
             gunCooldown -= 1
 
       if not placeObjects:
-            map.moveEnemies(lastFPS)
+            with ut.profiler.phase("ennemis"):
+                  map.moveEnemies(tickRate)
 
-      for enemy in char.rect.collidelistall([x.rect for x in map.enemies]):
+      for enemy in map.enemyHash.queryRect(char.rect):
             char.health-=1
             if char.health < 0:
                   char.health = 0
@@ -304,24 +449,24 @@ def react():
       if char.rect.colliderect(map.objectifObject.rect):
             tempItem = None
             if char.score == 0:
-                  tempItem = copy.deepcopy(next(x for x in items if x.name == "Pistol"))
+                  tempItem = ut.prototypes.spawn("Pistol")
             elif char.score == 5:
-                  tempItem = copy.deepcopy(next(x for x in items if x.name == "Shotgun")) 
+                  tempItem = ut.prototypes.spawn("Shotgun") 
             elif char.score == 10:
-                  tempItem = copy.deepcopy(next(x for x in items if x.name == "Assault Rifle")) 
+                  tempItem = ut.prototypes.spawn("Assault Rifle") 
             elif char.score == 15:
-                  tempItem = copy.deepcopy(next(x for x in items if x.name == "Minigun"))  
+                  tempItem = ut.prototypes.spawn("Minigun")  
             elif char.score == 20:
                   print("gagné!")     
                   menuDepart()        
             elif str(char.score)[-1:] == "1" or str(char.score)[-1:] == "3" or str(char.score)[-1:] == "7" or str(char.score)[-1:] == "9":
-                  tempItem = copy.deepcopy(next(x for x in items if x.name == "Health Pack"))
+                  tempItem = ut.prototypes.spawn("Health Pack")
             elif len(str(char.score)) == 1 and (str(char.score)[-1:] == "2" or str(char.score)[-1:] == "4" or str(char.score)[-1:] == "6" or str(char.score)[-1:] == "8"):
-                  tempItem = copy.deepcopy(next(x for x in items if x.name == "Ammo"))
+                  tempItem = ut.prototypes.spawn("Ammo")
             elif len(str(char.score)) == 2 and (str(char.score)[-1:] == "2" or str(char.score)[-1:] == "4" or str(char.score)[-1:] == "6" or str(char.score)[-1:] == "8"):
-                  tempItem = copy.deepcopy(next(x for x in items if x.name == "Big Ammo"))
+                  tempItem = ut.prototypes.spawn("Big Ammo")
             elif str(char.score)[-1:] == "5":
-                  tempItem = copy.deepcopy(next(x for x in items if x.name == "Claymore"))
+                  tempItem = ut.prototypes.spawn("Claymore")
             if tempItem:
                   tempItem.rect.topleft = map.objectifObject.rect.topleft
             map.items.append(tempItem)
@@ -335,11 +480,7 @@ def react():
             char.score += 1
 
             for n in range(char.score):
-                  tempEnemy = copy.deepcopy(enemies[0])
-                  tempEnemy.rect.center = map.objectifObject.rect.center
-                  tempEnemy.map = map
-                  tempEnemy.pathFinder = ut.PathFinder(map.hitboxes, max(tempEnemy.rect.width, tempEnemy.rect.height), tempEnemy.viewingRadius)
-                  map.enemies.append(tempEnemy)
+                  spawnEnemy(map.objectifObject.rect.center)
 
       if placeObjects:
             map.objectPlacer("update", screenRect) # Met à jour l'emplacement de l'objet "fantôme" en fonction des coordonnées de la souris
@@ -350,26 +491,24 @@ def react():
             if enemy.health <= 0:
                   map.enemies.remove(enemy)
 
-      for explosive in [x for x in map.items if x.type == "EXPLOSIVE" and x.rect.collidelist(map.enemies) != -1 and x.pickedUpOnce == True]:
-            for obj in map.enemies + [char]:
-                  if math.sqrt(math.pow(obj.rect.x - explosive.rect.x, 2) + math.pow(obj.rect.y - explosive.rect.y, 2)) <= explosive.value * 3:
-                        obj.health -= explosive.value
-                        map.items.remove(explosive)
+      with ut.profiler.phase("explosions"):
+            map.areaEffects.update()
 
-      updateMapOBJs()
+      ut.controls.advance()
 
-def updateMapOBJs(): # Récupère tous les objets de la map active et les tris
-      global mapObjects
-      mapObjects = map.items + map.obstacles + map.enemies # Liste de tout les objets de la map
+def spawnEnemy(center): # Ajoute un nouvel ennemi sur la map, centré sur les coordonnées indiquées
+      tempEnemy = enemies[0].spawn((0, 0), map)
+      tempEnemy.rect.center = center
+      map.enemies.append(tempEnemy)
+      return tempEnemy
 
 
 def menuDepart():
       global notDone
-      fondMenu=pg.image.load("Resources/Menus/BackgroundMenu.png")
-      fondMenu=pg.transform.scale(fondMenu, screenSize)
+      fondMenu=ut.assets.load("Resources/Menus/BackgroundMenu.png", True, screenSize)
 
       partsHeight = screenSize[1] / 7
-      logo = pg.image.load("Resources/Menus/Title.png")
+      logo = ut.assets.load("Resources/Menus/Title.png")
 
       buttonSize = (screenSize[0] * 10 / 100, screenSize[1] * 5 / 100)
       boutonJouer=ut.Bouton((screenSize[0] / 2 - buttonSize[0]/2, partsHeight * 3),"Jouer",buttonSize,screen, alphaSurface)
@@ -438,7 +577,7 @@ def menuPause():
       partsHeight = screenSize[1] / 7
       buttonSize = (screenSize[0] * 15 / 100, screenSize[1] * 5 / 100)
 
-      logo = pg.image.load("Resources/Menus/Title.png")
+      logo = ut.assets.load("Resources/Menus/Title.png")
 
       boutonJouer=ut.Bouton((partsHeight, partsHeight * 3),"Retour au Jeu",buttonSize,screen, alphaSurface)
       boutonMenu=ut.Bouton((partsHeight, partsHeight * 4),"Retour au Menu",buttonSize,screen, alphaSurface)     
@@ -472,8 +611,7 @@ def menuOptions():
       global selectedChar
       global selectedMap
       notDone4=True
-      fondMenu=pg.image.load("Resources/Menus/BackgroundMenu.png")
-      fondMenu=pg.transform.scale(fondMenu,screenSize)
+      fondMenu=ut.assets.load("Resources/Menus/BackgroundMenu.png", True, screenSize)
 
       partsHeight = round(screenSize[1] / 7)
       mapText = gameFont.render("Map :", True, pg.Color("white"), pg.Color("black"))
@@ -492,7 +630,14 @@ def menuOptions():
 
       pg.display.flip()
       tempPos = (0, 0)
+      prefetchedMap = None
       while notDone4:
+            highlightedMap = mapsSelection.hoverIndex if mapsSelection.hoverIndex >= 0 else mapsSelection.selectionIndex
+            if highlightedMap != prefetchedMap: # Précharge la map survolée ou choisie et oublie la précédente
+                  if prefetchedMap is not None and maps[prefetchedMap].map is not map:
+                        maps[prefetchedMap].evict()
+                  maps[highlightedMap].prefetch()
+                  prefetchedMap = highlightedMap
             alphaSurface.fill((255,255,255,0))
             screen.blit(fondMenu,(0,0))
             screen.blit(mapText, (round(screenSize[0] / 2 - mapText.get_size()[0] / 2), round(partsHeight / 2 - mapText.get_size()[1] / 2 + partsHeight * 0)))
@@ -529,95 +674,123 @@ def jeu():
       global drawPaths
       global drawFPS
       global placeObjects
+      global dirtyRendering
       global lastFPS
       global gm2TimeLeft
       global gunCooldown
       global selectedItem
+      global previousPositions
 
+      clock = pg.time.Clock() # Limite le nombre d'images par seconde en endormant le programme plutôt qu'en attendant activement
+      tickTime = 1.0 / tickRate # Durée d'un tick de simulation en secondes
+      accumulator = 0.0 # Temps écoulé pas encore simulé
+      lastTime = time.perf_counter()
       notDone = True # Vrai tant que l'utilisateur souhaite jouer
       while notDone: # Tant que done est égal à True :
-            startTime = time.time() # temps de début de la boucle en s
-            draw() # Tout retracé
-            react() # Vérifier les coordonnées
-            for event in pg.event.get(): #vérifie tous les événements possibles
-                  if event.type == QUIT: # si l'événement est un quitter
-                        notDone = False # sort de la boucle
-                        pg.quit()
-                  elif event.type == MOUSEBUTTONUP: # Si la souris est utilisé
-                        if event.button == 1:
-                              if not placeObjects and char.items[selectedItem].type == "EXPLOSIVE":
-                                    char.items[selectedItem].rect.topleft = char.rect.center
-                                    map.items.append(char.items[selectedItem])
-                                    char.items.remove(char.items[selectedItem])
-                                    selectedItem = 0
-                                    inventoryBar.selectionIndex = 0
-                              elif not placeObjects and char.items[selectedItem].type == "WEAPON":
-                                    if not char.items[selectedItem].characteristics.isAutomatic:
-                                          if gunCooldown <= 0:
-                                                char.mouv('tirer', screenRect, selectedItem)
-                                                gunCooldown = char.items[selectedItem].characteristics.cooldown
-                              elif placeObjects: # Place un nouvel objet
-                                    map.objectPlacer("place", screenRect)
-                                    updateMapOBJs()
-                              inventoryBar.updateIndex(event.pos, 0, True)
-                        elif event.button == 4:
-                              if placeObjects: # Modifie l'objet a placer
-                                    map.objectPlacer("scrollUp", screenRect)
-                              else:
-                                    inventoryBar.updateIndex(None, 1, False)
-                        elif event.button == 5:
-                              if placeObjects: # Modifie l'objet a placer
-                                    map.objectPlacer("scrollDown", screenRect)
-                              else:
-                                    inventoryBar.updateIndex(None, 2, False)
-                  elif event.type == KEYUP: # Si le clavier est utilisé. Permet l'activation du menu pause ou des fonctions caché (pour afficher, dans l'ordre, les hitboxes, les chemins, les FPS, le placeur d'objets et changer l'image de fonc en fonction des objets placé)
-                        if event.key == K_ESCAPE and placeObjects:
-                              placeObjects = False
-                        elif event.key == K_ESCAPE:
-                              gm2TimeLeft = gm2TimeLeft - (time.time() - gm2StartTime)
-                              menuPause()
-                        elif event.key == K_F9 and not drawHitboxes:
-                              drawHitboxes = True
-                        elif event.key == K_F9 and drawHitboxes:
-                              drawHitboxes = False
-                        elif event.key == K_F10 and not drawPaths:
-                              drawPaths = True
-                        elif event.key == K_F10 and drawPaths:
-                              drawPaths = False
-                        elif event.key == K_F11 and not drawFPS:
-                              drawFPS = True
-                        elif event.key == K_F11 and drawFPS:
-                              drawFPS = False
-                        elif event.key == K_F12 and not placeObjects:
-                              map.reset(enemies, items, False)
-                              placeObjects = True
-                        elif event.key == K_F12 and placeObjects:
-                              placeObjects = False
-                        elif event.key == K_F8 and placeObjects:
-                              map.reset(enemies, items, False)
-                              tempSurface = pg.Surface(map.size)
-                              tempSurface.blit(map.sprite, (0, 0))
-                              pg.image.save(tempSurface, "Resources/Maps/Sprites/" + map.name + "Backup.png")
-                              for obj in map.items + map.obstacles + map.enemies:
-                                    tempSurface.blit(obj.sprite, obj.rect.topleft)
-                              pg.image.save(tempSurface, "Resources/Maps/Sprites/" + map.name + ".png")
-                              os.remove("Resources/Maps/Enemies/" + map.name + ".txt")
-                              os.remove("Resources/Maps/Items/" + map.name + ".txt")
-                              os.remove("Resources/Maps/Obstacles/" + map.name + ".txt")
-                              open("Resources/Maps/Enemies/" + map.name + ".txt", 'w')
-                              open("Resources/Maps/Items/" + map.name + ".txt", 'w')
-                              open("Resources/Maps/Obstacles/" + map.name + ".txt", 'w')
-                              mapSetup()
-
-            pg.time.Clock().tick_busy_loop(120) # Limite les FPS au maximum indiqué
-            lastFPS = round(1.0 / (time.time() - startTime), 2) # Calcul le nombre d'image par seconde. FPS = 1 / temps de la boucle
-
-
-loadResources()
-
-menuDepart()
-
-pg.quit() # quitte pygame
+            now = time.perf_counter()
+            accumulator += min(now - lastTime, maxTicksPerFrame * tickTime) # Après une image très lente (ou un menu), le retard au delà de maxTicksPerFrame ticks est abandonné
+            lastTime = now
+            while accumulator >= tickTime and notDone: # Simule autant de ticks de durée fixe que le temps écoulé le permet
+                  previousPositions = {id(x): x.rect.topleft for x in [char] + map.enemies}
+                  with ut.profiler.phase("react"):
+                        react() # Vérifier les coordonnées
+                  accumulator -= tickTime
+            draw(False, accumulator / tickTime) # Tout retracé, en interpolant les positions entre le dernier tick et le prochain
+            with ut.profiler.phase("événements"):
+                  for event in pg.event.get(): #vérifie tous les événements possibles
+                        if event.type == QUIT: # si l'événement est un quitter
+                              notDone = False # sort de la boucle
+                              pg.quit()
+                        elif event.type == MOUSEBUTTONUP: # Si la souris est utilisé
+                              if event.button == 1:
+                                    if not placeObjects and char.items[selectedItem].type == "EXPLOSIVE":
+                                          char.items[selectedItem].rect.topleft = char.rect.center
+                                          map.areaEffects.arm(char.items[selectedItem])
+                                          char.items.remove(char.items[selectedItem])
+                                          selectedItem = 0
+                                          inventoryBar.selectionIndex = 0
+                                    elif not placeObjects and char.items[selectedItem].type == "WEAPON":
+                                          if not char.items[selectedItem].characteristics.isAutomatic:
+                                                if gunCooldown <= 0:
+                                                      char.mouv('tirer', screenRect, selectedItem)
+                                                      gunCooldown = char.items[selectedItem].characteristics.cooldown
+                                    elif placeObjects: # Place un nouvel objet
+                                          map.objectPlacer("place", screenRect)
+                                    inventoryBar.updateIndex(event.pos, 0, True)
+                              elif event.button == 4:
+                                    if placeObjects: # Modifie l'objet a placer
+                                          map.objectPlacer("scrollUp", screenRect)
+                                    else:
+                                          inventoryBar.updateIndex(None, 1, False)
+                              elif event.button == 5:
+                                    if placeObjects: # Modifie l'objet a placer
+                                          map.objectPlacer("scrollDown", screenRect)
+                                    else:
+                                          inventoryBar.updateIndex(None, 2, False)
+                        elif event.type == KEYUP: # Si le clavier est utilisé. Permet l'activation du menu pause ou des fonctions caché (pour afficher, dans l'ordre, les hitboxes, les chemins, les FPS, le placeur d'objets et changer l'image de fonc en fonction des objets placé)
+                              if event.key == K_ESCAPE and placeObjects:
+                                    placeObjects = False
+                              elif event.key == K_ESCAPE:
+                                    gm2TimeLeft = gm2TimeLeft - (time.time() - gm2StartTime)
+                                    menuPause()
+                              elif event.key == K_F9 and not drawHitboxes:
+                                    drawHitboxes = True
+                              elif event.key == K_F9 and drawHitboxes:
+                                    drawHitboxes = False
+                              elif event.key == K_F10 and not drawPaths:
+                                    drawPaths = True
+                              elif event.key == K_F10 and drawPaths:
+                                    drawPaths = False
+                              elif event.key == K_F11 and not drawFPS:
+                                    drawFPS = True
+                              elif event.key == K_F11 and drawFPS:
+                                    drawFPS = False
+                              elif event.key == K_F5: # Active ou désactive l'affichage des seules zones modifiées
+                                    dirtyRendering = not dirtyRendering
+                                    print("Affichage partiel: " + ("oui" if dirtyRendering else "non"))
+                              elif event.key == K_F6: # Enregistre les temps des dernières images pour les analyser hors du jeu
+                                    ut.profiler.dumpCSV("profil-" + time.strftime("%Y%m%d-%H%M%S") + ".csv")
+                              elif event.key == K_F7: # Change le mode de poursuite des ennemis
+                                    map.pursuitMode = {"auto": "pathfinding", "pathfinding": "flowfield", "flowfield": "auto"}[map.pursuitMode]
+                                    print("Mode de poursuite: " + map.pursuitMode)
+                              elif event.key == K_F12 and not placeObjects:
+                                    map.reset(enemies, items, False)
+                                    placeObjects = True
+                              elif event.key == K_F12 and placeObjects:
+                                    placeObjects = False
+                              elif event.key == K_F8 and placeObjects:
+                                    map.reset(enemies, items, False)
+                                    tempSurface = pg.Surface(map.size)
+                                    tempSurface.blit(map.sprite, (0, 0))
+                                    pg.image.save(tempSurface, "Resources/Maps/Sprites/" + map.name + "Backup.png")
+                                    for obj in map.items + map.obstacles + map.enemies:
+                                          tempSurface.blit(obj.sprite, obj.rect.topleft)
+                                    pg.image.save(tempSurface, "Resources/Maps/Sprites/" + map.name + ".png")
+                                    maps[selectedMap].evict() # L'image de la map a changé sur le disque, elle sera rechargée
+                                    os.remove("Resources/Maps/Enemies/" + map.name + ".txt")
+                                    os.remove("Resources/Maps/Items/" + map.name + ".txt")
+                                    os.remove("Resources/Maps/Obstacles/" + map.name + ".txt")
+                                    open("Resources/Maps/Enemies/" + map.name + ".txt", 'w')
+                                    open("Resources/Maps/Items/" + map.name + ".txt", 'w')
+                                    open("Resources/Maps/Obstacles/" + map.name + ".txt", 'w')
+                                    mapSetup()
+
+            clock.tick(maxFPS) # Limite les FPS au maximum indiqué
+            lastFPS = round(clock.get_fps(), 2) # Nombre moyen d'images par seconde sur les dernières images
+            ut.profiler.endFrame()
+
+
+if __name__ == "__main__": # Le module peut aussi être importé sans lancer le jeu (voir benchmark.py load et les processus de PathWorkerPool)
+      setupScreen()
+      loadResources()
+      if pathWorkers:
+            workerPool = ut.PathWorkerPool(pathWorkers)
+
+      menuDepart()
+
+      if workerPool:
+            workerPool.close()
+      pg.quit() # quitte pygame
 
 
 
@@ -1,16 +1,211 @@
 import pygame
-import copy
 import math
 import random
 import functools
+import heapq
+import bisect
+import itertools
+import array
+import os
+import time
+import collections
+import contextlib
+import struct
+import threading
+import multiprocessing
+import multiprocessing.resource_tracker
+import multiprocessing.shared_memory
+
+import numpy as np
+
+class AssetCache: # Cache des images du jeu. Chaque image n'est décodée qu'une seule fois, les plus anciennes sont oubliées si le cache dépasse sa taille maximale
+        def __init__(self, maxBytes = 512 * 1024 * 1024):
+                self.maxBytes = maxBytes # Taille maximale du cache en octets
+                self.surfaces = collections.OrderedDict() # Images converties, de la moins récemment utilisée à la plus récemment utilisée
+                self.bytes = 0 # Taille actuelle du cache en octets
+                self.hits = 0 # Nombre de chargements évités grâce au cache
+                self.misses = 0 # Nombre d'images réellement chargées ou redimensionnées
+
+        def load(self, path, alpha = True, size = None): # Retourne l'image convertie pour l'écran (avec transparence si alpha), éventuellement redimensionnée
+                key = (path, alpha, size)
+                surface = self.surfaces.get(key)
+                if surface:
+                        self.hits += 1
+                        self.surfaces.move_to_end(key)
+                        return surface
+                self.misses += 1
+                if size:
+                        surface = pygame.transform.scale(self.load(path, alpha), size)
+                elif alpha:
+                        surface = pygame.image.load(path).convert_alpha()
+                else:
+                        surface = pygame.image.load(path).convert()
+                return self.store(path, surface, alpha, size)
+
+        def store(self, path, surface, alpha = True, size = None): # Ajoute au cache une image déjà convertie pour l'écran, par exemple décodée dans un autre thread
+                key = (path, alpha, size)
+                if key in self.surfaces:
+                        oldSurface = self.surfaces.pop(key)
+                        self.bytes -= oldSurface.get_pitch() * oldSurface.get_height()
+                self.surfaces[key] = surface
+                self.bytes += surface.get_pitch() * surface.get_height()
+                while self.bytes > self.maxBytes and len(self.surfaces) > 1: # Oublie les images les moins récemment utilisées
+                        oldSurface = self.surfaces.popitem(last = False)[1]
+                        self.bytes -= oldSurface.get_pitch() * oldSurface.get_height()
+                return surface
+
+        def discard(self, path): # Oublie toutes les versions d'une image, par exemple après l'avoir modifiée sur le disque
+                for key in [x for x in self.surfaces if x[0] == path]:
+                        surface = self.surfaces.pop(key)
+                        self.bytes -= surface.get_pitch() * surface.get_height()
+
+        def report(self):
+                return "Images: {} en cache, {:.1f} Mo, {} chargements évités, {} chargements".format(len(self.surfaces), self.bytes / (1024 * 1024), self.hits, self.misses)
+
+
+assets = AssetCache() # Cache d'images partagé par les entités, les maps, les menus et l'éditeur
+
+
+class Controls: # Etat du clavier et de la souris lu par la simulation. Lit directement pygame
+        def keys(self): # Indexable par les constantes de touches de pygame (K_w...)
+                return pygame.key.get_pressed()
+
+        def mouseButtons(self):
+                return pygame.mouse.get_pressed()
+
+        def mousePos(self): # Coordonnées écran de la souris
+                return pygame.mouse.get_pos()
+
+        def advance(self): # Passe au tick suivant. Rien à faire pour le vrai clavier
+                pass
+
+
+class ScriptedControls(Controls): # Entrées rejouées à partir d'un script, pour faire tourner le jeu sans joueur (mesures de performance)
+        def __init__(self, steps, loop = True):
+                self.steps = steps # Liste de (nombre de ticks, touches appuyées en lettres ex: "wd", tir, coordonnées écran de la souris)
+                self.loop = loop # Recommence le script une fois terminé
+                self.tick = 0
+                self.length = sum(x[0] for x in steps)
+
+        @classmethod
+        def fromFile(cls, path): # Une étape par ligne: ticks,touches,tir (True/False),x souris,y souris
+                steps = []
+                with open(path) as scriptFile:
+                        for line in scriptFile.readlines():
+                                if line.strip() and not line.strip().startswith("#"):
+                                        data = line.strip().split(',')
+                                        steps.append((int(data[0]), data[1].strip(), data[2].strip() == "True", (int(data[3]), int(data[4]))))
+                return cls(steps)
+
+        def currentStep(self):
+                tick = self.tick % self.length if self.loop else min(self.tick, self.length - 1)
+                for step in self.steps:
+                        if tick < step[0]:
+                                return step
+                        tick -= step[0]
+                return self.steps[-1]
+
+        def keys(self):
+                pressed = collections.defaultdict(bool)
+                for letter in self.currentStep()[1]:
+                        pressed[getattr(pygame, "K_" + letter)] = True
+                return pressed
+
+        def mouseButtons(self):
+                return (self.currentStep()[2], False, False)
+
+        def mousePos(self):
+                return self.currentStep()[3]
+
+        def advance(self):
+                self.tick += 1
+
+
+controls = Controls() # Source des entrées de la simulation, remplaçable par des ScriptedControls
+
+
+class FrameProfiler: # Mesure le temps passé dans chaque phase d'une image et garde les dernières images dans des buffers circulaires
+        def __init__(self, size = 600):
+                self.reset(size)
+
+        def reset(self, size = 600): # Oublie toutes les mesures
+                self.size = size # Nombre d'images conservées
+                self.history = collections.OrderedDict() # Durées en ms de chaque phase, une valeur par image, dans l'ordre de première mesure
+                self.frames = collections.deque(maxlen = size) # Numéro de chaque image conservée
+                self.frameCount = 0
+                self.current = collections.defaultdict(float) # Durées cumulées de l'image en cours, une phase pouvant être mesurée plusieurs fois (un findBest par ennemi)
+
+        @contextlib.contextmanager
+        def phase(self, name): # Utilisation: with profiler.phase("react"): ...
+                startTime = time.perf_counter()
+                try:
+                        yield
+                finally:
+                        self.current[name] += (time.perf_counter() - startTime) * 1000
+
+        def timed(self, name): # Décorateur mesurant chaque appel d'une fonction comme une phase
+                def decorator(function):
+                        @functools.wraps(function)
+                        def wrapper(*args, **kwargs):
+                                with self.phase(name):
+                                        return function(*args, **kwargs)
+                        return wrapper
+                return decorator
+
+        def endFrame(self): # Range les durées de l'image terminée. Les phases absentes de cette image valent 0
+                for name in self.current:
+                        if name not in self.history:
+                                self.history[name] = collections.deque([0.0] * len(self.frames), maxlen = self.size)
+                for name, durations in self.history.items():
+                        durations.append(self.current.get(name, 0.0))
+                self.frames.append(self.frameCount)
+                self.frameCount += 1
+                self.current.clear()
+
+        def percentiles(self, name): # Retourne (p50, p99) en ms d'une phase sur les images conservées
+                durations = sorted(self.history[name])
+                return durations[len(durations) // 2], durations[min(len(durations) - 1, int(len(durations) * 0.99))]
+
+        def lines(self): # Une ligne de texte par phase pour l'affichage de debug
+                return ["{:<12} p50 {:6.2f} ms  p99 {:6.2f} ms".format(name, *self.percentiles(name)) for name in self.history]
+
+        def dumpCSV(self, path): # Ecrit une ligne par image conservée et une colonne par phase
+                with open(path, 'w') as csvFile:
+                        csvFile.write(",".join(["image"] + list(self.history)) + "\n")
+                        for index, frame in enumerate(self.frames):
+                                csvFile.write(",".join([str(frame)] + ["{:.4f}".format(x[index]) for x in self.history.values()]) + "\n")
+
+
+profiler = FrameProfiler() # Profileur partagé par la boucle de jeu et les classes du jeu
+
+
+class PrototypeRegistry: # Modèles des items, obstacles et ennemis, indexés par leur nom. Les instances partagent l'image et les caractéristiques de leur modèle
+        def __init__(self):
+                self.prototypes = {}
+
+        def register(self, prototypes): # Ajoute une liste de modèles chargés depuis les fichiers Data.txt
+                for prototype in prototypes:
+                        self.prototypes[prototype.name] = prototype
+                return prototypes
+
+        def get(self, name):
+                return self.prototypes[name]
+
+        def spawn(self, name, coords = (0, 0), *args): # Crée une instance du modèle, décalée de coords
+                return self.prototypes[name].spawn(coords, *args)
+
+prototypes = PrototypeRegistry() # Modèles chargés par loadResources(), à partir desquels les maps et le jeu créent leurs instances
+
 
 class Item: # Définis un objet pouvant être utilisé par le joueur
+        __slots__ = ("name", "sprite", "type", "value", "rect", "pickedUpOnce", "characteristics")
+
         def __init__(self, name, type, value, characteristics = None):
                 if name.lower == "none":
                         raise ValueError("Ne pas utiliser 'none' comme nom d'item!")
                 else:
                         self.name = name
-                        self.sprite = pygame.image.load("Resources/Items/Sprites/" + self.name + ".png").convert_alpha()
+                        self.sprite = assets.load("Resources/Items/Sprites/" + self.name + ".png")
                         self.type = type # Une des options définis par le enum ItemTypes
                         self.value = value # La puissance de l'arme, le nombre de points de vies rétablies...
                         self.rect = self.sprite.get_rect() # Les coordonnées et la taille de l'item. La taille est définis par la taille du sprite de l'item
@@ -18,20 +213,21 @@ class Item: # Définis un objet pouvant être utilisé par le joueur
                         if type == "WEAPON": # Si l'item est du type 'Weapon', charger d'autres caractéristiques
                                 self.characteristics = characteristics
 
+        def spawn(self, coords = (0, 0)): # Crée une instance de l'item. L'image et les caractéristiques sont partagées, pas copiées
+                result = Item.__new__(Item)
+                result.name = self.name
+                result.sprite = self.sprite
+                result.type = self.type
+                result.value = self.value # Propre à chaque instance (munitions restantes...)
+                result.rect = self.rect.move(coords)
+                result.pickedUpOnce = False
+                if self.type == "WEAPON":
+                        result.characteristics = self.characteristics
+                return result
+
         def draw(self, coords, screen):
                 screen.blit(self.sprite, coords)
 
-        def __deepcopy__(self, memo): # https://stackoverflow.com/a/15774013
-                cls = self.__class__
-                result = cls.__new__(cls)
-                memo[id(self)] = result
-                for k, v in self.__dict__.items():
-                        if k == "rect":
-                                setattr(result, k, copy.deepcopy(v, memo))
-                        else:
-                                setattr(result, k, copy.copy(v))
-                return result
-
 
 class Weapon: # Classe auxiliaire pour définir les caractéristiques d'une arme
       def __init__(self, aim = 95, speed = 20, isExplosive = False, isAutomatic = False, cooldown = 20, spread = False):
@@ -54,32 +250,137 @@ class Hitbox:
                 pygame.draw.rect(screen, pygame.Color(191, 63, 63, 127), pygame.Rect(coords[0], coords[1], self.rect.w, self.rect.h))
 
 
+class SpatialHash: # Grille uniforme indexant des objets par leur rectangle, pour ne tester que les objets proches d'une zone
+        def __init__(self, cellSize = 128):
+                self.cellSize = cellSize # Taille d'une cellule en pixels
+                self.cells = {} # Liste des objets de chaque cellule, indexée par les coordonnées de la cellule
+
+        def __cellRange(self, rect): # Cellules (limites incluses) recouvertes par un rectangle, y compris un rectangle de taille nulle
+                return (rect.left // self.cellSize, rect.top // self.cellSize, rect.right // self.cellSize, rect.bottom // self.cellSize)
+
+        def insert(self, obj): # Ajoute un objet ayant un attribut 'rect'
+                left, top, right, bottom = self.__cellRange(obj.rect)
+                for x in range(left, right + 1):
+                        for y in range(top, bottom + 1):
+                                self.cells.setdefault((x, y), []).append(obj)
+
+        def remove(self, obj): # Enlève un objet dont le rectangle n'a pas changé depuis son ajout
+                left, top, right, bottom = self.__cellRange(obj.rect)
+                for x in range(left, right + 1):
+                        for y in range(top, bottom + 1):
+                                cell = self.cells.get((x, y))
+                                if cell and obj in cell:
+                                        cell.remove(obj)
+
+        def rebuild(self, objects): # Réindexe entièrement une liste d'objets, pour les objets qui bougent à chaque tick
+                self.cells = {}
+                for obj in objects:
+                        self.insert(obj)
+
+        def __candidates(self, rect): # Objets se trouvant dans les cellules recouvertes par le rectangle, sans doublons
+                left, top, right, bottom = self.__cellRange(rect)
+                if left == right and top == bottom:
+                        return self.cells.get((left, top), ())
+                seen = set()
+                candidates = []
+                for x in range(left, right + 1):
+                        for y in range(top, bottom + 1):
+                                for obj in self.cells.get((x, y), ()):
+                                        if id(obj) not in seen:
+                                                seen.add(id(obj))
+                                                candidates.append(obj)
+                return candidates
+
+        def queryRect(self, rect): # Objets en collision avec un rectangle
+                return [obj for obj in self.__candidates(rect) if obj.rect.colliderect(rect)]
+
+        def collideRect(self, rect): # Vrai si au moins un objet est en collision avec le rectangle
+                return any(obj.rect.colliderect(rect) for obj in self.__candidates(rect))
+
+        def queryPoint(self, point): # Objets contenant un point
+                return [obj for obj in self.cells.get((int(point[0] // self.cellSize), int(point[1] // self.cellSize)), ()) if obj.rect.collidepoint(point)]
+
+        def collidePoint(self, point): # Vrai si au moins un objet contient le point
+                return any(obj.rect.collidepoint(point) for obj in self.cells.get((int(point[0] // self.cellSize), int(point[1] // self.cellSize)), ()))
+
+        def queryRadius(self, center, radius): # Objets dont le rectangle se trouve au moins en partie dans le cercle indiqué
+                return [obj for obj in self.__candidates(pygame.Rect(center[0] - radius, center[1] - radius, 2 * radius, 2 * radius)) if self.rectInCircle(obj.rect, center, radius)]
+
+        @staticmethod
+        def rectInCircle(rect, center, radius): # Vrai si le rectangle se trouve au moins en partie dans le cercle
+                closestX = min(max(center[0], rect.left), rect.right) # Point du rectangle le plus proche du centre du cercle
+                closestY = min(max(center[1], rect.top), rect.bottom)
+                return (closestX - center[0]) ** 2 + (closestY - center[1]) ** 2 <= radius ** 2
+
+
+class RenderList: # Objets d'une map triés par profondeur (bas du rectangle) pour l'affichage. Les objets fixes ne sont triés qu'une seule fois
+        def __init__(self, statics = ()):
+                self.statics = sorted(statics, key = RenderList.depth) # Objets qui ne bougent pas, triés
+                self.staticDepths = [x.rect.bottom for x in self.statics]
+                self.groups = [] # Un tableau trié par groupe d'objets qui bougent (items, ennemis...)
+                self.groupDepths = []
+
+        @staticmethod
+        def depth(obj):
+                return obj.rect.bottom
+
+        def addStatic(self, obj):
+                index = bisect.bisect_right(self.staticDepths, obj.rect.bottom)
+                self.statics.insert(index, obj)
+                self.staticDepths.insert(index, obj.rect.bottom)
+
+        def removeStatic(self, obj):
+                if obj in self.statics:
+                        index = self.statics.index(obj)
+                        del self.statics[index]
+                        del self.staticDepths[index]
+
+        def update(self, *groups): # Retrie les objets qui bougent. Chaque groupe garde l'ordre de l'image précédente, presque trié, tant que ses objets ne changent pas
+                while len(self.groups) < len(groups):
+                        self.groups.append([])
+                for sortedGroup, group in zip(self.groups, groups):
+                        if len(sortedGroup) != len(group) or set(map(id, sortedGroup)) != set(map(id, group)): # Un objet est apparu ou a disparu
+                                sortedGroup[:] = group
+                        sortedGroup.sort(key = RenderList.depth)
+                self.groupDepths = [[x.rect.bottom for x in sortedGroup] for sortedGroup in self.groups]
+
+        def ordered(self): # Tous les objets, du plus haut au plus bas
+                return heapq.merge(self.statics, *self.groups, key = RenderList.depth)
+
+        def below(self, depth): # Objets dont le bas se trouve au dessus de depth ou au même niveau, dans l'ordre d'affichage
+                return heapq.merge(itertools.islice(self.statics, bisect.bisect_right(self.staticDepths, depth)), *[itertools.islice(group, bisect.bisect_right(depths, depth)) for group, depths in zip(self.groups, self.groupDepths)], key = RenderList.depth)
+
+        def above(self, depth): # Objets dont le bas se trouve en dessous de depth, dans l'ordre d'affichage
+                return heapq.merge(itertools.islice(self.statics, bisect.bisect_right(self.staticDepths, depth), None), *[itertools.islice(group, bisect.bisect_right(depths, depth), None) for group, depths in zip(self.groups, self.groupDepths)], key = RenderList.depth)
+
+
 class Obstacle: # Définis des obstacles avec une image et une hitbox
+        __slots__ = ("name", "sprite", "rect", "hitbox")
+
         def __init__(self, name, hitbox):
                 self.name = name
-                self.sprite = pygame.image.load("Resources/Obstacles/Sprites/" + name + ".png").convert_alpha() # Le sprite de l'objet
+                self.sprite = assets.load("Resources/Obstacles/Sprites/" + name + ".png") # Le sprite de l'objet
                 self.rect = self.sprite.get_rect()
-                self.hitbox = hitbox # La hitbox associé à l'objet
+                self.hitbox = hitbox # La hitbox associé à l'objet, relative à l'obstacle et partagée par toutes ses instances
+
+        def spawn(self, coords = (0, 0)): # Crée une instance de l'obstacle. Seul le rectangle est propre à l'instance
+                result = Obstacle.__new__(Obstacle)
+                result.name = self.name
+                result.sprite = self.sprite
+                result.rect = self.rect.move(coords)
+                result.hitbox = self.hitbox
+                return result
 
         def draw(self, coords, screen): # Dessine l'objet
                 screen.blit(self.sprite, coords)
 
-        def __deepcopy__(self, memo): # https://stackoverflow.com/a/15774013
-                cls = self.__class__
-                result = cls.__new__(cls)
-                memo[id(self)] = result
-                for k, v in self.__dict__.items():
-                        if k == "rect":
-                                setattr(result, k, copy.deepcopy(v, memo))
-                        else:
-                                setattr(result, k, copy.copy(v))
-                return result
-
 
 class Enemy: # Définis un ennemis qui va tenter d'attaquer les joueurs s'ils se trovent suffisament proche
+        __slots__ = ("name", "sprite", "rect", "screen", "baseSpeed", "speed", "map", "health", "viewingRadius", "reactionTime", "weapons", "pathFinder", "lastPlayerPos", "idleTime")
+
         def __init__(self, name, screen, map, speed, health, viewingRadius, reactionTime, weapons):
                 self.name = name # Le nom de l'ennemis
-                self.sprite = pygame.image.load("Resources/Enemies/Sprites/" + name + ".png").convert_alpha() # l'image de l'ennemis
+                self.sprite = assets.load("Resources/Enemies/Sprites/" + name + ".png") # l'image de l'ennemis
                 self.rect = self.sprite.get_rect() # Le rectangle définissant la hitbox de l'ennemis
                 self.screen = screen # La surface sur laquelle l'ennemis doit être affiché
                 self.baseSpeed = speed # La vitesse de l'ennemis
@@ -93,6 +394,24 @@ class Enemy: # Définis un ennemis qui va tenter d'attaquer les joueurs s'ils se
                 self.lastPlayerPos = None # La dernière position du joueur se trouvant le plus proche de l'ennemis
                 self.idleTime = 0 # Temps d'immobilité de l'ennemis entre chaque mouvement aléatoire (tant qu'aucun joueur est proche)
 
+        def spawn(self, coords = (0, 0), map = None): # Crée une instance de l'ennemis, placée sur la map si elle est donnée. L'image, l'écran et les armes sont partagés
+                result = Enemy.__new__(Enemy)
+                result.name = self.name
+                result.sprite = self.sprite
+                result.rect = self.rect.move(coords)
+                result.screen = self.screen
+                result.baseSpeed = self.baseSpeed
+                result.speed = self.speed
+                result.map = map
+                result.health = self.health
+                result.viewingRadius = self.viewingRadius
+                result.reactionTime = self.reactionTime
+                result.weapons = self.weapons
+                result.pathFinder = map.newPathFinder(result) if map else None
+                result.lastPlayerPos = None
+                result.idleTime = 0
+                return result
+
         def draw(self, coords, screen): # Dessine l'ennemis aux bonnes coordonnées écran
                 screen.blit(self.sprite, coords)
 
@@ -107,38 +426,51 @@ class Enemy: # Définis un ennemis qui va tenter d'attaquer les joueurs s'ils se
 
         def randomPath(self): # Trouve un chemin aléatoire si aucun joueur se trouve à proximité de l'ennemis
                 dest = None
-                while not dest or any([x for x in self.map.hitboxes if x.rect.collidepoint(dest)]): # Tant que la destination ne se trouve pas dans une hitbox
+                while not dest or self.map.hitboxHash.collidePoint(dest): # Tant que la destination ne se trouve pas dans une hitbox
                         randomAngle = random.randint(0, 360) # Angle aléatoire
                         randomDistance = random.randint(self.speed, self.viewingRadius / 2) # Distance aléatoire entre la vitesse de l'ennemi et le radius de visibilité divisé par 2
                         dest = (round(self.rect.centerx + randomDistance * math.cos(randomAngle * math.pi / 180)), round(self.rect.centery + randomDistance * math.sin(randomAngle * math.pi / 180))) # Trouve la destination à l'aide de trigonométrie
-                self.pathFinder.findBest(self.rect.center, dest) # Trouve le meilleur chemin pour atteindre la destination
+                self.map.pathScheduler.request(self.pathFinder, self.rect.center, dest, math.inf) # Demande le meilleur chemin pour atteindre la destination, après ceux des ennemis qui poursuivent un joueur
 
         def moveTowards(self, coords): # Bouge les coordonnées de l'ennemis vers les coordonnées indiqué
                 angle = self.atan2Normalized((self.rect.centery - coords[1]), (coords[0] - self.rect.centerx)) # Angle de la destination par rapport au personnage dans la plan du repère
                 coords = (self.speed * round(math.cos(angle), 5), -self.speed * round(math.sin(angle), 5)) # Trouve les coefficients avec lesquels incrémenté les coordonnées de l'ennemi pour atteindre la destination à l'aide de trigonométrie
                 oldCoords = self.rect.topleft
                 self.rect.move_ip(coords[0], coords[1]) # Incrémente les coordonnées de l'ennemis par le coefficient calculé auparavant
-                for hitbox in self.map.hitboxes:
-                        if hitbox.rect.collidepoint(self.rect.center):
-                                self.rect.topleft = oldCoords
-                                break
-
-        def move(self, lastFPS): # Trouve une destination et incrémente les coordonnées du perso vers celle-ci
-                radiusPlayers = [x for x in self.map.players if self.distanceBetween(self.rect.center, x.rect.center) <= self.viewingRadius] # Liste des joueurs se trouvant dans le radius de visibilité de l'ennemis
-                radiusPlayers.sort(key = lambda x: self.distanceBetween(self.rect.center, x.rect.center)) # Classe les joueurs du plus proche au plus éloigné
-                if any(radiusPlayers): # Si au moins un joueur se trouve dans la zone de visibilité de l'ennemis
-                        self.speed = self.baseSpeed + 1
-                        self.speed = (self.speed + ((100 - (lastFPS * 100 / 60)) * self.speed / 100))
-                        if self.lastPlayerPos: # Si ce joueur a déjà été visé auparavant
-                                if (self.distanceBetween(self.lastPlayerPos, radiusPlayers[0].rect.center) >= self.reactionTime or self.rect.center == self.lastPlayerPos) and not self.rect.center == radiusPlayers[0]: # Si le joueur a bougé plus que le temps de réaction, que l'ennemis se trouve sur la dernière position du joueur mais pas sur le joueur 
-                                        self.pathFinder.findBest(self.rect.center, radiusPlayers[0].rect.midbottom) # Cherche le chemin le plus rapide vers le joueur
-                                        self.lastPlayerPos = radiusPlayers[0].rect.center # Met à jour la dernière position du joueur
+                if self.map.hitboxHash.collidePoint(self.rect.center): # Le centre de l'ennemis se trouve dans une hitbox
+                        self.rect.topleft = oldCoords
+
+        def move(self, tickRate): # Trouve une destination et incrémente les coordonnées du perso vers celle-ci
+                target = self.chooseTarget(self.map.perception.nearest(self.rect.center, self.viewingRadius), tickRate) # Vise le joueur visible le plus proche
+                if target:
+                        if self.distanceBetween(self.rect.center, target) <= self.speed: # Si la distance entre l'ennemis et la fin est plus petite que la vitesse de marche de l'ennemis
+                                self.rect.center = target # Place l'ennemis directement sur la fin
                         else:
-                                self.pathFinder.findBest(self.rect.center, radiusPlayers[0].rect.center) # Cherche le chemin le plus rapide vers le joueur
-                                self.lastPlayerPos = radiusPlayers[0].rect.center # Met à jour la dernière position du joueur
+                                self.moveTowards(target)
+
+        def chooseTarget(self, player, tickRate): # Met à jour le chemin de l'ennemis en fonction du joueur visible le plus proche (ou None) et retourne le point vers lequel il doit avancer ce tick, ou None s'il ne doit pas bouger
+                if player: # Si au moins un joueur se trouve dans la zone de visibilité de l'ennemis
+                        self.speed = (self.baseSpeed + 1) * 60 / tickRate # Les vitesses sont données pour 60 ticks par seconde
+                        directTarget = None # Point vers lequel avancer sans recherche de chemin (joueur en vue ou champ de distances)
+                        if self.pathFinder.navGrid.lineOfSight(self.rect.center, player.rect.center): # Le joueur est directement accessible: inutile de chercher un chemin
+                                directTarget = player.rect.center
+                        elif self.map.usesFlowField(): # Descend le champ de distances partagé au lieu de chercher un chemin
+                                directTarget = self.map.getFlowField(player, self.pathFinder.navGrid, self.viewingRadius * 2).nextStep(self.rect.center, player.rect.center)
+                        if directTarget:
+                                self.map.pathScheduler.cancel(self.pathFinder)
+                                self.pathFinder.path = []
+                                self.pathFinder.route = []
+                                self.pathFinder.finish = directTarget
+                                self.lastPlayerPos = None # Force une nouvelle recherche de chemin si le joueur sort de la vue ou si le mode de poursuite change
+                        elif self.lastPlayerPos: # Si ce joueur a déjà été visé auparavant
+                                if (self.distanceBetween(self.lastPlayerPos, player.rect.center) >= self.reactionTime or self.rect.center == self.lastPlayerPos) and not self.rect.center == player: # Si le joueur a bougé plus que le temps de réaction, que l'ennemis se trouve sur la dernière position du joueur mais pas sur le joueur 
+                                        self.map.pathScheduler.request(self.pathFinder, self.rect.center, player.rect.midbottom, self.distanceBetween(self.rect.center, player.rect.center)) # Demande le chemin le plus rapide vers le joueur, en priorité pour les ennemis les plus proches
+                                        self.lastPlayerPos = player.rect.center # Met à jour la dernière position du joueur
+                        else:
+                                self.map.pathScheduler.request(self.pathFinder, self.rect.center, player.rect.center, self.distanceBetween(self.rect.center, player.rect.center)) # Demande le chemin le plus rapide vers le joueur
+                                self.lastPlayerPos = player.rect.center # Met à jour la dernière position du joueur
                 elif (not self.pathFinder.path and self.rect.center == self.pathFinder.finish) or not self.pathFinder.finish: # Si l'ennemis n'a pas déjà une destination et un chemin
-                        self.speed = self.baseSpeed
-                        self.speed = int(self.speed + ((100 - (lastFPS * 100 / 60)) * self.speed / 100))
+                        self.speed = int(self.baseSpeed * 60 / tickRate) # Les vitesses sont données pour 60 ticks par seconde
                         if self.idleTime > 0: # Si l'ennemis doit encore attendre 
                                 self.idleTime -= 1
                         else:
@@ -146,109 +478,366 @@ class Enemy: # Définis un ennemis qui va tenter d'attaquer les joueurs s'ils se
                                 self.idleTime = random.randint(self.reactionTime, self.speed * 50) # Définis un temps d'attente aléatoire à partir de la vitesse de l'ennemis
 
 
+                if not self.pathFinder.path and self.pathFinder.route and not self.map.pathScheduler.isPending(self.pathFinder): # Le tronçon d'un trajet hiérarchique est parcouru: demande le chemin vers le point de passage suivant
+                        self.map.pathScheduler.request(self.pathFinder, self.rect.center, self.pathFinder.route[0], self.distanceBetween(self.rect.center, player.rect.center) if player else math.inf, self.pathFinder.route[1:])
                 if self.pathFinder.path: # Si l'ennemis a un chemin 
                         if self.distanceBetween(self.rect.center, self.pathFinder.path[0].rect.center) <= self.speed: # Si la distance entre l'ennemis et le prochain node du chemin est plus petite que la vitesse de l'ennemis
                                 self.pathFinder.path.pop(0) # Enlève ce node du chemin
-                        else:
-                                self.moveTowards(self.pathFinder.path[0].rect.center) # Marche en direction du prochain node du chemin
-                else: # Si l'ennemis n'a plus de chemin mais n'a pas encore atteint sa destination
-                        if self.distanceBetween(self.rect.center, self.pathFinder.finish) <= self.speed: # Si la distance entre l'ennemis et la fin est plus petite que la vitesse de marche de l'ennemis
-                                self.rect.center = self.pathFinder.finish # Place l'ennemis directement sur la fin
-                        else:
-                                self.moveTowards(self.pathFinder.finish) # Marche vers la fin
-
-        def __deepcopy__(self, memo): # https://stackoverflow.com/a/15774013
-                cls = self.__class__
-                result = cls.__new__(cls)
-                memo[id(self)] = result
-                for k, v in self.__dict__.items():
-                        if k == "rect":
-                                setattr(result, k, copy.deepcopy(v, memo))
-                        else:
-                                setattr(result, k, copy.copy(v))
-                return result
+                                return None
+                        return self.pathFinder.path[0].rect.center # Marche en direction du prochain node du chemin
+                return self.pathFinder.finish # Si l'ennemis n'a plus de chemin mais n'a pas encore atteint sa destination, marche vers la fin
+
+
+class EnemyBatch: # Positions, vitesses et destinations de tous les ennemis d'une map dans des tableaux NumPy, pour les déplacer tous ensemble
+        def __init__(self):
+                self.enemies = [] # Les ennemis correspondant aux lignes des tableaux
+                self.positions = np.zeros((0, 2)) # Centre exact (non arrondi) de chaque ennemis
+                self.written = np.zeros((0, 2)) # Centre écrit dans le rectangle de chaque ennemis au dernier tick, pour détecter les déplacements faits ailleurs
+                self.radiuses = np.zeros(0) # Radius de visibilité de chaque ennemis
+
+        def sync(self, enemies): # Reconstruit les tableaux si la liste d'ennemis a changé, en gardant la position exacte des ennemis déjà connus
+                if len(enemies) == len(self.enemies) and all(x is y for x, y in zip(enemies, self.enemies)):
+                        return
+                oldPositions = {id(enemy): (self.positions[index], self.written[index]) for index, enemy in enumerate(self.enemies)}
+                self.enemies = list(enemies)
+                self.positions = np.array([x.rect.center for x in enemies], dtype = float).reshape(-1, 2)
+                self.written = self.positions.copy()
+                for index, enemy in enumerate(enemies):
+                        if id(enemy) in oldPositions:
+                                self.positions[index], self.written[index] = oldPositions[id(enemy)]
+                self.radiuses = np.array([x.viewingRadius for x in enemies], dtype = float)
+
+        def step(self, map, tickRate): # Déplace tous les ennemis de la map d'un tick
+                self.sync(map.enemies)
+                if not self.enemies:
+                        return
+                centers = np.array([x.rect.center for x in self.enemies], dtype = float)
+                moved = (centers != self.written).any(axis = 1) # Ennemis déplacés en dehors du tick (placés par le jeu ou l'éditeur)
+                self.positions[moved] = centers[moved]
+
+                nearest = map.perception.nearestMany(centers, self.radiuses) # Joueur visible le plus proche de chaque ennemis
+
+                targets = np.zeros((len(self.enemies), 2))
+                hasTarget = np.zeros(len(self.enemies), dtype = bool)
+                speeds = np.zeros(len(self.enemies))
+                for index, enemy in enumerate(self.enemies): # Seule la décision (chemin, attente) reste faite ennemis par ennemis
+                        target = enemy.chooseTarget(nearest[index], tickRate)
+                        if target:
+                                targets[index] = target
+                                hasTarget[index] = True
+                        speeds[index] = enemy.speed
+
+                offsets = targets - centers
+                distances = np.sqrt((offsets * offsets).sum(axis = 1))
+                snap = hasTarget & (distances <= speeds) # Les ennemis assez proches de leur destination y sont placés directement
+                walk = hasTarget & ~snap
+                newPositions = self.positions.copy()
+                newPositions[walk] += offsets[walk] / distances[walk, None] * speeds[walk, None]
+                newCenters = np.round(newPositions)
+                navGrid = map.navGrids[min(map.navGrids)] # Grille de marche la plus fine de la map: une cellule libre ne contient aucune hitbox
+                cells = np.frombuffer(navGrid.cells, dtype = np.uint16).reshape(navGrid.height, navGrid.width)
+                newCells = (newCenters // navGrid.precision).astype(int)
+                inside = (newCells[:, 0] >= 0) & (newCells[:, 0] < navGrid.width) & (newCells[:, 1] >= 0) & (newCells[:, 1] < navGrid.height)
+                occupied = ~inside
+                occupied[inside] = cells[newCells[inside, 1], newCells[inside, 0]] > 0
+                for index in np.flatnonzero(walk & occupied): # Annule le déplacement des ennemis dont le centre se retrouve dans une hitbox. Seuls ceux arrivant dans une cellule occupée sont testés précisément
+                        if map.hitboxHash.collidePoint(newCenters[index].tolist()):
+                                walk[index] = False
+                self.positions[walk] = newPositions[walk]
+                self.positions[snap] = targets[snap]
+
+                for enemy, (x, y) in zip(self.enemies, np.round(self.positions).tolist()):
+                        enemy.rect.center = (int(x), int(y))
+                self.written = np.array([x.rect.center for x in self.enemies], dtype = float)
+
+
+class Perception: # Joueurs d'une map indexés une fois par tick, partagés par tous les ennemis pour trouver le joueur visible le plus proche
+        bruteForcePlayers = 8 # Jusqu'à ce nombre de joueurs, nearestMany() compare chaque ennemis à chaque joueur dans un seul calcul NumPy
+
+        def __init__(self, cellSize = 256):
+                self.players = [] # Joueurs au moment du dernier update(), dans l'ordre de map.players
+                self.playerHash = SpatialHash(cellSize)
+                self.centers = np.zeros((0, 2)) # Centre de chaque joueur
+                self.order = {} # Index de chaque joueur, pour départager deux joueurs à la même distance
+
+        def update(self, players): # Réindexe les joueurs. Appelé une fois par tick, avant de déplacer les ennemis
+                self.players = list(players)
+                self.playerHash.rebuild(self.players)
+                self.centers = np.array([x.rect.center for x in self.players], dtype = float).reshape(-1, 2)
+                self.order = {id(x): index for index, x in enumerate(self.players)}
+
+        def nearest(self, center, radius): # Joueur le plus proche dont le centre se trouve dans le radius, ou None. A distance égale, le premier joueur de la liste
+                best = None
+                bestKey = None
+                for player in self.playerHash.queryRect(pygame.Rect(center[0] - radius, center[1] - radius, 2 * radius + 1, 2 * radius + 1)):
+                        distance = (player.rect.centerx - center[0]) ** 2 + (player.rect.centery - center[1]) ** 2
+                        if distance <= radius ** 2 and (bestKey is None or (distance, self.order[id(player)]) < bestKey):
+                                best = player
+                                bestKey = (distance, self.order[id(player)])
+                return best
+
+        def nearestMany(self, centers, radiuses): # nearest() pour un tableau de centres (n, 2) et de radius (n)
+                if len(self.players) > self.bruteForcePlayers:
+                        return [self.nearest(center, radius) for center, radius in zip(centers.tolist(), radiuses.tolist())]
+                nearest = [None] * len(centers)
+                if self.players:
+                        offsets = centers[:, None, :] - self.centers[None, :, :]
+                        distances = np.sqrt((offsets * offsets).sum(axis = 2)) # Distance entre chaque centre et chaque joueur
+                        distances[distances > radiuses[:, None]] = np.inf
+                        closest = distances.argmin(axis = 1) # argmin garde le premier joueur en cas d'égalité
+                        visible = np.isfinite(distances[np.arange(len(centers)), closest])
+                        for index in np.nonzero(visible)[0].tolist():
+                                nearest[index] = self.players[closest[index]]
+                return nearest
+
+
+class MapBundle: # Données d'une map compilées dans un seul fichier binaire. Les fichiers texte de Resources/Maps restent la source modifiable
+        folder = "Resources/Maps/Bundles/"
+        magic = b"ISNMAP01"
+        header = struct.Struct("<8s8I") # Signature, largeur, hauteur, nombre de noms, taille des noms, nombre de hitboxes, d'obstacles, d'items et d'ennemis
+
+        def __init__(self, name): # Lit le fichier une seule fois. Les tableaux sont des vues sur ses octets, sans copie
+                self.name = name
+                with open(self.folder + name + ".bin", "rb") as bundleFile:
+                        self.data = bundleFile.read()
+                magic, width, height, nameCount, namesLength, hitboxCount, obstacleCount, itemCount, enemyCount = self.header.unpack_from(self.data)
+                if magic != self.magic:
+                        raise ValueError("Fichier de map compilée invalide: " + name)
+                self.size = (width, height)
+                offset = self.header.size
+                namesView = memoryview(self.data)[offset:offset + namesLength]
+                self.names = [] # Noms des prototypes, indexés par leur identifiant dans les tables d'instances
+                position = 0
+                for n in range(nameCount):
+                        length = namesView[position]
+                        self.names.append(bytes(namesView[position + 1:position + 1 + length]).decode("utf-8"))
+                        position += 1 + length
+                offset += (namesLength + 3) // 4 * 4 # Les tableaux commencent sur un multiple de 4 octets
+                self.hitboxes = np.frombuffer(self.data, np.int32, hitboxCount * 4, offset).reshape(-1, 4) # (x, y, largeur, hauteur), bords de la map et hitboxes des obstacles compris
+                offset += hitboxCount * 16
+                self.obstacles = np.frombuffer(self.data, np.int32, obstacleCount * 3, offset).reshape(-1, 3) # (identifiant du prototype, x, y)
+                offset += obstacleCount * 12
+                self.items = np.frombuffer(self.data, np.int32, itemCount * 3, offset).reshape(-1, 3)
+                offset += itemCount * 12
+                self.enemies = np.frombuffer(self.data, np.int32, enemyCount * 3, offset).reshape(-1, 3)
+
+        @classmethod
+        def sources(cls, name): # Fichiers à partir desquels la map est compilée
+                return ["Resources/Maps/Sprites/" + name + ".png", "Resources/Obstacles/Data.txt"] + ["Resources/Maps/" + x + "/" + name + ".txt" for x in ("Hitboxes", "Obstacles", "Items", "Enemies")]
+
+        @classmethod
+        def isStale(cls, name): # Vrai si la map compilée n'existe pas ou si une source a été modifiée depuis
+                path = cls.folder + name + ".bin"
+                return not os.path.exists(path) or os.path.getmtime(path) < max(os.path.getmtime(x) for x in cls.sources(name))
+
+        @classmethod
+        def load(cls, name): # Charge la map compilée, en la recompilant si besoin
+                if cls.isStale(name):
+                        cls.compile(name)
+                return cls(name)
+
+        @classmethod
+        def compile(cls, name): # Lit les fichiers texte de la map et écrit la map compilée
+                with open("Resources/Maps/Sprites/" + name + ".png", "rb") as spriteFile:
+                        pngHeader = spriteFile.read(24)
+                if pngHeader[:8] == b"\x89PNG\r\n\x1a\n": # La taille d'une image PNG se trouve dans son en-tête, inutile de la décoder
+                        size = struct.unpack(">II", pngHeader[16:24])
+                else:
+                        size = pygame.image.load("Resources/Maps/Sprites/" + name + ".png").get_size()
+                obstacleHitboxes = {} # Hitbox de chaque obstacle, relative à son image
+                with open("Resources/Obstacles/Data.txt") as obstaclesFile:
+                        for line in obstaclesFile.readlines():
+                                if line.strip() and not line.strip().isspace():
+                                        data = line.split(',')
+                                        obstacleHitboxes.setdefault(data[0], (int(data[1]), int(data[2]), int(data[3]), int(data[4])))
+                names = [] # Table des noms de prototypes
+                ids = {}
+                def instances(folder, keep = lambda name: True): # Lignes "nom,x,y" d'un fichier d'instances
+                        rows = []
+                        with open("Resources/Maps/" + folder + "/" + name + ".txt") as instancesFile:
+                                for line in instancesFile.readlines():
+                                        if line.strip() and not line.strip().isspace():
+                                                data = line.strip().split(',')
+                                                if keep(data[0]):
+                                                        if data[0] not in ids:
+                                                                ids[data[0]] = len(names)
+                                                                names.append(data[0])
+                                                        rows.append((ids[data[0]], int(data[1]), int(data[2])))
+                        return rows
+
+                hitboxes = []
+                with open("Resources/Maps/Hitboxes/" + name + ".txt") as hitboxFile:
+                        for line in hitboxFile.readlines():
+                                if line.strip() and not line.strip().isspace():
+                                        data = line.split(',')
+                                        hitboxes.append((int(data[0]), int(data[1]), int(data[2]), int(data[3])))
+                hitboxes.append((0, -1000, size[0], 1000)) # Bords haut, bas, gauche et droit de la map
+                hitboxes.append((0, size[1], size[0], 1000))
+                hitboxes.append((-1000, -1000, 1000, size[1] + 2000))
+                hitboxes.append((size[0], -1000, 1000, size[1] + 2000))
+                obstacles = instances("Obstacles", lambda x: x in obstacleHitboxes)
+                for nameId, x, y in obstacles: # Hitboxes des obstacles placés
+                        hitbox = obstacleHitboxes[names[nameId]]
+                        hitboxes.append((hitbox[0] + x, hitbox[1] + y, hitbox[2], hitbox[3]))
+                items = instances("Items")
+                enemies = instances("Enemies")
+
+                namesBlob = b"".join(bytes([len(x.encode("utf-8"))]) + x.encode("utf-8") for x in names)
+                os.makedirs(cls.folder, exist_ok = True)
+                with open(cls.folder + name + ".bin", "wb") as bundleFile:
+                        bundleFile.write(cls.header.pack(cls.magic, size[0], size[1], len(names), len(namesBlob), len(hitboxes), len(obstacles), len(items), len(enemies)))
+                        bundleFile.write(namesBlob + b"\0" * ((4 - len(namesBlob) % 4) % 4))
+                        for rows, columns in ((hitboxes, 4), (obstacles, 3), (items, 3), (enemies, 3)):
+                                bundleFile.write(np.array(rows, dtype = np.int32).reshape(-1, columns).tobytes())
+
+        def instances(self, table, prototypes): # Associe chaque ligne d'une table d'instances au prototype de même nom. Les noms inconnus sont ignorés
+                byName = {}
+                for prototype in reversed(prototypes): # Le premier prototype portant un nom est prioritaire, comme lors de la recherche linéaire
+                        byName[prototype.name] = prototype
+                resolved = [byName.get(x) for x in self.names]
+                return [(resolved[nameId], x, y) for nameId, x, y in table.tolist() if resolved[nameId]]
 
 
 class Map: # Définis une carte jouable
         def __init__(self, name, screen, items, obstacles, spawnCoords, enemies):
                 self.name = name
                 self.screen = screen # La fenètre principale
-                self.sprite = pygame.image.load("Resources/Maps/Sprites/" + self.name + ".png").convert() # Charge l'image de fond d'écran
+                self.bundle = MapBundle.load(name) # Hitboxes et instances de la map, compilées à partir des fichiers texte
+                self.sprite = assets.load("Resources/Maps/Sprites/" + self.name + ".png", False) # Charge l'image de fond d'écran
                 self.size = self.sprite.get_size() # Définis la taille de la map à partir de l'image de fond d'écran
                 self.rect = self.sprite.get_rect()
                 self.spawnCoords = spawnCoords
                 self.items = [] # Liste de tous les items de la map
                 self.appendItems(items)
-                self.hitboxes = [] # Récupère les hitbox de cette map
-                with open("Resources/Maps/Hitboxes/" + self.name + ".txt") as hitboxFile:
-                        for line in hitboxFile.readlines():
-                                if line.strip() and not line.strip().isspace():
-                                        data = line.split(',')
-                                        self.hitboxes.append(Hitbox((int(data[0]), int(data[1])), (int(data[2]), int(data[3]))))
-                self.hitboxes.append(Hitbox((0, -1000), (self.size[0], 1000))) # Place une hitbox délimitant le bord haut de la map
-                self.hitboxes.append(Hitbox((0, self.size[1]), (self.size[0], 1000))) # Place une hitbox délimitant le bord bas de la map
-                self.hitboxes.append(Hitbox((-1000, -1000), (1000, self.size[1] + 2000))) # Place une hitbox délimitant le bord gauche de la map
-                self.hitboxes.append(Hitbox((self.size[0], -1000), (1000, self.size[1] + 2000))) # Place une hitbox délimitant le bord droit de la map
-
-                self.obstacles = [] # Récupère les obstacles de cette map
-                with open("Resources/Maps/Obstacles/" + self.name + ".txt") as obstaclesFile: # Récupère les obstacles pour cette map
-                        for line in obstaclesFile.readlines():
-                                if line.strip() and not line.strip().isspace():
-                                        data = line.strip().split(',')
-                                        for obstacle in obstacles: # Retrouve l'obstacle grâce au nom
-                                                if obstacle.name == data[0]:
-                                                        temp = copy.deepcopy(obstacle) # Recrée l'obstacle dans une nouvelle variable afin de pouvoir le modifier sans modifier l'original
-                                                        temp.rect.move_ip(int(data[1]), int(data[2])) # Change les coordonnées de la copie de l'obstacle aux coordonnées définies
-                                                        self.obstacles.append(temp)
-                                                        self.hitboxes.append(Hitbox((temp.hitbox.rect.left + temp.rect.left, temp.hitbox.rect.top + temp.rect.top), temp.hitbox.rect.size)) # Ajoute aux hitbox de la map celle correspondant à cette obstacle. Les coordonnées sont définie par la hitbox au sein de l'obstacle et par l'emplacement de l'obstacle
-                                                        break
-                self.objectifObject = copy.deepcopy(next(x for x in obstacles if x.name == "objectif")) # L'objet objectif que le joueur doit trouver
+                self.hitboxHash = SpatialHash() # Index spatial des hitboxes, calculé une seule fois et mis à jour par le placeur d'objets
+                self.obstacleHash = SpatialHash() # Index spatial des obstacles fixes
+                self.hitboxes = [Hitbox((x, y), (w, h)) for x, y, w, h in self.bundle.hitboxes.tolist()] # Hitboxes de cette map, bords de la map et hitboxes des obstacles comprises
+
+                self.obstacles = [] # Obstacles de cette map
+                for obstacle, x, y in self.bundle.instances(self.bundle.obstacles, obstacles):
+                        temp = obstacle.spawn((x, y)) # Instance de l'obstacle aux coordonnées définies
+                        self.obstacles.append(temp)
+                        self.obstacleHash.insert(temp)
+                for hitbox in self.hitboxes:
+                        self.hitboxHash.insert(hitbox)
+                self.enemyHash = SpatialHash() # Index spatiaux des objets qui bougent, recalculés à chaque tick par updateDynamicHashes()
+                self.itemHash = SpatialHash()
+                self.areaEffects = AreaEffects(self) # Explosions des explosifs posés par les joueurs
+                self.perception = Perception() # Joueurs indexés pour la recherche du joueur visible le plus proche
+                self.pathScheduler = PathScheduler() # Recherches de chemin des ennemis, limitées à un budget de temps par tick
+                boxes = self.bundle.hitboxes[(self.bundle.hitboxes[:, 2] > 0) & (self.bundle.hitboxes[:, 3] > 0)].astype(float)
+                self.hitboxArray = np.column_stack((boxes[:, :2], boxes[:, :2] + boxes[:, 2:])) # Coordonnées (gauche, haut, droite, bas) de toutes les hitboxes, pour les tests de collision groupés
+                self.chunkSize = 512 # Taille en pixels des morceaux pré-dessinés de la map
+                self.chunks = {} # Morceaux pré-dessinés, indexés par (colonne, ligne, couche). Couches: "décor" (fond et obstacles fixes), "hitboxes" (affichage de debug)
+                self.useChunks = True # Si faux, le fond et tous les obstacles sont redessinés à chaque image
+                self.objectifObject = next(x for x in obstacles if x.name == "objectif").spawn() # L'objet objectif que le joueur doit trouver
                 self.randomObjectifCoords() # Où se trouve l'objectif à atteindre
                 self.obstacles.append(self.objectifObject)
+                self.renderList = RenderList([x for x in self.obstacles if x is not self.objectifObject]) # Ordre d'affichage des objets. L'objectif se déplace, il est rangé avec les objets qui bougent
                 self.objectToPlace = (obstacles[0], (0, 0))
                 self.objects = ["hitbox", "delete"] + obstacles + items
+                self.navGrids = {} # Grilles de marche de la map, une par précision de recherche des ennemis
+                self.clusterGraphs = {} # Graphes hiérarchiques des grilles de marche, pour les longs trajets
+                self.pathScheduler.clusterGraphs = self.clusterGraphs
+                self.flowFields = {} # Champs de distances vers chaque joueur, un par joueur et par grille de marche
+                self.pursuitMode = "auto" # "pathfinding": chaque ennemis cherche son chemin, "flowfield": les ennemis suivent un champ de distances partagé, "auto": champ de distances à partir de flowFieldThreshold ennemis
+                self.flowFieldThreshold = 20
+                self.replanning = True # Si vrai, chaque ennemis répare son chemin quand le joueur poursuivi bouge (DStarLite) au lieu de le chercher à nouveau
                 self.enemies = [] # Liste des ennemis de cette map
+                self.enemyBatch = EnemyBatch() # Déplace tous les ennemis ensemble
+                self.batchEnemies = True # Si faux, chaque ennemis se déplace séparément avec Enemy.move()
                 self.appendEnemies(enemies)
                 self.players = [] # Liste des joueurs de la map
+                self.updateDynamicHashes()
                 self.clickedOnce = False # Pour le placeur d'hitbox. Indique si le joueur a déja indiqué les coordonnées de la nouvelle hitbox
                 self.tempObjectIndex = 2 # Index pour selectionner l'objet à placer
 
         def appendEnemies(self, enemies):
-                with open("Resources/Maps/Enemies/" + self.name + ".txt") as enemiesFile:
-                        for line in enemiesFile.readlines():
-                                if line.strip() and not line.strip().isspace():
-                                        data = line.strip().split(',')
-                                        for enemy in enemies: # Retrouve l'ennemis grâce au nom
-                                                if enemy.name == data[0]:
-                                                        temp = copy.deepcopy(enemy) # Recrée l'ennemis dans une nouvelle variable afin de pouvoir le modifier sans modifier l'original
-                                                        temp.rect.move_ip(int(data[1]), int(data[2])) # Change les coordonnées de la copie de l'ennemis aux coordonnées définies
-                                                        temp.fCoords = temp.rect.center
-                                                        temp.map = self
-                                                        temp.pathFinder = PathFinder(self.hitboxes, max(temp.rect.width, temp.rect.height), temp.viewingRadius)
-                                                        self.enemies.append(temp)
-                                                        break
+                for enemy, x, y in self.bundle.instances(self.bundle.enemies, enemies):
+                        self.enemies.append(enemy.spawn((x, y), self)) # Instance de l'ennemis aux coordonnées définies
                 self.objects += enemies    
 
         def appendItems(self, items):
-                        with open("Resources/Maps/Items/" + self.name + ".txt") as itemsFile: # Récupère et assigne les items pour cette map
-                                for line in itemsFile.readlines():
-                                        if line.strip() and not line.strip().isspace():
-                                                data = line.strip().split(',')
-                                                for item in items: # Retrouve l'items grâce au nom
-                                                        if item.name == data[0]:
-                                                                temp = copy.deepcopy(item) # Recrée l'item dans une nouvelle variable afin de pouvoir le modifier sans modifier l'original
-                                                                temp.rect.move_ip(int(data[1]), int(data[2])) # Change les coordonnées de la copie de l'item aux coordonnées définies
-                                                                self.items.append(temp)
-                                                                break           
+                for item, x, y in self.bundle.instances(self.bundle.items, items):
+                        self.items.append(item.spawn((x, y))) # Instance de l'item aux coordonnées définies
+
+        def getNavGrid(self, precision): # Retourne la grille de marche correspondant à une précision, en la calculant la première fois
+                if precision not in self.navGrids:
+                        self.navGrids[precision] = NavGrid(self.size, precision, self.hitboxes)
+                return self.navGrids[precision]
+
+        def getClusterGraph(self, navGrid): # Retourne le graphe hiérarchique d'une grille de marche, en le calculant la première fois
+                if navGrid.precision not in self.clusterGraphs:
+                        self.clusterGraphs[navGrid.precision] = ClusterGraph(navGrid)
+                return self.clusterGraphs[navGrid.precision]
+
+        def newPathFinder(self, enemy): # Chercheur de chemin d'un ennemis, sur la grille de marche correspondant à sa taille
+                navGrid = self.getNavGrid(max(enemy.rect.width, enemy.rect.height))
+                pathFinder = PathFinder(navGrid, enemy.viewingRadius, self.getClusterGraph(navGrid))
+                if self.replanning:
+                        pathFinder.planner = DStarLite(navGrid, enemy.viewingRadius / 6, self.pathScheduler.replanning) # Même limite de nodes que la recherche A*
+                return pathFinder
+
+        def usesFlowField(self): # Indique si les ennemis doivent suivre les champs de distances pour poursuivre les joueurs
+                return self.pursuitMode == "flowfield" or (self.pursuitMode == "auto" and len(self.enemies) >= self.flowFieldThreshold)
+
+        def getFlowField(self, player, navGrid, maxDistance): # Retourne le champ de distances vers un joueur, recalculé seulement si le joueur a changé de cellule
+                key = (id(player), navGrid.precision)
+                flowField = self.flowFields.get(key)
+                if not flowField or flowField.navGrid is not navGrid:
+                        flowField = FlowField(navGrid, maxDistance)
+                        self.flowFields[key] = flowField
+                elif maxDistance > flowField.maxDistance: # Un ennemis voit plus loin que les autres: le champ doit être étendu
+                        flowField.maxDistance = maxDistance
+                        flowField.origin = None
+                flowField.update(player.rect.center)
+                return flowField
+
+        def getHitboxArray(self): # Retourne les hitboxes sous forme de tableau NumPy, recalculé seulement après une modification des hitboxes
+                if self.hitboxArray is None:
+                        self.hitboxArray = np.array([(x.rect.left, x.rect.top, x.rect.right, x.rect.bottom) for x in self.hitboxes if x.rect.width > 0 and x.rect.height > 0], dtype = float).reshape(-1, 4)
+                return self.hitboxArray
+
+        def addHitbox(self, hitbox): # Ajoute une hitbox à la map et met à jour les cellules concernées des grilles de marche
+                self.hitboxes.append(hitbox)
+                self.hitboxHash.insert(hitbox)
+                self.hitboxArray = None
+                self.invalidateChunks(hitbox.rect, "hitboxes")
+                for navGrid in self.navGrids.values():
+                        navGrid.addHitbox(hitbox.rect)
+                for clusterGraph in self.clusterGraphs.values():
+                        clusterGraph.update(hitbox.rect)
+
+        def removeHitbox(self, hitbox): # Enlève une hitbox de la map et met à jour les cellules concernées des grilles de marche
+                self.hitboxes.remove(hitbox)
+                self.hitboxHash.remove(hitbox)
+                self.hitboxArray = None
+                self.invalidateChunks(hitbox.rect, "hitboxes")
+                for navGrid in self.navGrids.values():
+                        navGrid.removeHitbox(hitbox.rect)
+                for clusterGraph in self.clusterGraphs.values():
+                        clusterGraph.update(hitbox.rect)
 
         def reset(self, enemies, items, resetPlayer):
+                self.bundle = MapBundle.load(self.name) # Recompile la map si le placeur d'objets a modifié ses fichiers
                 self.enemies = []
+                self.pathScheduler = PathScheduler(self.pathScheduler.budget, self.pathScheduler.workers) # Oublie les recherches des anciens ennemis
+                self.pathScheduler.clusterGraphs = self.clusterGraphs
                 self.appendEnemies(enemies)
                 self.items = []
                 self.appendItems(items)
+                self.areaEffects = AreaEffects(self)
                 if resetPlayer:
                         for player in self.players:
                                 player.rect.topleft = self.spawnCoords
+                self.updateDynamicHashes()
+
+        def updateRenderList(self): # Retrie les objets qui bougent avant l'affichage
+                self.renderList.update(self.items, [self.objectifObject], self.enemies)
+
+        def updateDynamicHashes(self): # Réindexe les ennemis et les items. Appelé une fois par tick
+                self.enemyHash.rebuild(self.enemies)
+                self.itemHash.rebuild(self.items)
 
         def draw(self, screenRect, widthSmaller, heightSmaller): # Charge la map
                 chosenX = 0 # Le côté gauche de la map
@@ -263,30 +852,68 @@ class Map: # Définis une carte jouable
                         chosenYs = 0
                 self.screen.blit(self.sprite, (chosenX, chosenY), pygame.Rect((chosenXs, chosenYs), screenRect.size)) # Affiche l'image de la map sur l'écran en prenant en compte si la map est plus petite que l'écran ou pas
 
+        def getChunk(self, column, row, layer): # Retourne un morceau pré-dessiné de la map, en le dessinant la première fois
+                key = (column, row, layer)
+                chunk = self.chunks.get(key)
+                if chunk is None:
+                        rect = pygame.Rect(column * self.chunkSize, row * self.chunkSize, self.chunkSize, self.chunkSize).clip(self.rect)
+                        if layer == "décor":
+                                chunk = pygame.Surface(rect.size).convert()
+                                chunk.blit(self.sprite, (0, 0), rect)
+                                inChunk = set(self.obstacleHash.queryRect(rect))
+                                for obstacle in sorted([x for x in self.obstacles if x in inChunk and x is not self.objectifObject], key = lambda x: x.rect.bottom): # Même ordre que l'affichage des objets. L'objectif se déplace, il n'est pas pré-dessiné
+                                        obstacle.draw((obstacle.rect.x - rect.x, obstacle.rect.y - rect.y), chunk)
+                        else:
+                                chunk = pygame.Surface(rect.size, pygame.SRCALPHA)
+                                for hitbox in self.hitboxHash.queryRect(rect):
+                                        hitbox.draw((hitbox.rect.x - rect.x, hitbox.rect.y - rect.y), chunk)
+                        self.chunks[key] = chunk
+                return chunk
+
+        def invalidateChunks(self, rect, layer = None): # Oublie les morceaux touchant un rectangle de la map, pour une couche ou pour toutes
+                for key in [x for x in self.chunks if (layer is None or x[2] == layer) and rect.colliderect((x[0] * self.chunkSize, x[1] * self.chunkSize, self.chunkSize, self.chunkSize))]:
+                        del self.chunks[key]
+
+        def drawChunks(self, surface, screenRect, widthSmaller, heightSmaller, layer = "décor"): # Dessine les morceaux pré-dessinés visibles, placés comme le ferait draw()
+                offsetX = int(screenRect.width / 2 - self.size[0] / 2) if widthSmaller else -screenRect.x # Coordonnées écran du coin haut gauche de la map
+                offsetY = int(screenRect.height / 2 - self.size[1] / 2) if heightSmaller else -screenRect.y
+                visible = pygame.Rect(-offsetX, -offsetY, screenRect.width, screenRect.height).clip(self.rect) # Partie visible de la map
+                for row in range(visible.top // self.chunkSize, (visible.bottom - 1) // self.chunkSize + 1):
+                        for column in range(visible.left // self.chunkSize, (visible.right - 1) // self.chunkSize + 1):
+                                surface.blit(self.getChunk(column, row, layer), (column * self.chunkSize + offsetX, row * self.chunkSize + offsetY))
+
         def mod(self, backgroundNumber): # Met à jour l'image de la map sans avoir a créer une nouvelle instance de cette classe
-                self.sprite = pygame.image.load("Resources/Maps/Sprites/" + self.backgroundPath + str(backgroundNumber) + ".png")
+                self.sprite = assets.load("Resources/Maps/Sprites/" + self.backgroundPath + str(backgroundNumber) + ".png", False)
+                self.chunks = {}
                 self.screen.blit(self.sprite, (0, 0))
 
-        def drawObjects(self, objects, screenRect, isTransparent = False, alphaSurface = None): # Calcul les coordonnés écran d'une liste d'objets devant suivre une syntaxe stricte
+        def drawObjects(self, objects, screenRect, isTransparent = False, alphaSurface = None, renderRects = None): # Calcul les coordonnés écran d'une liste d'objets devant suivre une syntaxe stricte. renderRects: positions interpolées à utiliser à la place de obj.rect, indexées par id(obj)
                 if objects: # Vérifie que la liste donnée n'est pas vide
                         for obj in objects:
-                                if screenRect.colliderect(obj.rect): # Sélectionne tout les objets en collision avec le rectangle de l'écran, c'est à dire ceux qui devont être affiché
+                                rect = renderRects.get(id(obj), obj.rect) if renderRects else obj.rect
+                                if screenRect.colliderect(rect): # Sélectionne tout les objets en collision avec le rectangle de l'écran, c'est à dire ceux qui devont être affiché
                                         if isTransparent:
-                                                obj.draw((obj.rect.x - screenRect.x, obj.rect.y - screenRect.y), alphaSurface) # Place les objets à déssiner sur leurs emplacements écran
+                                                obj.draw((rect.x - screenRect.x, rect.y - screenRect.y), alphaSurface) # Place les objets à déssiner sur leurs emplacements écran
                                         else:
-                                                obj.draw((obj.rect.x - screenRect.x, obj.rect.y - screenRect.y), self.screen) # Place les objets à déssiner sur leurs emplacements écran
+                                                obj.draw((rect.x - screenRect.x, rect.y - screenRect.y), self.screen) # Place les objets à déssiner sur leurs emplacements écran
 
-        def moveEnemies(self, lastFPS):
-                for enemy in self.enemies:
-                        enemy.move(lastFPS)
+        def moveEnemies(self, tickRate): # Déplace les ennemis d'un tick de simulation
+                self.perception.update(self.players)
+                if self.batchEnemies:
+                        self.enemyBatch.step(self, tickRate)
+                else:
+                        for enemy in self.enemies:
+                                enemy.move(tickRate)
+                self.pathScheduler.run() # Avance les recherches demandées par les ennemis
+                self.enemyHash.rebuild(self.enemies) # Les ennemis ont bougé
 
         def randomObjectifCoords(self):
                 oldCoords = self.objectifObject.rect.topleft
-                while self.objectifObject.rect.topleft == oldCoords or self.objectifObject.rect.collidelist([x.rect for x in self.obstacles if x.name != "objectif"] + [x.rect for x in self.hitboxes]) != -1:
+                while self.objectifObject.rect.topleft == oldCoords or self.hitboxHash.collideRect(self.objectifObject.rect) or any(x.name != "objectif" for x in self.obstacleHash.queryRect(self.objectifObject.rect)):
                         self.objectifObject.rect.topleft = (random.randint(0, self.size[0]), random.randint(0, self.size[1]))
 
         def objectPlacer(self, action, screenRect):
-                screenMouseCoords = pygame.mouse.get_pos() #on obtient les coordonées de la souris
+                screenMouseCoords = controls.mousePos() #on obtient les coordonées de la souris
                 realMouseCoords = (screenMouseCoords[0] + screenRect.topleft[0], screenMouseCoords[1] + screenRect.topleft[1]) #on obtient les coordonnées réelles du curseur (pas dans le repère de la map)
                 if action == "update": # Seulement modifier l'emplacement de l'objet à placer 
                         if type(self.objectToPlace[0]) is pygame.Rect: # S'il s'agit d'une hitbox
@@ -319,7 +946,7 @@ class Map: # Définis une carte jouable
                 elif action == "place": # Place l'objet choisit aux coordonnées choisit
                         if type(self.objectToPlace[0]) is pygame.Rect: # S'il faut placer une hitbox
                                 if self.clickedOnce: # Sil'utilisateur a déjà cliqué une deuxième fois
-                                        self.hitboxes.append(Hitbox(self.objectToPlace[0].topleft, self.objectToPlace[0].size)) # Ajoute l'objet a la map
+                                        self.addHitbox(Hitbox(self.objectToPlace[0].topleft, self.objectToPlace[0].size)) # Ajoute l'objet a la map
                                         with open("Resources/Maps/Hitboxes/" + self.name + ".txt", "a") as hitboxesFile:
                                                 hitboxesFile.write("\n" + str(self.objectToPlace[0].x) + "," + str(self.objectToPlace[0].y) + "," + str(self.objectToPlace[0].w) + "," + str(self.objectToPlace[0].h)) # Ajoute l'objet aux fichier obstacles de la map
                                         self.clickedOnce = False
@@ -336,12 +963,15 @@ class Map: # Définis une carte jouable
                                                 tempListName = "Items"
                                         elif type(tempObjects[obj]) is Obstacle:
                                                 self.obstacles.remove(tempObjects[obj])
+                                                self.obstacleHash.remove(tempObjects[obj])
+                                                self.renderList.removeStatic(tempObjects[obj])
+                                                self.invalidateChunks(tempObjects[obj].rect, "décor")
                                                 tempListName = "Obstacles"
                                         elif type(tempObjects[obj]) is Enemy:
                                                 self.enemies.remove(tempObjects[obj])
                                                 tempListName = "Enemies"
                                         elif type(tempObjects[obj]) is Hitbox:
-                                                self.hitboxes.remove(tempObjects[obj])
+                                                self.removeHitbox(tempObjects[obj])
                                                 tempListName = "Hitboxes"
                                         with open("Resources/Maps/" + tempListName +"/" + self.name + ".txt", "r+") as obstaclesFile:
                                                 lines = obstaclesFile.read().split('\n')
@@ -356,12 +986,15 @@ class Map: # Définis une carte jouable
                                                                         obstaclesFile.write(line + '\n')
 
                         else:
-                                tempObj = copy.deepcopy(self.objectToPlace[0]) # Copie l'objet pour éviter de modifier l'original
+                                tempObj = self.objectToPlace[0].spawn() # Nouvelle instance de l'objet, l'original n'est pas modifié
                                 tempObj.rect.move_ip((realMouseCoords[0] - self.objectToPlace[0].rect.width / 2, realMouseCoords[1] - self.objectToPlace[0].rect.height / 2)) # Change les coordonnées de l'objet à celle choisit
                                 
                                 if type(tempObj) is Obstacle: # Si l'objet est un obstacle
                                         self.obstacles.append(tempObj) # Ajoute l'objet à la map
-                                        self.hitboxes.append(Hitbox((tempObj.hitbox.rect.left + tempObj.rect.left, tempObj.hitbox.rect.top + tempObj.rect.top), tempObj.hitbox.rect.size)) # Ajoute aux hitbox de la map celle correspondant à cette obstacle. Les coordonnées sont définie par la hitbox au sein de l'obstacle et par l'emplacement de l'obstacle
+                                        self.obstacleHash.insert(tempObj)
+                                        self.renderList.addStatic(tempObj)
+                                        self.invalidateChunks(tempObj.rect, "décor")
+                                        self.addHitbox(Hitbox((tempObj.hitbox.rect.left + tempObj.rect.left, tempObj.hitbox.rect.top + tempObj.rect.top), tempObj.hitbox.rect.size)) # Ajoute aux hitbox de la map celle correspondant à cette obstacle. Les coordonnées sont définie par la hitbox au sein de l'obstacle et par l'emplacement de l'obstacle
                                         with open("Resources/Maps/Obstacles/" + self.name + ".txt", "a+") as obstaclesFile:
                                                 obstaclesFile.write("\n" + tempObj.name + ',' + str(tempObj.rect.x) + ',' + str(tempObj.rect.y)) # Ajoute l'objet aux fichier obstacles de la map    
                                 elif type(tempObj) is Item: # Si l'objet est un item
@@ -370,56 +1003,135 @@ class Map: # Définis une carte jouable
                                                 itemsFile.write("\n" + tempObj.name + ',' + str(tempObj.rect.x) + ',' + str(tempObj.rect.y)) # Ajoute l'objet aux fichier items de la map    
                                 elif type(tempObj) is Enemy: # Si l'objet est un ennemis
                                         tempObj.map = self
-                                        tempObj.pathFinder = PathFinder(self.hitboxes, max(tempObj.rect.width, tempObj.rect.height), tempObj.viewingRadius)
+                                        tempObj.pathFinder = self.newPathFinder(tempObj)
                                         self.enemies.append(tempObj) # Ajoute l'objet à la map     
                                         with open("Resources/Maps/Enemies/" + self.name + ".txt", "a+") as enemiesFile:
                                                 enemiesFile.write("\n" + tempObj.name + ',' + str(tempObj.rect.x) + ',' + str(tempObj.rect.y)) # Ajoute l'objet aux fichier ennemis de la map  
 
                               
+class MapDescriptor: # Map déclarée dans Resources/Maps/Data.txt, qui n'est réellement chargée que lorsqu'elle est jouée ou préchargée
+        thumbnailWidth = 320 # Largeur des miniatures affichées dans le menu des options
+
+        def __init__(self, name, spawnCoords):
+                self.name = name
+                self.spawnCoords = spawnCoords
+                self.spritePath = "Resources/Maps/Sprites/" + name + ".png"
+                self.sprite = self.loadThumbnail() # Miniature, utilisée par les listes du menu à la place de l'image de la map
+                self.rect = self.sprite.get_rect()
+                self.map = None # La Map une fois chargée
+                self.prefetchThread = None
+                self.decoded = None # Image de la map décodée par le préchargement, pas encore convertie pour l'écran
+                self.wanted = False # Faux si la map a été oubliée pendant son préchargement
+
+        def loadThumbnail(self): # Charge la miniature de la map, en la créant si l'image de la map est plus récente
+                path = MapBundle.folder + self.name + ".png"
+                if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(self.spritePath):
+                        sprite = pygame.image.load(self.spritePath)
+                        os.makedirs(MapBundle.folder, exist_ok = True)
+                        pygame.image.save(pygame.transform.smoothscale(sprite.convert(), (self.thumbnailWidth, round(self.thumbnailWidth * sprite.get_height() / sprite.get_width()))), path)
+                return assets.load(path, False)
+
+        def prefetch(self): # Décode l'image de la map et sa version compilée dans un thread, pour que materialize() soit immédiat
+                self.wanted = True
+                if self.map or (self.prefetchThread and self.prefetchThread.is_alive()):
+                        return
+                self.prefetchThread = threading.Thread(target = self.__prefetch, daemon = True)
+                self.prefetchThread.start()
+
+        def __prefetch(self): # Exécuté dans le thread de préchargement. convert() lit le format de l'écran et ne peut être appelé que depuis le thread principal
+                MapBundle.load(self.name)
+                decoded = pygame.image.load(self.spritePath)
+                if self.wanted: # La map a pu être oubliée pendant le chargement
+                        self.decoded = decoded
+
+        def materialize(self, screen, items, obstacles, enemies): # Retourne la Map, en la créant si besoin
+                self.wanted = True
+                if self.prefetchThread:
+                        self.prefetchThread.join() # Attend la fin du préchargement plutôt que de charger l'image une deuxième fois
+                        self.prefetchThread = None
+                if self.decoded:
+                        if not self.map:
+                                assets.store(self.spritePath, self.decoded.convert(), False)
+                        self.decoded = None
+                if not self.map:
+                        self.map = Map(self.name, screen, items, obstacles, self.spawnCoords, enemies)
+                return self.map
+
+        def evict(self): # Oublie la map et son image
+                self.wanted = False
+                if self.map and self.map.pathScheduler.workers: # Les grilles de la map ne servent plus aux processus de recherche
+                        self.map.pathScheduler.workers.release(self.map.navGrids.values())
+                self.map = None
+                self.decoded = None
+                assets.discard(self.spritePath)
+
+
+class AnimationAtlas: # Charge une seule fois toutes les images d'animation d'un personnage ou d'un ennemis, indexées par leur suffixe ("FrontIdle0", "BackWalk1"...)
+        def __init__(self, folder, name):
+                self.name = name
+                self.frames = {} # Images de l'animation indexées par suffixe
+                startTime = time.perf_counter()
+                for fileName in sorted(os.listdir(folder)):
+                        suffix = fileName[len(name):-len(".png")]
+                        if fileName.startswith(name) and fileName.endswith(".png") and suffix[:1].isupper(): # Le suffixe commence par la direction en majuscule, ce qui évite de confondre "hero" et "heroine"
+                                self.frames[suffix] = assets.load(os.path.join(folder, fileName))
+                self.loadTime = time.perf_counter() - startTime # Temps de chargement en secondes
+                self.memory = sum(frame.get_pitch() * frame.get_height() for frame in self.frames.values()) # Mémoire occupée par les images en octets
+
+        def get(self, suffix): # Retourne l'image correspondant au suffixe
+                return self.frames[suffix]
+
+        def report(self): # Décrit le contenu de l'atlas, son temps de chargement et sa mémoire
+                return "{}: {} images chargées en {:.1f} ms, {:.1f} Ko".format(self.name, len(self.frames), self.loadTime * 1000, self.memory / 1024)
+
+
 class Perso:
         def __init__(self, name, fenetre, speed, maxItems, maxHealth, items):
                 self.name = name
                 self.fenetre = fenetre
-                self.sprite = pygame.image.load("Resources/Persos/Sprites/" + name + "FrontIdle0.png").convert_alpha()
+                self.animations = AnimationAtlas("Resources/Persos/Sprites/", name) # Toutes les images d'animation du personnage
+                self.sprite = self.animations.get("FrontIdle0")
                 self.rect = self.sprite.get_rect() # Définis l'image du personnage comme un rectangle
                 self.speed = speed # Vitesse de déplacement du personnage selon le choix du joueur
                 self.maxItems = maxItems # Taille de l'inventaire
                 self.map = None # Map dans laquelle on se trouve
                 self.health = maxHealth # Met le nombre de points de vie de départ au maximum
                 self.maxhealth = maxHealth # Points de vie maximum que le perso peut avoir
-                self.ammoObject = copy.deepcopy(next(x for x in items if x.name == "Ammo"))
+                self.ammoObject = next(x for x in items if x.name == "Ammo").spawn()
                 self.items = [self.ammoObject]
-                self.bullets = []
+                self.bullets = BulletSystem() # Les balles tirées par le personnage
                 self.score = 0
 
-        def draw(self, screenRect, animationSuffix):
-                self.sprite = pygame.image.load("Resources/Persos/Sprites/" + self.name + animationSuffix + ".png").convert_alpha()
+        def draw(self, screenRect, animationSuffix, rect = None): # rect: position à afficher si elle diffère de la position de simulation (interpolation)
+                self.sprite = self.animations.get(animationSuffix)
+                if rect is None:
+                        rect = self.rect
                 chosenX = screenRect.w / 2 # Coordonnée X du joueur au centre de l'écran
                 chosenY = screenRect.h / 2 # Coordonnée Y du joueur au centre de l'écran
 
                 if screenRect.x <= 0 or screenRect.right == self.map.size[0]: # L'écran se trouve collé contre le bord droit ou gauche
-                        chosenX = self.rect.x - screenRect.x # Coordonnée X écran du joueur
+                        chosenX = rect.x - screenRect.x # Coordonnée X écran du joueur
                 if screenRect.y <= 0 or screenRect.bottom == self.map.size[1]: # L'écran se trouve collé contre le bord haut ou bas
-                        chosenY = self.rect.y - screenRect.y # Coordonnée Y écran du joueur
+                        chosenY = rect.y - screenRect.y # Coordonnée Y écran du joueur
                 self.fenetre.blit(self.sprite, (chosenX, chosenY)) # Affiche l'image du personnage aux coordonnées écran
 
-        def mouv(self, action, screenRect, selectedItem = 0, lastFPS = 60):
-                tempSpeed = self.speed + ((100 - (lastFPS * 100 / 60)) * self.speed / 100) # Ajuste la vitesse du perso par rapport au lag
+        def mouv(self, action, screenRect, selectedItem = 0, tickRate = 60):
+                tempSpeed = self.speed * 60 / tickRate # La vitesse du perso est donnée pour 60 ticks de simulation par seconde
                 if action == "haut":
                         self.rect.move_ip(0, -tempSpeed) # déplace le perso vers le haut
-                        if pygame.Rect(self.rect.bottomleft, (self.rect.width, 0)).collidelist(self.map.hitboxes) != -1: # si le perso se trouve sur un hitbox
+                        if self.map.hitboxHash.collideRect(pygame.Rect(self.rect.bottomleft, (self.rect.width, 0))): # si le perso se trouve sur un hitbox
                                 self.rect.move_ip(0, tempSpeed) # Ramène le perso à la position précédente
                 if action == "bas":
                         self.rect.move_ip(0, tempSpeed) # déplace le perso vers le bas
-                        if pygame.Rect(self.rect.bottomleft, (self.rect.width, 0)).collidelist(self.map.hitboxes) != -1:
+                        if self.map.hitboxHash.collideRect(pygame.Rect(self.rect.bottomleft, (self.rect.width, 0))):
                                 self.rect.move_ip(0, -tempSpeed)
                 if action == "gauche":
                         self.rect.move_ip(-tempSpeed, 0) # déplace le perso vers la gauche
-                        if pygame.Rect(self.rect.bottomleft, (self.rect.width, 0)).collidelist(self.map.hitboxes) != -1:
+                        if self.map.hitboxHash.collideRect(pygame.Rect(self.rect.bottomleft, (self.rect.width, 0))):
                                 self.rect.move_ip(tempSpeed, 0)
                 if action == "droite":
                         self.rect.move_ip(tempSpeed, 0) # déplace le perso vers la droite
-                        if pygame.Rect(self.rect.bottomleft, (self.rect.width, 0)).collidelist(self.map.hitboxes) != -1:
+                        if self.map.hitboxHash.collideRect(pygame.Rect(self.rect.bottomleft, (self.rect.width, 0))):
                                 self.rect.move_ip(-tempSpeed, 0)
                 if action=="ramasser":
                         if len(self.items) <= self.maxItems: # Vérifie que le perso a encore de la place dans son inventaire
@@ -438,142 +1150,493 @@ class Perso:
                                                                 item.pickedUpOnce = True
                                                                 self.items.append(item)
 
+                                                        self.map.areaEffects.disarm(item) # Un explosif posé qui est ramassé ne peut plus exploser
                                                         self.map.items.remove(item) # Enlève l'item de la map
                                                         break # Sort de la boucle
                 if action == 'tirer':
                         if not self.items[selectedItem].name == "claymore" and not self.items[selectedItem].name == "Ammo" and self.ammoObject.value > 0:
-                                if self.items[selectedItem].characteristics.spread == True:
-                                        for n in range(3):
-                                                if self.ammoObject.value > 0:
-                                                        self.bullets.append(Bullet(self.map, self, self.fenetre, screenRect, self.items[selectedItem].characteristics, self.items[selectedItem]))
-                                                        self.ammoObject.value -= 1
-                                else:
-                                        self.bullets.append(Bullet(self.map, self, self.fenetre, screenRect, self.items[selectedItem].characteristics, self.items[selectedItem]))
-                                        self.ammoObject.value -= 1
+                                screenMouseCoords = controls.mousePos() #on obtient les coordonées de la souris
+                                realMouseCoords = (screenMouseCoords[0] + screenRect.topleft[0], screenMouseCoords[1] + screenRect.topleft[1]) #on obtient les coordonnées réelles du curseur (pas dans le repère de la map)
+                                for n in range(3 if self.items[selectedItem].characteristics.spread else 1): # Les armes à dispersion tirent trois balles à la fois
+                                        if self.ammoObject.value > 0:
+                                                self.bullets.fire(self.rect.center, realMouseCoords, self.items[selectedItem].characteristics, self.items[selectedItem].value)
+                                                self.ammoObject.value -= 1
 
-        def mouvBullets(self):
-            for n in self.bullets :
-                n.move()
-                if n.exist == False :
-                    self.bullets.remove(n)
+        def mouvBullets(self, tickRate = 60):
+                self.bullets.move(self.map, tickRate)
 
         def drawBullets(self, screenRect, screen) :
-            for n in self.bullets :
-                pygame.draw.rect(screen,pygame.Color("black"), n.rect.move((-screenRect[0],-screenRect[1])))
-
-
-class PathFinder: # Classe permettant de trouver le chemin le plus rapide entre deux points en tenant compte des obstacles
-        def __init__(self, hitboxes, precision, maxRadius):
+                self.bullets.draw(screenRect, screen)
+
+
+class NavGrid: # Grille de marche d'une map, calculée une seule fois à partir des hitboxes et partagée en lecture par les PathFinder des ennemis
+        def __init__(self, mapSize, precision, hitboxes):
+                self.precision = precision # Taille d'une cellule, égale à la précision de recherche des ennemis
+                self.width = math.ceil(mapSize[0] / precision) # Nombre de cellules en largeur
+                self.height = math.ceil(mapSize[1] / precision) # Nombre de cellules en hauteur
+                self.cells = array.array('H', bytes(2 * self.width * self.height)) # Nombre de hitboxes recouvrant chaque cellule. Une cellule est praticable si ce nombre est nul
+                self.version = 0 # Incrémenté à chaque modification, pour que les données calculées à partir de la grille sachent qu'elles sont périmées
+                self.changes = collections.deque(maxlen = 64) # (version, cellules modifiées) des dernières modifications, pour les recherches qui se réparent (voir DStarLite)
+                self.sharedMemory = None # Mémoire partagée contenant les cellules, une fois la grille publiée pour les processus de recherche
+                for hitbox in hitboxes:
+                        self.addHitbox(hitbox.rect)
+
+        def publish(self): # Copie les cellules dans une mémoire partagée. Les modifications suivantes de la grille y sont écrites directement
+                if self.sharedMemory is None:
+                        self.sharedMemory = multiprocessing.shared_memory.SharedMemory(create = True, size = 2 * len(self.cells))
+                        cells = self.sharedMemory.buf[:2 * len(self.cells)].cast('H')
+                        cells[:] = self.cells
+                        self.cells = cells
+                return self.sharedMemory.name
+
+        def unpublish(self): # Reprend une copie locale des cellules et libère la mémoire partagée
+                if self.sharedMemory is not None:
+                        cells = self.cells
+                        self.cells = array.array('H', cells)
+                        cells.release()
+                        self.sharedMemory.close()
+                        self.sharedMemory.unlink()
+                        self.sharedMemory = None
+
+        @classmethod
+        def attach(cls, name, size, precision): # Grille dont les cellules sont lues dans la mémoire partagée publiée par un autre processus
+                navGrid = cls.__new__(cls)
+                navGrid.precision = precision
+                navGrid.width, navGrid.height = size
+                navGrid.version = 0
+                navGrid.changes = collections.deque(maxlen = 64)
+                navGrid.sharedMemory = multiprocessing.shared_memory.SharedMemory(name)
+                navGrid.cells = navGrid.sharedMemory.buf[:2 * navGrid.width * navGrid.height].cast('H')
+                return navGrid
+
+        def __cellRange(self, rect): # Retourne les cellules (limites incluses) recouvertes par un rectangle, limitées à la grille
+                if rect.width <= 0 or rect.height <= 0:
+                        return None
+                left = max(0, rect.left // self.precision)
+                top = max(0, rect.top // self.precision)
+                right = min(self.width - 1, (rect.right - 1) // self.precision)
+                bottom = min(self.height - 1, (rect.bottom - 1) // self.precision)
+                if left > right or top > bottom:
+                        return None
+                return (left, top, right, bottom)
+
+        def __patch(self, rect, increment): # Met à jour seulement les cellules recouvertes par le rectangle
+                cellRange = self.__cellRange(rect)
+                if cellRange:
+                        self.version += 1
+                        self.changes.append((self.version, cellRange))
+                        for y in range(cellRange[1], cellRange[3] + 1):
+                                row = y * self.width
+                                for x in range(cellRange[0], cellRange[2] + 1):
+                                        self.cells[row + x] += increment
+
+        def addHitbox(self, rect):
+                self.__patch(rect, 1)
+
+        def removeHitbox(self, rect):
+                self.__patch(rect, -1)
+
+        def cellOf(self, point): # Retourne la cellule contenant un point
+                return (int(point[0] // self.precision), int(point[1] // self.precision))
+
+        def cellRect(self, cell): # Retourne le rectangle d'une cellule en coordonnées map
+                return pygame.Rect(cell[0] * self.precision, cell[1] * self.precision, self.precision, self.precision)
+
+        def isWalkable(self, cell): # Les cellules en dehors de la grille ne sont jamais praticables
+                return 0 <= cell[0] < self.width and 0 <= cell[1] < self.height and self.cells[cell[1] * self.width + cell[0]] == 0
+
+        def lineOfSight(self, start, end): # Vrai si le segment entre deux points ne traverse que des cellules praticables. Les cellules de départ et d'arrivée ne sont pas testées, comme pour la recherche de chemin
+                x, y = self.cellOf(start)
+                endX, endY = self.cellOf(end)
+                dx = end[0] - start[0]
+                dy = end[1] - start[1]
+                stepX = 1 if dx > 0 else -1
+                stepY = 1 if dy > 0 else -1
+                tMaxX = ((x + (stepX > 0)) * self.precision - start[0]) / dx if dx else math.inf # Avancement sur le segment (de 0 à 1) au prochain bord vertical de cellule
+                tMaxY = ((y + (stepY > 0)) * self.precision - start[1]) / dy if dy else math.inf
+                tDeltaX = self.precision / abs(dx) if dx else math.inf # Avancement nécessaire pour traverser une cellule
+                tDeltaY = self.precision / abs(dy) if dy else math.inf
+                for step in range(abs(endX - x) + abs(endY - y)): # Parcourt les cellules traversées, dans l'ordre (Amanatides et Woo)
+                        if tMaxX < tMaxY:
+                                x += stepX
+                                tMaxX += tDeltaX
+                        elif tMaxY < tMaxX:
+                                y += stepY
+                                tMaxY += tDeltaY
+                        else: # Le segment passe exactement par un coin: les deux cellules qui le touchent doivent être praticables
+                                if not self.isWalkable((x + stepX, y)) or not self.isWalkable((x, y + stepY)):
+                                        return False
+                                x += stepX
+                                y += stepY
+                                tMaxX += tDeltaX
+                                tMaxY += tDeltaY
+                        if x == endX and y == endY:
+                                return True
+                        if not self.isWalkable((x, y)):
+                                return False
+                return x == endX and y == endY
+
+
+class ClusterGraph: # Abstraction hiérarchique d'une grille de marche (HPA*): la grille est découpée en clusters reliés par des entrées, les longs trajets sont cherchés sur ce petit graphe
+        def __init__(self, navGrid, clusterSize = 10):
+                self.navGrid = navGrid
+                self.clusterSize = clusterSize # Taille d'un cluster en cellules
+                self.columns = math.ceil(navGrid.width / clusterSize)
+                self.rows = math.ceil(navGrid.height / clusterSize)
+                self.borders = {} # Entrées de chaque bord (cluster x, cluster y, "est" ou "sud"): liste de couples de cellules voisines de part et d'autre du bord
+                self.inter = collections.defaultdict(dict) # Arêtes entre clusters: cellule -> {cellule de l'autre côté: coût}
+                self.intra = {} # Arêtes dans chaque cluster, calculées à la première recherche qui le traverse: cluster -> {cellule d'entrée: {autre cellule d'entrée: coût}}
+                self.partial = {} # Arêtes des clusters dont le calcul a été interrompu par la fin du budget de temps, complétées au prochain appel
+                self.rebuilds = 0 # Nombre de clusters calculés depuis la création du graphe
+                self.cursor = 0 # Prochain cluster examiné par prepare()
+                for cluster in itertools.product(range(self.columns), range(self.rows)):
+                        for side in ("est", "sud"):
+                                self.__buildBorder((cluster[0], cluster[1], side))
+
+        def clusterOf(self, cell):
+                return (cell[0] // self.clusterSize, cell[1] // self.clusterSize)
+
+        def __clusterBounds(self, cluster): # Cellules (limites exclues à droite et en bas) d'un cluster
+                left = cluster[0] * self.clusterSize
+                top = cluster[1] * self.clusterSize
+                return (left, top, min(self.navGrid.width, left + self.clusterSize), min(self.navGrid.height, top + self.clusterSize))
+
+        def __buildBorder(self, key): # Cherche les entrées d'un bord: une au milieu des passages étroits, une à chaque extrémité des passages larges
+                for cellA, cellB in self.borders.get(key, ()):
+                        self.inter[cellA].pop(cellB, None)
+                        self.inter[cellB].pop(cellA, None)
+                left, top, right, bottom = self.__clusterBounds(key[:2])
+                if key[2] == "est":
+                        pairs = [((right - 1, y), (right, y)) for y in range(top, bottom)] if key[0] + 1 < self.columns else []
+                else:
+                        pairs = [((x, bottom - 1), (x, bottom)) for x in range(left, right)] if key[1] + 1 < self.rows else []
+                entrances = []
+                segment = []
+                for pair in pairs + [None]:
+                        if pair and self.navGrid.isWalkable(pair[0]) and self.navGrid.isWalkable(pair[1]):
+                                segment.append(pair)
+                        elif segment:
+                                entrances += [segment[len(segment) // 2]] if len(segment) < 6 else [segment[0], segment[-1]]
+                                segment = []
+                self.borders[key] = entrances
+                for cellA, cellB in entrances:
+                        self.inter[cellA][cellB] = self.navGrid.precision
+                        self.inter[cellB][cellA] = self.navGrid.precision
+
+        def entrances(self, cluster): # Cellules d'entrée d'un cluster, sur ses quatre bords
+                cells = set()
+                for key in ((cluster[0], cluster[1], "est"), (cluster[0], cluster[1], "sud"), (cluster[0] - 1, cluster[1], "est"), (cluster[0], cluster[1] - 1, "sud")):
+                        for pair in self.borders.get(key, ()):
+                                cells.update(x for x in pair if self.clusterOf(x) == cluster)
+                return cells
+
+        def distances(self, cluster, source): # Coût du plus court chemin depuis une cellule vers chaque cellule atteignable sans sortir du cluster (algorithme de Dijkstra)
+                left, top, right, bottom = self.__clusterBounds(cluster)
+                precision = self.navGrid.precision
+                diagonal = precision * math.sqrt(2)
+                cells = self.navGrid.cells # Lu directement: les limites du cluster sont toujours dans la grille
+                width = self.navGrid.width
+                distances = {source: 0}
+                openHeap = [(0, source)]
+                while openHeap:
+                        distance, cell = heapq.heappop(openHeap)
+                        if distance > distances[cell]:
+                                continue
+                        for offsetX, offsetY, cost in ((1, 0, precision), (-1, 0, precision), (0, -1, precision), (0, 1, precision), (1, -1, diagonal), (1, 1, diagonal), (-1, -1, diagonal), (-1, 1, diagonal)):
+                                x = cell[0] + offsetX
+                                y = cell[1] + offsetY
+                                if not (left <= x < right and top <= y < bottom) or cells[y * width + x]:
+                                        continue
+                                nextCell = (x, y)
+                                nextDistance = distance + cost
+                                if nextDistance < distances.get(nextCell, math.inf):
+                                        distances[nextCell] = nextDistance
+                                        heapq.heappush(openHeap, (nextDistance, nextCell))
+                return distances
+
+        def clusterEdges(self, cluster, deadline = None): # Coût des chemins entre les entrées d'un cluster, calculé la première fois. Retourne None si deadline (time.perf_counter()) est dépassée avant la fin du calcul, qui reprendra au prochain appel
+                edges = self.intra.get(cluster)
+                if edges is None:
+                        entrances = self.entrances(cluster)
+                        edges = self.partial.setdefault(cluster, {})
+                        for cell in [x for x in entrances if x not in edges]:
+                                if deadline and time.perf_counter() > deadline:
+                                        return None
+                                distances = self.distances(cluster, cell)
+                                edges[cell] = {x: distances[x] for x in entrances if x != cell and x in distances}
+                        del self.partial[cluster]
+                        self.intra[cluster] = edges
+                        self.rebuilds += 1
+                return edges
+
+        def isReady(self): # Vrai si les arêtes de tous les clusters sont calculées: une recherche sur le graphe ne calculera rien de plus que ses extrémités
+                return len(self.intra) == self.columns * self.rows
+
+        def prepare(self, deadline): # Calcule à l'avance les arêtes des clusters qui ne le sont pas encore, jusqu'à deadline (time.perf_counter()). Retourne vrai si tous les clusters sont calculés
+                count = self.columns * self.rows
+                for _ in range(count):
+                        cluster = (self.cursor % self.columns, self.cursor // self.columns)
+                        if cluster not in self.intra and self.clusterEdges(cluster, deadline) is None:
+                                return False
+                        self.cursor = (self.cursor + 1) % count
+                return True
+
+        def update(self, rect): # Recalcule seulement les entrées et oublie les arêtes des clusters touchés par une hitbox ajoutée ou enlevée
+                precision = self.navGrid.precision
+                left = max(0, rect.left // precision // self.clusterSize)
+                top = max(0, rect.top // precision // self.clusterSize)
+                right = min(self.columns - 1, (rect.right - 1) // precision // self.clusterSize)
+                bottom = min(self.rows - 1, (rect.bottom - 1) // precision // self.clusterSize)
+                touched = set(itertools.product(range(left, right + 1), range(top, bottom + 1)))
+                for x, y in touched:
+                        for key in ((x, y, "est"), (x, y, "sud"), (x - 1, y, "est"), (x, y - 1, "sud")):
+                                if key[0] >= 0 and key[1] >= 0:
+                                        self.__buildBorder(key)
+                for x, y in touched | {(x + offsetX, y + offsetY) for x, y in touched for offsetX, offsetY in ((1, 0), (-1, 0), (0, 1), (0, -1))}: # Les entrées des clusters voisins ont pu changer
+                        self.intra.pop((x, y), None) # Recalculé à la prochaine recherche qui le traverse
+                        self.partial.pop((x, y), None)
+
+        def __heuristic(self, cell, goal):
+                dx = abs(goal[0] - cell[0])
+                dy = abs(goal[1] - cell[1])
+                return (max(dx, dy) + (math.sqrt(2) - 1) * min(dx, dy)) * self.navGrid.precision
+
+        def startPath(self, start, finish): # Prépare la recherche sur le graphe abstrait des entrées à traverser entre deux cellules, avancée ensuite par findPath()
+                startCluster = self.clusterOf(start)
+                finishCluster = self.clusterOf(finish)
+                startEntrances = self.entrances(startCluster)
+                finishEntrances = self.entrances(finishCluster)
+                startEdges = {x: y for x, y in self.distances(startCluster, start).items() if x in startEntrances and x != start} # Le départ et la fin sont reliés temporairement aux entrées de leur cluster
+                finishEdges = {x: y for x, y in self.distances(finishCluster, finish).items() if x in finishEntrances}
+                return self.Search(start, finish, startEdges, finishEdges, self.__heuristic(start, finish))
+
+        def findPath(self, search, deadline = None): # Avance la recherche jusqu'à deadline (time.perf_counter()). Retourne None si le temps est épuisé, sinon la liste des cellules jusqu'à la fin incluse, vide si elle n'est pas atteignable
+                start = search.start
+                finish = search.finish
+                known = search.known
+                parents = search.parents
+                openHeap = search.openHeap
+                if not search.startEdges or not search.finishEdges: # Le départ ou la fin n'atteint aucune entrée de son cluster: inutile de parcourir le graphe
+                        return []
+                pops = 0
+                while openHeap:
+                        pops += 1
+                        if deadline and pops % 16 == 0 and time.perf_counter() > deadline: # Le budget de temps est épuisé, la recherche reprendra au prochain appel
+                                return None
+                        total, length, cell = heapq.heappop(openHeap)
+                        if cell == finish:
+                                path = []
+                                while cell != start:
+                                        path.append(cell)
+                                        cell = parents[cell]
+                                path.reverse()
+                                return path
+                        if length > known[cell]:
+                                continue
+                        if cell == start:
+                                edges = list(search.startEdges.items())
+                        else:
+                                clusterEdges = self.clusterEdges(self.clusterOf(cell), deadline)
+                                if clusterEdges is None: # La cellule sera analysée au prochain appel, une fois les arêtes de son cluster calculées
+                                        heapq.heappush(openHeap, (total, length, cell))
+                                        return None
+                                edges = list(clusterEdges.get(cell, {}).items()) + list(self.inter.get(cell, {}).items())
+                        if cell in search.finishEdges:
+                                edges.append((finish, search.finishEdges[cell]))
+                        for nextCell, cost in edges:
+                                nextLength = length + cost
+                                if nextLength < known.get(nextCell, math.inf):
+                                        known[nextCell] = nextLength
+                                        parents[nextCell] = cell
+                                        heapq.heappush(openHeap, (nextLength + self.__heuristic(nextCell, finish), nextLength, nextCell))
+                return []
+
+        class Search: # Etat d'une recherche sur le graphe abstrait, conservé entre deux appels de findPath()
+                def __init__(self, start, finish, startEdges, finishEdges, heuristic):
+                        self.start = start
+                        self.finish = finish
+                        self.startEdges = startEdges
+                        self.finishEdges = finishEdges
+                        self.known = {start: 0} # Plus courte distance connue de chaque cellule
+                        self.parents = {start: None}
+                        self.openHeap = [(heuristic, 0, start)]
+
+
+class PathFinder: # Classe permettant de trouver le chemin le plus rapide entre deux points en tenant compte des obstacles (algorithme A*)
+        def __init__(self, navGrid, maxRadius, clusterGraph = None):
                 self.start = None # Le point de départ
                 self.finish = None # Le point d'arrivé
-                self.hitboxes = hitboxes # Les hitboxes a prendre en compte 
-                self.precision = precision # La précision de la recherche 
+                self.navGrid = navGrid # La grille de marche de la map, partagée avec les autres ennemis
+                self.clusterGraph = clusterGraph # Graphe hiérarchique de la grille. Si donné, les trajets entre deux clusters passent par ses entrées
+                self.route = [] # Points de passage suivants d'un trajet hiérarchique. Le chemin vers le premier n'est cherché qu'une fois le chemin actuel parcouru
+                self.precision = navGrid.precision # La précision de la recherche, égale à la taille des cellules de la grille
                 self.maxRadius = maxRadius # Radius maximale a ne pas dépasser pour la recherche 
                 self.nodes = [] # La liste des "nodes"
                 self.path = [] # Liste de "nodes" correspondant au chemin le plus rapide. Seulement aggrémenter avec findBest()
-
-        def __nodeInHitbox(self, rect): # Vérifie si le rectangle d'un node se trouve sur des hitboxes
-                if rect.collidelistall(self.hitboxes):
-                                return True
-                return False
-
-        def __addNeighbourNodes(self, node): # Ajoute 8 nodes à la liste de nodes autour du node précisé si ils n'existent pas déjà et ne se trouvent pas sur des hitboxes
-                # Vérifie que le node à la droite n'existe pas déja
-                nextNodeCoords = (node.rect.x + node.rect.width, node.rect.y) # Position du prochain node 
-                if (not [x for x in self.nodes if nextNodeCoords == x.rect.topleft] and not self.__nodeInHitbox(pygame.Rect(nextNodeCoords, (node.rect.width, node.rect.height)))) or pygame.Rect(nextNodeCoords, (node.rect.width, node.rect.height)).collidepoint(self.finish): # Si le node ne se trouve pas déjà sur l'emplacement d'un autre node et qu'il ne collisionne pas avec des hitboxes ou si un joueur se trouve dedans
-                        # Ajoute le node de droite si elle n'existe pas déja
-                        self.nodes.append(self.Node(nextNodeCoords, node.rect.width, node, 1, self.start, self.finish))
-                        
-                # Vérifie que le node à la gauche n'existe pas déja
-                nextNodeCoords = (node.rect.x - node.rect.width, node.rect.y) # Position du prochain node 
-                if (not [x for x in self.nodes if nextNodeCoords == x.rect.topleft] and not self.__nodeInHitbox(pygame.Rect(nextNodeCoords, (node.rect.width, node.rect.height)))) or pygame.Rect(nextNodeCoords, (node.rect.width, node.rect.height)).collidepoint(self.finish): # Si le node ne se trouve pas déjà sur l'emplacement d'un autre node et qu'il ne collisionne pas avec des hitboxes ou si un joueur se trouve dedans
-                        # Ajoute le node de gauche si elle n'existe pas déja
-                        self.nodes.append(self.Node(nextNodeCoords, node.rect.width, node, 1, self.start, self.finish))
-
-                # Vérifie que le node au dessus n'existe pas déja
-                nextNodeCoords = (node.rect.x, node.rect.y - node.rect.width) # Position du prochain node 
-                if (not [x for x in self.nodes if nextNodeCoords == x.rect.topleft] and not self.__nodeInHitbox(pygame.Rect(nextNodeCoords, (node.rect.width, node.rect.height)))) or pygame.Rect(nextNodeCoords, (node.rect.width, node.rect.height)).collidepoint(self.finish): # Si le node ne se trouve pas déjà sur l'emplacement d'un autre node et qu'il ne collisionne pas avec des hitboxes ou si un joueur se trouve dedans
-                        # Ajoute le node au dessus si elle n'existe pas déja
-                        self.nodes.append(self.Node(nextNodeCoords, node.rect.width, node, 1, self.start, self.finish))
-
-                # Vérifie que le node en dessous n'existe pas déja
-                nextNodeCoords = (node.rect.x, node.rect.y + node.rect.width) # Position du prochain node 
-                if (not [x for x in self.nodes if nextNodeCoords == x.rect.topleft] and not self.__nodeInHitbox(pygame.Rect(nextNodeCoords, (node.rect.width, node.rect.height)))) or pygame.Rect(nextNodeCoords, (node.rect.width, node.rect.height)).collidepoint(self.finish): # Si le node ne se trouve pas déjà sur l'emplacement d'un autre node et qu'il ne collisionne pas avec des hitboxes ou si un joueur se trouve dedans
-                        # Ajoute le node en dessous si elle n'existe pas déja
-                        self.nodes.append(self.Node(nextNodeCoords, node.rect.width, node, 1, self.start, self.finish))
-
-                # Vérifie que le node à la droite en haut n'existe pas déja
-                nextNodeCoords = (node.rect.x + node.rect.width, node.rect.y - node.rect.width) # Position du prochain node 
-                if (not [x for x in self.nodes if nextNodeCoords == x.rect.topleft] and not self.__nodeInHitbox(pygame.Rect(nextNodeCoords, (node.rect.width, node.rect.height)))) or pygame.Rect(nextNodeCoords, (node.rect.width, node.rect.height)).collidepoint(self.finish): # Si le node ne se trouve pas déjà sur l'emplacement d'un autre node et qu'il ne collisionne pas avec des hitboxes ou si un joueur se trouve dedans
-                        # Ajoute le node à la droite en haut si elle n'existe pas déja
-                        self.nodes.append(self.Node(nextNodeCoords, node.rect.width, node, 1, self.start, self.finish))
-
-                # Vérifie que le node à la droite en bas n'existe pas déja
-                nextNodeCoords = (node.rect.x + node.rect.width, node.rect.y + node.rect.width) # Position du prochain node 
-                if (not [x for x in self.nodes if nextNodeCoords == x.rect.topleft] and not self.__nodeInHitbox(pygame.Rect(nextNodeCoords, (node.rect.width, node.rect.height)))) or pygame.Rect(nextNodeCoords, (node.rect.width, node.rect.height)).collidepoint(self.finish): # Si le node ne se trouve pas déjà sur l'emplacement d'un autre node et qu'il ne collisionne pas avec des hitboxes ou si un joueur se trouve dedans
-                        # Ajoute le node à la droite en bas si elle n'existe pas déja
-                        self.nodes.append(self.Node(nextNodeCoords, node.rect.width, node, 1, self.start, self.finish))
-
-                # Vérifie que le node à la gauche en haut n'existe pas déja
-                nextNodeCoords = (node.rect.x - node.rect.width, node.rect.y - node.rect.width) # Position du prochain node 
-                if (not [x for x in self.nodes if nextNodeCoords == x.rect.topleft] and not self.__nodeInHitbox(pygame.Rect(nextNodeCoords, (node.rect.width, node.rect.height)))) or pygame.Rect(nextNodeCoords, (node.rect.width, node.rect.height)).collidepoint(self.finish): # Si le node ne se trouve pas déjà sur l'emplacement d'un autre node et qu'il ne collisionne pas avec des hitboxes ou si un joueur se trouve dedans
-                        # Ajoute le node à la gauche en haut si elle n'existe pas déja
-                        self.nodes.append(self.Node(nextNodeCoords, node.rect.width, node, 1, self.start, self.finish))
-
-                # Vérifie que le node à la gauche en bas n'existe pas déja
-                nextNodeCoords = (node.rect.x - node.rect.width, node.rect.y + node.rect.width) # Position du prochain node 
-                if (not [x for x in self.nodes if nextNodeCoords == x.rect.topleft] and not self.__nodeInHitbox(pygame.Rect(nextNodeCoords, (node.rect.width, node.rect.height)))) or pygame.Rect(nextNodeCoords, (node.rect.width, node.rect.height)).collidepoint(self.finish): # Si le node ne se trouve pas déjà sur l'emplacement d'un autre node et qu'il ne collisionne pas avec des hitboxes ou si un joueur se trouve dedans
-                        # Ajoute le node à la gauche en bas si elle n'existe pas déja
-                        self.nodes.append(self.Node(nextNodeCoords, node.rect.width, node, 1, self.start, self.finish))
-
-                node.state = 2 # Change l'état du node pour qu'il ne soit pas pris en compte une deuxième fois par closestNode()
-
-        def __closestNode(self, includeChecked): # Indique le node le plus proche du point de fin dans la liste de nodes
-                tempNodes = list(filter(lambda x: x.state == 1, self.nodes)) 
-                if includeChecked:
-                        smallestTLList = self.nodes
+                self.smoothing = True # Si vrai, findBest() ne garde que les nodes où le chemin change de direction (voir smoothPath())
+                self.search = None # Recherche en cours, commencée par startSearch()
+                self.hierarchical = False # Vrai si la recherche en cours passe déjà par le graphe hiérarchique
+                self.planner = None # DStarLite gardé entre les recherches, qui répare le chemin quand le joueur bouge au lieu de le chercher à nouveau. Si None, chaque recherche repart de zéro
+
+        def __heuristic(self, rect, goal): # Distance "octile" entre le centre d'un node et le point visé. Ne surestime jamais le coût réel avec 8 directions
+                dx = abs(goal[0] - rect.centerx)
+                dy = abs(goal[1] - rect.centery)
+                return max(dx, dy) + (math.sqrt(2) - 1) * min(dx, dy)
+
+        def findBest(self, start, finish, route = None): # Trouve le chemin le plus rapide du point début au point fin en tenant compte des obstacles
+                self.startSearch(start, finish, route)
+                self.continueSearch()
+                return self.path
+
+        def startSearch(self, start, finish, route = None): # Prépare une recherche, avancée ensuite par continueSearch(). Le chemin actuel reste utilisable tant qu'elle n'est pas terminée. route: points de passage suivants si finish est un point de passage d'un trajet hiérarchique
+                self.start = start
+                self.finish = route[-1] if route else finish
+                startCell = self.navGrid.cellOf(start)
+                finishCell = self.navGrid.cellOf(finish)
+                self.hierarchical = route is not None
+                if route is not None: # Tronçon suivant d'un trajet hiérarchique
+                        self.__startLeg(start, finish, route, (2 * self.clusterGraph.clusterSize) ** 2) # Un tronçon ne sort pas des deux clusters qu'il relie
+                elif self.clusterGraph and max(abs(startCell[0] - finishCell[0]), abs(startCell[1] - finishCell[1])) > 2 * self.clusterGraph.clusterSize: # Long trajet: cherché d'abord sur le graphe hiérarchique, les courts restent plus rapides en A* direct
+                        self.__startHierarchical(False)
                 else:
-                        smallestTLList = [] # "Smallest Total Lengths List" - liste des nodes dont la longueur totale (longueur au début + longueur à la fin) est la plus courte
-                        for node in tempNodes: # Itère les nodes qui n'ont pas encore été les plus proche
-                                if smallestTLList: # Si un node se trouve déjà dans la liste
-                                        if node.totalLength < smallestTLList[0].totalLength:
-                                                smallestTLList = [node] # Si un node est plus petits que les autres nodes de la liste, il les remplace
-                                        elif node.totalLength == smallestTLList[0].totalLength:
-                                                smallestTLList.append(node) # Si un node a la même longueur totale que les autres nodes il est seulement ajouté
-                                else:
-                                        smallestTLList.append(node) # On ajoute le premier node du "for" pour avoir quelque chose à comparer
-                if len(smallestTLList) > 1: # Si plusieurs nodes ont la même longueur totale 
-                        smallestELList = [] # "Smallest End Lenghts List" - liste des nodes, qui ont la même longueur totale, dont la longueur à la fin est la plus courte
-                        for node in smallestTLList:
-                                if smallestELList:
-                                        if node.endLength < smallestELList[0].endLength:
-                                                smallestELList = [node] # Si un node est plus petits que les autres nodes de la liste, il les remplace
-                                        elif node.endLength == smallestELList[0].endLength:
-                                                smallestELList.append(node) # Si un node a la même longueur à la fin que les autres nodes il est seulement ajouté
-                                else:
-                                        smallestELList.append(node) # On ajoute le premier node du "for" pour avoir quelque chose à comparer
-                        return smallestELList[0] # On retourne le premier node de la liste de nodes ayant la même longueur totale et à la fin
+                        self.__startDirect(start, finish)
+
+        def __startHierarchical(self, fallback = True): # Passe la recherche en cours sur le graphe hiérarchique, si elle n'y est pas déjà passée. fallback: la recherche directe a atteint sa limite de nodes, le graphe doit être complet (voir PathScheduler.run()). Retourne vrai si c'est le cas
+                if not self.clusterGraph or self.hierarchical or (fallback and not self.clusterGraph.isReady()):
+                        return False
+                self.hierarchical = True
+                self.search = self.clusterGraph.startPath(self.navGrid.cellOf(self.start), self.navGrid.cellOf(self.finish))
+                return True
+
+        def __startDirect(self, start, finish): # Prépare la recherche d'un chemin sans passer par le graphe hiérarchique
+                if self.planner and not self.planner.abandoned:
+                        self.planner.setEnds(start, finish)
+                        self.search = self.planner
                 else:
-                        return smallestTLList[0] # Retourne l'unique node le plus proche
+                        self.__startLeg(start, finish, [], self.maxRadius / 6)
+
+        def __startLeg(self, start, goal, route, maxNodes): # Prépare la recherche A* d'un chemin vers goal. route: points de passage suivants
+                precision = self.precision
+                startCell = self.navGrid.cellOf(start) # Les nodes correspondent aux cellules de la grille de marche
+                startNode = self.Node(self.navGrid.cellRect(startCell).topleft, precision, None, 1, 0, 0)
+                startNode.endLength = self.__heuristic(startNode.rect, goal)
+                startNode.totalLength = startNode.endLength
+                self.nodes = [startNode] # Tous les nodes créés, pour l'affichage de debug
+                self.search = self.Search(startNode, startCell, start, goal, route, maxNodes)
+
+        @profiler.timed("pathfinding")
+        def continueSearch(self, deadline = None): # Avance la recherche en cours jusqu'à sa fin ou jusqu'à deadline (time.perf_counter()). Retourne vrai si la recherche est terminée
+                return self.__advance(deadline)
+
+        def __advance(self, deadline): # Corps de continueSearch(), rappelé lorsque la recherche passe sur le graphe hiérarchique
+                search = self.search
+                precision = self.precision
+                if isinstance(search, ClusterGraph.Search):
+                        route = self.clusterGraph.findPath(search, deadline)
+                        if route is None:
+                                return False
+                        if route:
+                                route = [self.navGrid.cellRect(x).center for x in route[:-1]] + [self.finish]
+                                self.__startLeg(self.start, route[0], route[1:], (2 * self.clusterGraph.clusterSize) ** 2) # Le premier tronçon ne sort pas des deux clusters qu'il relie
+                        else: # La fin n'est pas atteignable par le graphe: recherche directe vers le node le plus proche
+                                self.__startDirect(self.start, self.finish)
+                        search = self.search
+                if search is self.planner:
+                        found = self.planner.compute(deadline)
+                        if found is None:
+                                return False
+                        if found:
+                                self.path = [self.Node(self.navGrid.cellRect(x).topleft, precision, None, 2, 0, 0) for x in self.planner.path()]
+                                self.nodes = list(self.path)
+                                if self.smoothing:
+                                        self.smoothPath(self.start)
+                                self.route = []
+                                self.search = None
+                                return True
+                        if self.__startHierarchical(): # Le joueur n'est pas atteint dans la limite de nodes: le graphe hiérarchique contourne les obstacles sans cette limite
+                                return self.__advance(deadline)
+                        self.__startLeg(self.start, self.finish, [], self.maxRadius / 6) # A* donne au moins un chemin vers le node le plus proche
+                        search = self.search
+                known = search.known
+                openHeap = search.openHeap
+                diagonal = precision * math.sqrt(2)
+                pops = 0
+
+                while openHeap:
+                        pops += 1
+                        if deadline and pops % 16 == 0 and time.perf_counter() > deadline: # Le budget de temps est épuisé, la recherche reprendra au prochain appel
+                                return False
+                        key = heapq.heappop(openHeap)[3]
+                        node = known[key]
+                        if node.state == 2: # Le node a déjà été analysé avec un chemin plus court
+                                continue
+                        node.state = 2
+                        if node.rect.colliderect(search.finishRect): # Le node se trouve sur la fin
+                                search.reached = node
+                                break
+                        if len(self.nodes) > search.maxNodes: # La recherche a dépassé le radius maximale
+                                if self.__startHierarchical(): # La fin est peut-être derrière un obstacle trop grand pour la limite de nodes: le graphe hiérarchique n'a pas cette limite
+                                        return self.__advance(deadline)
+                                break
+                        for offsetX, offsetY in ((1, 0), (-1, 0), (0, -1), (0, 1), (1, -1), (1, 1), (-1, -1), (-1, 1)): # Les 8 nodes voisins
+                                nextKey = (key[0] + offsetX, key[1] + offsetY)
+                                nextNode = known.get(nextKey)
+                                if nextNode and nextNode.state == 2:
+                                        continue
+                                startLength = node.startLength + (diagonal if offsetX and offsetY else precision)
+                                if nextNode:
+                                        if startLength >= nextNode.startLength: # Le chemin existant vers ce node est déjà plus court
+                                                continue
+                                        nextNode.parent = node
+                                        nextNode.startLength = startLength
+                                        nextNode.totalLength = startLength + nextNode.endLength
+                                else:
+                                        nextRect = self.navGrid.cellRect(nextKey)
+                                        if not self.navGrid.isWalkable(nextKey) and not nextRect.collidepoint(search.goal): # Un node est bloqué s'il collisionne avec des hitboxes, sauf si la fin se trouve dedans
+                                                continue
+                                        nextNode = self.Node(nextRect.topleft, precision, node, 1, startLength, 0)
+                                        nextNode.endLength = self.__heuristic(nextNode.rect, search.goal)
+                                        nextNode.totalLength = startLength + nextNode.endLength
+                                        known[nextKey] = nextNode
+                                        self.nodes.append(nextNode)
+                                        if nextNode.endLength < search.closest.endLength:
+                                                search.closest = nextNode
+                                heapq.heappush(openHeap, (nextNode.totalLength, nextNode.endLength, search.counter, nextKey))
+                                search.counter += 1
 
-        def findBest(self, start, finish): # Trouve le chemin le plus rapide du point début au point fin en tenant compte des obstacles
-                self.start = start
-                self.finish = finish
                 self.path = [] # Initialise la liste contenant le meilleur chemin a prendre
-                self.nodes = [self.Node((self.start[0] - self.precision / 2, self.start[1] - self.precision / 2), self.precision, None, 1, self.start, finish)] # Initialise la liste de tout les nodes avec un node centré sur le point de départ
-                closest = None
-
-                while not [x for x in self.nodes if x.rect.colliderect(pygame.Rect(self.finish[0] - self.precision / 2, self.finish[1] - self.precision / 2, self.precision, self.precision))] and not len(self.nodes) > self.maxRadius / 6: # Tant qu'un node n'est pas en collision avec le rectangle centré sur le point de fin et qu'aucun node n'excède le radius maximale précisé, on continue à chercher
-                        closest = self.__closestNode(False) # On cherche le node le plus proche
-                        self.__addNeighbourNodes(closest) # On ajoute les nodes voisin au node le plus proche
-                if len(self.nodes) > self.maxRadius / 6: # Si un node se trouve en dehors du radius maximale
-                        current_node = self.__closestNode(True) # On retrace le chemin le plus court à l'envers (en incluant les nodes déjà vérifié) en partant du node le plus proche du point de fin 
-                else:
-                        current_node = self.__closestNode(False) # On retrace le chemin le plus court à l'envers en partant du node le plus proche du point de fin 
-                while current_node != self.nodes[0]: # Tant que l'on a pas atteint le node de départ
+                current_node = search.reached or search.closest # Si la fin n'a pas été atteinte on retrace le chemin vers le node le plus proche de la fin
+                while current_node is not search.startNode: # Tant que l'on a pas atteint le node de départ
                         self.path.append(current_node) # On ajoute le node parent au dernier
                         current_node = current_node.parent
-                return self.path.reverse() # On retoune la liste du chemin le plus court après l'avoir inversé
+                self.path.reverse() # On inverse la liste pour qu'elle aille du départ vers la fin
+                if self.smoothing:
+                        self.smoothPath(search.start)
+                if self.planner and search.reached: # Le joueur est de nouveau atteignable: la prochaine recherche peut réparer les distances du planificateur
+                        self.planner.abandoned = False
+                self.route = search.route
+                self.search = None
+                return True
+
+        def applyResult(self, start, finish, points): # Remplace le chemin par celui trouvé dans un processus de recherche (coins haut gauche des nodes)
+                self.start = start
+                self.finish = finish
+                self.path = [self.Node(point, self.precision, None, 2, 0, 0) for point in points]
+                self.nodes = list(self.path)
+                self.route = []
+
+        def smoothPath(self, start): # Enlève les nodes que l'on peut sauter en ligne droite depuis le node précédent gardé ("string pulling")
+                smoothed = []
+                anchor = start # Dernier point gardé
+                index = 0
+                while index < len(self.path):
+                        farthest = index
+                        while farthest + 1 < len(self.path) and self.navGrid.lineOfSight(anchor, self.path[farthest + 1].rect.center):
+                                farthest += 1
+                        smoothed.append(self.path[farthest])
+                        anchor = self.path[farthest].rect.center
+                        index = farthest + 1
+                self.path = smoothed
 
         def drawPath(self, screen, screenCoords): # Déssine le chemin le plus court à l'aide d'un tracé rouge
                 if self.path:
@@ -582,14 +1645,28 @@ class PathFinder: # Classe permettant de trouver le chemin le plus rapide entre
                         pygame.draw.aalines(screen, pygame.Color("red"), False, [(x.rect.centerx - screenCoords[0], x.rect.centery - screenCoords[1]) for x in self.path] + [(self.finish[0] - screenCoords[0], self.finish[1] - screenCoords[1])]) # On indique une suite de ligne anti-aliasé, suivant le chemin
                         pygame.draw.circle(screen, pygame.Color("yellow"), (self.finish[0] - screenCoords[0], self.finish[1] - screenCoords[1]), 5) # On indique le point de fin à l'aide d'un point jaune
 
+        class Search: # Etat d'une recherche en cours, conservé entre deux appels de continueSearch()
+                def __init__(self, startNode, startCell, start, goal, route, maxNodes):
+                        self.startNode = startNode
+                        self.start = start
+                        self.goal = goal # Point visé par cette recherche: la fin, ou le prochain point de passage d'un trajet hiérarchique
+                        self.route = route # Points de passage restants après goal
+                        self.finishRect = pygame.Rect(goal[0] - startNode.rect.width / 2, goal[1] - startNode.rect.height / 2, startNode.rect.width, startNode.rect.height) # Un node en collision avec ce rectangle a atteint la fin
+                        self.maxNodes = maxNodes # Nombre de nodes a ne pas dépasser pour la recherche
+                        self.known = {startCell: startNode} # Les nodes déjà créés, indexés par leurs coordonnées entières sur la grille
+                        self.openHeap = [(startNode.totalLength, startNode.endLength, 0, startCell)] # File de priorité des nodes à analyser: (longueur totale, longueur à la fin, ordre d'insertion, coordonnées)
+                        self.counter = 1
+                        self.closest = startNode # Node le plus proche de la fin, utilisé si la recherche est interrompue
+                        self.reached = None
+
         class Node: # Classe définissant un node
-                def __init__(self, coords, precision, parent, state, startPoint, endPoint):
+                def __init__(self, coords, precision, parent, state, startLength, endLength):
                         self.rect = pygame.Rect(coords, (precision, precision)) # Rectangle définissant le node
                         self.parent = parent # Node parent
                         self.state = state # Etat du node. 1: à analyser        2: déjà analysé
-                        self.startLength = math.sqrt(pow(startPoint[0] - self.rect.centerx, 2) + pow(startPoint[1] - self.rect.centery, 2)) # Distance du node au point de départ
-                        self.endLength = math.sqrt(pow(endPoint[0] - self.rect.centerx, 2) + pow(endPoint[1] - self.rect.centery, 2)) # Distance du node au point d'arrivée
-                        self.totalLength = self.startLength + self.endLength # Distance totale du node (distance au départ + distance à l'arrivée)
+                        self.startLength = startLength # Longueur du meilleur chemin connu entre le point de départ et le node
+                        self.endLength = endLength # Distance estimée du node au point d'arrivée
+                        self.totalLength = startLength + endLength # Distance totale du node (distance au départ + distance à l'arrivée)
 
                 def draw(self, coords, screen): # Dessine le node aux coordonnées écran indiqués
                         if self.state == 2: # Si le node a déjà été analysé
@@ -600,45 +1677,595 @@ class PathFinder: # Classe permettant de trouver le chemin le plus rapide entre
                         pygame.draw.rect(screen, chosenColor, pygame.Rect(coords, (self.rect.width, self.rect.height)))
 
 
-class Bullet :
-        def __init__(self, map, perso, screen, screenRect, weaponCharacteristics, item):
-                screenMouseCoords = pygame.mouse.get_pos() #on obtient les coordonées de la souris
-                self.weaponCharacteristics = weaponCharacteristics
-                self.item = item
-                realMouseCoords = (screenMouseCoords[0] + screenRect.topleft[0], screenMouseCoords[1] + screenRect.topleft[1]) #on obtient les coordonnées réelles du curseur (pas dans le repère de la map)
-                self.map = map
-
-                angle = self.atan2Normalized((perso.rect.centery - realMouseCoords[1]), (realMouseCoords[0] - perso.rect.centerx)) # Angle de la destination par rapport au personnage dans la plan du repère
+class PathWorkerPool: # Processus de recherche de chemin. Les grilles de marche y sont publiées une seule fois en mémoire partagée et les résultats sont récupérés sans attendre
+        attachedGrids = {} # Grilles déjà ouvertes par un processus de recherche, indexées par le nom de leur mémoire partagée
+
+        def __init__(self, processes = None):
+                self.processes = processes or os.cpu_count()
+                if os.name == "posix": # Les processus partagent le suivi des mémoires partagées du jeu, sinon chacun libérerait les grilles en s'arrêtant
+                        multiprocessing.resource_tracker.ensure_running()
+                self.pool = multiprocessing.Pool(self.processes)
+                self.maxPending = 4 * self.processes # Recherches envoyées en même temps. Les autres restent dans la file du PathScheduler, triées par priorité
+                self.published = [] # Grilles publiées, libérées par release() ou close()
+
+        def submit(self, navGrid, maxRadius, start, finish): # Envoie une recherche à un processus. Retourne un multiprocessing.pool.AsyncResult
+                if navGrid.sharedMemory is None:
+                        navGrid.publish()
+                        self.published.append(navGrid)
+                names = [x.sharedMemory.name for x in self.published] # Les processus ferment les grilles qui n'en font plus partie
+                return self.pool.apply_async(PathWorkerPool.search, ((navGrid.sharedMemory.name, (navGrid.width, navGrid.height), navGrid.precision, maxRadius, start, finish, names),))
+
+        def release(self, navGrids): # Libère les grilles publiées d'une map oubliée
+                for navGrid in navGrids:
+                        if navGrid in self.published:
+                                navGrid.unpublish()
+                                self.published.remove(navGrid)
+
+        @staticmethod
+        def search(task): # Exécuté dans un processus de recherche. Retourne les coins haut gauche des nodes du chemin
+                name, size, precision, maxRadius, start, finish, names = task
+                for oldName in [x for x in PathWorkerPool.attachedGrids if x not in names]: # Grille libérée par le jeu: le processus la ferme aussi pour que la mémoire soit rendue
+                        oldGrid = PathWorkerPool.attachedGrids.pop(oldName)
+                        oldGrid.cells.release()
+                        oldGrid.sharedMemory.close()
+                navGrid = PathWorkerPool.attachedGrids.get(name)
+                if navGrid is None:
+                        navGrid = NavGrid.attach(name, size, precision)
+                        PathWorkerPool.attachedGrids[name] = navGrid
+                return [node.rect.topleft for node in PathFinder(navGrid, maxRadius).findBest(start, finish)]
+
+        def close(self): # Arrête les processus et libère les grilles publiées
+                self.pool.terminate()
+                self.pool.join()
+                for navGrid in self.published:
+                        navGrid.unpublish()
+                self.published = []
+
+
+class PathScheduler: # File des recherches de chemin d'une map. Les recherches avancent dans la limite d'un budget de temps par tick et reprennent au tick suivant
+        def __init__(self, budget = 2, workers = None):
+                self.budget = budget # Temps maximum en ms passé à chercher des chemins à chaque tick. None: pas de limite
+                self.workers = workers # PathWorkerPool faisant les recherches dans d'autres processus, ou None pour chercher dans le jeu
+                self.sent = {} # Recherches envoyées aux processus: PathFinder -> (résultat, départ, fin, tick de la demande)
+                self.queue = [] # Tas de (priorité, ordre de la demande, PathFinder). Les entrées remplacées par une demande plus récente sont ignorées
+                self.requests = {} # Dernière demande en attente de chaque PathFinder: (départ, fin, tick de la demande, ordre de la demande)
+                self.active = None # (PathFinder, tick de la demande) de la recherche en cours
+                self.order = 0
+                self.tick = 0
+                self.latencies = collections.deque(maxlen = 600) # Nombre de ticks entre la demande et la fin des dernières recherches
+                self.completed = 0 # Nombre de recherches terminées
+                self.replanning = collections.Counter() # Compteurs partagés par les DStarLite des ennemis de la map
+                self.clusterGraphs = {} # Graphes hiérarchiques de la map, calculés à l'avance avec une partie du budget
+                self.prepareShare = 0.25 # Part minimum du budget de chaque tick donnée au calcul des graphes hiérarchiques tant qu'ils ne sont pas complets, en plus du budget restant
+
+        def request(self, pathFinder, start, finish, priority, route = None): # Demande une recherche. Les priorités les plus basses passent en premier (distance au joueur). L'ennemis garde son chemin actuel ou avance tout droit en attendant. route: voir PathFinder.startSearch()
+                self.order += 1
+                self.requests[pathFinder] = (start, finish, self.tick, self.order, route)
+                heapq.heappush(self.queue, (priority, self.order, pathFinder))
+                if not pathFinder.path:
+                        pathFinder.finish = route[-1] if route else finish
+
+        def cancel(self, pathFinder): # Oublie la demande et la recherche en cours d'un PathFinder
+                self.requests.pop(pathFinder, None)
+                self.sent.pop(pathFinder, None) # Le résultat sera ignoré
+                if self.active and self.active[0] is pathFinder:
+                        pathFinder.search = None
+                        self.active = None
+
+        def isPending(self, pathFinder):
+                return pathFinder in self.requests or pathFinder in self.sent or (self.active is not None and self.active[0] is pathFinder)
+
+        def run(self): # Avance les recherches en attente jusqu'à épuisement du budget. Appelé une fois par tick
+                if self.workers:
+                        self.__runWorkers()
+                        self.tick += 1
+                        return
+                deadline = time.perf_counter() + self.budget / 1000 if self.budget is not None else None
+                while not deadline or time.perf_counter() < deadline:
+                        if not self.active:
+                                if not self.queue:
+                                        break
+                                priority, order, pathFinder = heapq.heappop(self.queue)
+                                request = self.requests.get(pathFinder)
+                                if not request or request[3] != order: # Demande annulée ou remplacée par une plus récente
+                                        continue
+                                del self.requests[pathFinder]
+                                pathFinder.startSearch(request[0], request[1], request[4])
+                                self.active = (pathFinder, request[2])
+                        if self.active[0].continueSearch(deadline):
+                                self.latencies.append(self.tick - self.active[1])
+                                self.completed += 1
+                                self.active = None
+                if deadline: # Les recherches qui dépassent leur limite de nodes ne passent par un graphe hiérarchique qu'une fois celui-ci complet. Il avance avec le budget restant, et au moins prepareShare du budget
+                        prepareDeadline = max(deadline, time.perf_counter() + self.budget * self.prepareShare / 1000)
+                        for clusterGraph in self.clusterGraphs.values():
+                                if not clusterGraph.isReady() and not clusterGraph.prepare(prepareDeadline):
+                                        break
+                self.tick += 1
+
+        def __runWorkers(self): # Récupère les chemins trouvés par les processus de recherche et leur envoie les demandes suivantes
+                for pathFinder, (result, start, finish, tick) in list(self.sent.items()):
+                        if result.ready():
+                                del self.sent[pathFinder]
+                                if result.successful():
+                                        pathFinder.applyResult(start, finish, result.get())
+                                        self.latencies.append(self.tick - tick)
+                                        self.completed += 1
+                waiting = [] # Demandes de PathFinder dont la recherche précédente n'est pas revenue: une seule recherche envoyée à la fois par PathFinder
+                while self.queue and len(self.sent) < self.workers.maxPending:
+                        entry = heapq.heappop(self.queue)
+                        pathFinder = entry[2]
+                        request = self.requests.get(pathFinder)
+                        if not request or request[3] != entry[1]: # Demande annulée ou remplacée par une plus récente
+                                continue
+                        if pathFinder in self.sent:
+                                waiting.append(entry)
+                                continue
+                        del self.requests[pathFinder]
+                        self.sent[pathFinder] = (self.workers.submit(pathFinder.navGrid, pathFinder.maxRadius, request[0], request[1]), request[0], request[1], request[2])
+                for entry in waiting:
+                        heapq.heappush(self.queue, entry)
+
+        def depth(self): # Nombre de recherches en attente ou en cours
+                return len(self.requests) + len(self.sent) + (self.active is not None)
+
+        def lines(self): # Texte pour l'affichage de debug et les mesures de performance
+                latencies = sorted(self.latencies) or [0]
+                lines = ["recherches  {:4d} en attente  latence p50 {} p99 {} ticks".format(self.depth(), latencies[len(latencies) // 2], latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))])]
+                counters = self.replanning
+                if counters["réparations"] or counters["recherches"]: # Nodes analysés en moyenne par une recherche réparée et par une recherche depuis zéro
+                        lines.append("réparations {:4d} x {:.0f} nodes, depuis zéro {} x {:.0f} nodes, {} abandons".format(counters["réparations"], counters["nodes réparations"] / max(1, counters["réparations"]), counters["recherches"], counters["nodes recherches"] / max(1, counters["recherches"]), counters["abandons"]))
+                return lines
+
+
+class FlowField: # Champ de distances calculé depuis un joueur sur la grille de marche. Tous les ennemis qui poursuivent ce joueur le partagent
+        neighbours = ((1, 0, 10), (-1, 0, 10), (0, -1, 10), (0, 1, 10), (1, -1, 14), (1, 1, 14), (-1, -1, 14), (-1, 1, 14)) # Cellules voisines et coût pour s'y rendre (10 en ligne droite, 14 en diagonale)
+        unreached = 1 << 30 # Distance des cellules non atteintes
+
+        def __init__(self, navGrid, maxDistance):
+                self.navGrid = navGrid # La grille de marche sur laquelle le champ est calculé
+                self.maxDistance = maxDistance # Distance de marche (en pixels) au delà de laquelle le champ n'est pas calculé
+                self.origin = None # La cellule du joueur lors du dernier calcul
+                self.gridVersion = None # La version de la grille de marche lors du dernier calcul
+                self.distances = [] # Distance de marche jusqu'au joueur de chaque cellule de la grille, en dixièmes de cellule
+
+        @profiler.timed("flowfield")
+        def update(self, point): # Recalcule le champ seulement si le joueur a changé de cellule ou si la grille a été modifiée
+                origin = self.navGrid.cellOf(point)
+                if origin == self.origin and self.gridVersion == self.navGrid.version:
+                        return False
+                self.origin = origin
+                self.gridVersion = self.navGrid.version
+                width = self.navGrid.width
+                height = self.navGrid.height
+                cells = self.navGrid.cells
+                distances = [self.unreached] * (width * height)
+                self.distances = distances
+                if not (0 <= origin[0] < width and 0 <= origin[1] < height):
+                        return True
+                limit = self.maxDistance * 10 / self.navGrid.precision
+                distances[origin[1] * width + origin[0]] = 0
+                openHeap = [(0, origin[0], origin[1])]
+                while openHeap: # Algorithme de Dijkstra à partir du joueur
+                        distance, x, y = heapq.heappop(openHeap)
+                        if distance > distances[y * width + x] or distance > limit:
+                                continue
+                        for offsetX, offsetY, cost in self.neighbours:
+                                nextX = x + offsetX
+                                nextY = y + offsetY
+                                if not (0 <= nextX < width and 0 <= nextY < height):
+                                        continue
+                                nextIndex = nextY * width + nextX
+                                if cells[nextIndex]:
+                                        continue
+                                if offsetX and offsetY and (cells[y * width + nextX] or cells[nextY * width + x]): # Interdit de couper les coins des hitboxes en diagonale
+                                        continue
+                                nextDistance = distance + cost
+                                if nextDistance < distances[nextIndex]:
+                                        distances[nextIndex] = nextDistance
+                                        heapq.heappush(openHeap, (nextDistance, nextX, nextY))
+                return True
+
+        def nextStep(self, point, target): # Retourne le prochain point à atteindre en descendant le champ depuis un point, ou None si le joueur n'est pas atteignable
+                cell = self.navGrid.cellOf(point)
+                if cell == self.origin: # L'ennemis se trouve dans la même cellule que le joueur
+                        return target
+                width = self.navGrid.width
+                height = self.navGrid.height
+                distance = self.distances[cell[1] * width + cell[0]] if 0 <= cell[0] < width and 0 <= cell[1] < height else self.unreached
+                bestCell = None
+                for offsetX, offsetY, cost in self.neighbours: # La cellule voisine la plus proche du joueur
+                        nextX = cell[0] + offsetX
+                        nextY = cell[1] + offsetY
+                        if 0 <= nextX < width and 0 <= nextY < height and self.distances[nextY * width + nextX] < distance:
+                                distance = self.distances[nextY * width + nextX]
+                                bestCell = (nextX, nextY)
+                if bestCell is None:
+                        return None
+                if bestCell == self.origin:
+                        return target
+                return self.navGrid.cellRect(bestCell).center
+
+
+class DStarLite: # Recherche incrémentale (D* Lite) d'un ennemis vers un joueur qui bouge. Les distances sont calculées depuis le joueur et seulement réparées quand il bouge ou quand la grille change
+        neighbours = FlowField.neighbours
+
+        def __init__(self, navGrid, maxNodes, counters = None):
+                self.navGrid = navGrid # La grille de marche de la map, partagée avec les autres ennemis
+                self.maxNodes = maxNodes # Nombre maximum de nodes analysés par recherche. Au delà la recherche est abandonnée, mais le travail fait reste valable pour la suivante
+                self.retargetCells = 4 # Au delà de ce déplacement du joueur (en cellules), les distances sont recalculées au lieu d'être réparées
+                self.maxTrail = 24 # Nombre maximum de cellules parcourues par le joueur gardées. Au delà les distances sont recalculées, pour que les ennemis ne suivent pas ses traces trop longtemps
+                self.counters = counters if counters is not None else collections.Counter() # "recherches"/"nodes recherches": depuis zéro, "réparations"/"nodes réparations": réparées, "abandons"
+                self.repairing = False # Vrai si la recherche en cours répare les distances de la précédente
+                self.expansions = 0 # Nodes analysés par la recherche en cours
+                self.abandoned = False # Vrai si la dernière recherche n'a pas atteint l'ennemis. PathFinder cherche alors avec A* jusqu'à ce que le joueur soit de nouveau atteignable
+                self.reset()
+
+        def reset(self): # Oublie toutes les distances
+                self.g = {} # Distance jusqu'au joueur de chaque cellule analysée
+                self.rhs = {} # Distance jusqu'au joueur calculée à partir des cellules voisines. Une cellule dont g diffère est dans le tas
+                self.openHeap = [] # Tas de (clé, clé secondaire, ordre, cellule). Les entrées dont la cellule a changé de clé sont ignorées
+                self.keys = {} # Clé actuelle de chaque cellule du tas
+                self.order = 0
+                self.km = 0 # Somme des déplacements de l'ennemis depuis le début, ajoutée aux clés pour garder celles du tas valables
+                self.start = None # Cellule de l'ennemis
+                self.goal = None # Cellule du joueur
+                self.trail = [] # Cellules voisines successives parcourues par le joueur depuis la dernière remise à zéro
+                self.roots = {} # Cellule de la trace -> (distance de départ, index dans la trace). Chaque cellule part d'une distance plus basse que la précédente, de la longueur du pas entre les deux
+                self.gridVersion = self.navGrid.version
+
+        def __heuristic(self, cellA, cellB): # Distance "octile" entre deux cellules, avec les coûts de FlowField.neighbours
+                dx = abs(cellA[0] - cellB[0])
+                dy = abs(cellA[1] - cellB[1])
+                return 10 * max(dx, dy) + 4 * min(dx, dy)
+
+        def __connect(self, cellA, cellB): # Plus court chemin entre deux positions proches du joueur, sans s'éloigner de plus de retargetCells cellules. Retourne les cellules après cellA avec leur distance depuis cellA, ou None s'il n'y en a pas
+                left = min(cellA[0], cellB[0]) - self.retargetCells
+                top = min(cellA[1], cellB[1]) - self.retargetCells
+                right = max(cellA[0], cellB[0]) + self.retargetCells
+                bottom = max(cellA[1], cellB[1]) + self.retargetCells
+                distances = {cellA: 0}
+                parents = {cellA: None}
+                openHeap = [(self.__heuristic(cellA, cellB), 0, cellA)]
+                while openHeap:
+                        total, distance, cell = heapq.heappop(openHeap)
+                        if cell == cellB:
+                                steps = []
+                                while cell != cellA:
+                                        steps.append((cell, distances[cell]))
+                                        cell = parents[cell]
+                                steps.reverse()
+                                return steps
+                        if distance > distances[cell]:
+                                continue
+                        for offsetX, offsetY, cost in self.neighbours:
+                                nextCell = (cell[0] + offsetX, cell[1] + offsetY)
+                                if not (left <= nextCell[0] <= right and top <= nextCell[1] <= bottom) or (nextCell != cellB and not self.navGrid.isWalkable(nextCell)):
+                                        continue
+                                nextDistance = distance + cost
+                                if nextDistance < distances.get(nextCell, math.inf):
+                                        distances[nextCell] = nextDistance
+                                        parents[nextCell] = cell
+                                        heapq.heappush(openHeap, (nextDistance + self.__heuristic(nextCell, cellB), nextDistance, nextCell))
+                return None
+
+        def __key(self, cell): # Comme A*, les égalités sont départagées en faveur des cellules les plus proches de l'ennemis. Les cellules dont la distance doit augmenter passent avant
+                g = self.g.get(cell, math.inf)
+                rhs = self.rhs.get(cell, math.inf)
+                value = min(g, rhs)
+                return (value + self.__heuristic(self.start, cell) + self.km, -math.inf if g < rhs else -value)
+
+        def __push(self, cell):
+                key = self.__key(cell)
+                self.keys[cell] = key
+                heapq.heappush(self.openHeap, (key[0], key[1], self.order, cell))
+                self.order += 1
+
+        def __isOpen(self, cell): # Une cellule est traversable si elle est praticable ou si le joueur y est passé, comme la fin pour PathFinder
+                return cell in self.roots or self.navGrid.isWalkable(cell)
+
+        def __updateCell(self, cell): # Recalcule rhs d'une cellule et la range dans le tas si elle n'est plus cohérente
+                root = self.roots.get(cell)
+                if root is None and cell != self.start and not self.navGrid.isWalkable(cell): # Aucun chemin ne passe par cette cellule
+                        return
+                best = root[0] if root else math.inf
+                for offsetX, offsetY, cost in self.neighbours:
+                        nextCell = (cell[0] + offsetX, cell[1] + offsetY)
+                        if nextCell in self.g and self.__isOpen(nextCell):
+                                best = min(best, self.g[nextCell] + cost)
+                if best == math.inf:
+                        self.rhs.pop(cell, None)
+                else:
+                        self.rhs[cell] = best
+                self.keys.pop(cell, None)
+                if self.g.get(cell, math.inf) != self.rhs.get(cell, math.inf):
+                        self.__push(cell)
+
+        def setEnds(self, start, finish): # Prépare la recherche d'un chemin de start vers finish, en réparant les distances précédentes si le joueur a peu bougé
+                startCell = self.navGrid.cellOf(start)
+                goalCell = self.navGrid.cellOf(finish)
+                changes = [x[1] for x in self.navGrid.changes if x[0] > self.gridVersion] if self.navGrid.version != self.gridVersion else [] # Rectangles de cellules modifiés depuis la dernière recherche
+                self.expansions = 0
+                steps = None # Cellules parcourues par le joueur depuis sa position précédente, avec leur distance depuis celle-ci
+                if (self.goal is not None and len(changes) == self.navGrid.version - self.gridVersion
+                    and max(abs(goalCell[0] - self.goal[0]), abs(goalCell[1] - self.goal[1])) <= self.retargetCells
+                    and not any(left <= x <= right and top <= y <= bottom for x, y in self.trail for left, top, right, bottom in changes)): # La trace du joueur ne traverse aucune cellule modifiée
+                        steps = self.__connect(self.goal, goalCell)
+                if steps is None or len(self.trail) + len(steps) > self.maxTrail: # Le joueur a trop bougé, ou ses deux positions ne sont pas reliées par un chemin proche
+                        self.reset()
+                        self.start = startCell
+                        self.goal = goalCell
+                        self.trail = [goalCell]
+                        self.roots[goalCell] = (0, 0)
+                        self.rhs[goalCell] = 0
+                        self.__push(goalCell)
+                        self.repairing = False
+                        return
+                self.km += self.__heuristic(self.start, startCell)
+                self.start = startCell
+                self.gridVersion = self.navGrid.version
+                cells = {startCell}
+                for left, top, right, bottom in changes: # Les cellules voisines d'une cellule modifiée ne peuvent plus compter sur sa distance
+                        cells.update(itertools.product(range(left - 1, right + 2), range(top - 1, bottom + 2)))
+                rootDistance = self.roots[self.goal][0]
+                for cell, distance in steps: # Super-source: chaque cellule parcourue part d'une distance plus basse que l'ancienne cellule du joueur, de la longueur du chemin entre les deux. Les distances ne peuvent que baisser, à partir de ces cellules
+                        self.roots[cell] = (rootDistance - distance, len(self.trail))
+                        self.trail.append(cell)
+                        cells.add(cell)
+                self.goal = goalCell
+                for cell in cells:
+                        if 0 <= cell[0] < self.navGrid.width and 0 <= cell[1] < self.navGrid.height:
+                                self.__updateCell(cell)
+                self.repairing = True
+
+        def compute(self, deadline = None): # Avance la recherche jusqu'à deadline (time.perf_counter()). Retourne None si le temps est épuisé, vrai si l'ennemis a un chemin, faux sinon
+                g = self.g
+                rhs = self.rhs
+                keys = self.keys
+                openHeap = self.openHeap
+                start = self.start
+                startX, startY = start
+                km = self.km
+                inf = math.inf
+                roots = self.roots
+                navCells = self.navGrid.cells
+                width = self.navGrid.width
+                height = self.navGrid.height
+                pops = 0
+                while True:
+                        top = None
+                        while openHeap: # Première entrée valable du tas
+                                top = openHeap[0]
+                                if keys.get(top[3]) == (top[0], top[1]):
+                                        break
+                                heapq.heappop(openHeap)
+                                top = None
+                        startValue = min(g.get(start, inf), rhs.get(start, inf))
+                        if top is None or ((top[0], top[1]) >= (startValue + km, -startValue) and rhs.get(start, inf) == g.get(start, inf)): # Plus aucune cellule ne peut raccourcir le chemin de l'ennemis
+                                break
+                        pops += 1
+                        if deadline and pops % 16 == 0 and time.perf_counter() > deadline:
+                                return None
+                        if self.expansions >= self.maxNodes:
+                                break
+                        cell = top[3]
+                        value = min(g.get(cell, inf), rhs.get(cell, inf))
+                        dx = abs(startX - cell[0])
+                        dy = abs(startY - cell[1])
+                        if top[0] < value + 10 * max(dx, dy) + 4 * min(dx, dy) + km: # L'ennemis a bougé depuis l'ajout de cette cellule
+                                self.__push(cell)
+                                continue
+                        heapq.heappop(openHeap)
+                        del keys[cell]
+                        self.expansions += 1
+                        if g.get(cell, inf) > rhs.get(cell, inf): # La distance de la cellule a diminué: les voisines ne peuvent que raccourcir leur distance en passant par elle
+                                g[cell] = value
+                                if cell not in roots and navCells[cell[1] * width + cell[0]]: # Aucun chemin ne passe par cette cellule
+                                        continue
+                                for offsetX, offsetY, cost in self.neighbours:
+                                        nextX = cell[0] + offsetX
+                                        nextY = cell[1] + offsetY
+                                        nextCell = (nextX, nextY)
+                                        nextValue = value + cost
+                                        if 0 <= nextX < width and 0 <= nextY < height and nextValue < rhs.get(nextCell, inf) and (not navCells[nextY * width + nextX] or nextCell == start or nextCell in roots):
+                                                rhs[nextCell] = nextValue
+                                                nextG = g.get(nextCell, inf)
+                                                if nextG != nextValue:
+                                                        dx = abs(startX - nextX)
+                                                        dy = abs(startY - nextY)
+                                                        key = (min(nextG, nextValue) + 10 * max(dx, dy) + 4 * min(dx, dy) + km, -inf if nextG < nextValue else -nextValue)
+                                                        keys[nextCell] = key
+                                                        heapq.heappush(openHeap, (key[0], key[1], self.order, nextCell))
+                                                        self.order += 1
+                                                else:
+                                                        keys.pop(nextCell, None)
+                        else: # La distance de la cellule a augmenté: elle et ses voisines sont recalculées
+                                g.pop(cell, None)
+                                self.__updateCell(cell)
+                                for offsetX, offsetY, cost in self.neighbours:
+                                        nextX = cell[0] + offsetX
+                                        nextY = cell[1] + offsetY
+                                        if 0 <= nextX < width and 0 <= nextY < height:
+                                                self.__updateCell((nextX, nextY))
+                found = g.get(start, math.inf) < math.inf and rhs.get(start, math.inf) == g[start]
+                if self.repairing:
+                        self.counters["réparations"] += 1
+                        self.counters["nodes réparations"] += self.expansions
+                else:
+                        self.counters["recherches"] += 1
+                        self.counters["nodes recherches"] += self.expansions
+                if not found:
+                        self.counters["abandons"] += 1
+                self.abandoned = not found
+                return found
+
+        def path(self): # Cellules du chemin de l'ennemis vers le joueur: descend les distances jusqu'à une cellule de la trace, puis suit la trace
+                cells = []
+                cell = self.start
+                while len(cells) < self.navGrid.width * self.navGrid.height:
+                        root = self.roots.get(cell)
+                        best = root[0] if root else math.inf
+                        bestCell = None
+                        for offsetX, offsetY, cost in self.neighbours:
+                                nextCell = (cell[0] + offsetX, cell[1] + offsetY)
+                                if nextCell in self.g and self.__isOpen(nextCell) and self.g[nextCell] + cost < best:
+                                        best = self.g[nextCell] + cost
+                                        bestCell = nextCell
+                        if bestCell is None:
+                                return cells + self.trail[root[1] + 1:] if root else []
+                        cells.append(bestCell)
+                        cell = bestCell
+                return []
+
+
+class BulletSystem: # Toutes les balles d'un joueur, stockées dans des tableaux NumPy pour être déplacées et testées toutes ensemble
+        size = 4 # Taille en pixels du carré représentant une balle
+        maxRange = 500 # Distance maximale parcourue par une balle
+
+        def __init__(self, capacity = 256):
+                self.count = 0 # Nombre de balles existantes, rangées au début des tableaux
+                self.positions = np.zeros((capacity, 2)) # Coin haut gauche de chaque balle
+                self.velocities = np.zeros((capacity, 2)) # Déplacement de chaque balle à chaque tick
+                self.origins = np.zeros((capacity, 2)) # Position de départ de chaque balle, pour limiter sa portée
+                self.damages = np.zeros(capacity) # Dégâts infligés par chaque balle
+
+        def __len__(self):
+                return self.count
+
+        def __grow(self): # Double la taille des tableaux lorsqu'ils sont pleins
+                capacity = 2 * len(self.damages)
+                for name in ("positions", "velocities", "origins", "damages"):
+                        oldArray = getattr(self, name)
+                        newArray = np.zeros((capacity,) + oldArray.shape[1:])
+                        newArray[:self.count] = oldArray[:self.count]
+                        setattr(self, name, newArray)
+
+        def fire(self, origin, target, weaponCharacteristics, damage): # Tire une balle depuis le point d'origine vers la cible, avec l'imprécision de l'arme
+                if self.count == len(self.damages):
+                        self.__grow()
+                angle = math.atan2(origin[1] - target[1], target[0] - origin[0]) # Angle de la destination par rapport au personnage dans la plan du repère
                 aim = random.randint(int((- 100 + weaponCharacteristics.aim)/2), int((100 - weaponCharacteristics.aim)/2))
-                aimAngle = (math.pi * aim) / 100
-                angle += aimAngle
-                self.direction = (self.weaponCharacteristics.speed * round(math.cos(angle), 5), -self.weaponCharacteristics.speed * round(math.sin(angle), 5)) # Trouve les coefficients avec lesquels incrémenté les coordonnées de l'ennemi pour atteindre la destination à l'aide de trigonométrie
-
-                self.rect = pygame.Rect((perso.rect.centerx - 2, perso.rect.centery - 2),(4, 4))   #on défini le rectangle lié à la balle
-                self.start = self.rect.topleft
-                self.exist = True
-
-        def atan2Normalized(self, y, x): # Retourne l'angle d'un point par rapport à l'origine du repère (https://stackoverflow.com/a/10343477)
-                result = math.atan2(y, x)
-                if result < 0: # Ajoute 2π à l'angle s'il est négatif
-                        result += 2 * math.pi
-                return result
-
-        def move (self):
-                self.rect.move_ip(self.direction[0], self.direction[1])  #on donne la trajectoire à la balle
-                if any(self.rect.collidelistall([hitbox.rect for hitbox in self.map.hitboxes])):    #on vérifie que la balle ne collisionne pas d'hitboxes
-                        self.exist = False
-
-                collisions = self.rect.collidelistall([x.rect for x in self.map.enemies])
-                for enemy in collisions:
-                        self.map.enemies[enemy].health -= self.item.value
-                        self.exist = False
-
-                if self.distanceBetween(self.start, self.rect.topleft) > 500:
-                        self.exist = False
-
-        def distanceBetween(self, pointA, pointB): # Retourne la distance entre un point A et un point B
-                return math.sqrt(math.pow(pointA[0] - pointB[0], 2) + math.pow(pointA[1] - pointB[1], 2))
+                angle += (math.pi * aim) / 100
+                index = self.count
+                self.positions[index] = (origin[0] - self.size / 2, origin[1] - self.size / 2)
+                self.origins[index] = self.positions[index]
+                self.velocities[index] = (weaponCharacteristics.speed * round(math.cos(angle), 5), -weaponCharacteristics.speed * round(math.sin(angle), 5)) # Trouve les coefficients avec lesquels incrémenté les coordonnées de la balle à l'aide de trigonométrie
+                self.damages[index] = damage
+                self.count += 1
+
+        @classmethod
+        def sweep(cls, starts, steps, boxes): # Moment (de 0 à 1) où chaque balle, partant de starts et avançant de steps, touche chaque rectangle (gauche, haut, droite, bas). Infini si elle ne le touche pas
+                low = boxes[:, 0:2] - cls.size # Une balle touche un rectangle si son coin haut gauche entre dans le rectangle agrandi de la taille d'une balle
+                high = boxes[:, 2:4]
+                moving = steps[:, None, :] != 0
+                safeSteps = np.where(moving, steps[:, None, :], 1)
+                enter = (low[None, :, :] - starts[:, None, :]) / safeSteps # Méthode des "slabs": intervalle de temps passé entre les deux bords de chaque axe
+                leave = (high[None, :, :] - starts[:, None, :]) / safeSteps
+                inside = (starts[:, None, :] > low[None, :, :]) & (starts[:, None, :] < high[None, :, :]) # Sur un axe sans mouvement, la balle est entre les bords pendant tout le tick ou jamais
+                enter, leave = np.minimum(enter, leave), np.maximum(enter, leave)
+                enter = np.where(moving, enter, np.where(inside, -np.inf, np.inf)).max(axis = 2) # La balle est dans le rectangle quand elle est entre les bords des deux axes
+                leave = np.where(moving, leave, np.where(inside, np.inf, -np.inf)).min(axis = 2)
+                return np.where((enter < leave) & (leave > 0) & (enter < 1), np.maximum(enter, 0), np.inf)
+
+        def __nearby(self, boxes, starts, ends): # Rectangles qui touchent la zone parcourue par toutes les balles pendant le tick, pour ne tester que ceux là
+                lowest = np.minimum(starts, ends).min(axis = 0)
+                highest = np.maximum(starts, ends).max(axis = 0) + self.size
+                return np.nonzero((boxes[:, 0] < highest[0]) & (boxes[:, 2] > lowest[0]) & (boxes[:, 1] < highest[1]) & (boxes[:, 3] > lowest[1]))[0]
+
+        def move(self, map, tickRate = 60): # Avance toutes les balles, applique les dégâts au premier ennemis touché par chacune et enlève les balles arrêtées
+                count = self.count
+                if not count:
+                        return
+                positions = self.positions[:count]
+                steps = self.velocities[:count] * 60 / tickRate # Les vitesses sont données pour 60 ticks par seconde
+                starts = positions.copy()
+                ends = starts + steps
+                wallTimes = np.full(count, np.inf) # Moment du tick où chaque balle touche sa première hitbox
+
+                hitboxes = map.getHitboxArray()
+                nearby = self.__nearby(hitboxes, starts, ends) if len(hitboxes) else []
+                if len(nearby):
+                        wallTimes = self.sweep(starts, steps, hitboxes[nearby]).min(axis = 1)
+
+                hitTimes = wallTimes.copy() # Moment du tick où chaque balle s'arrête
+                if map.enemies:
+                        enemies = np.array([tuple(x.rect) for x in map.enemies], dtype = float)
+                        enemies[:, 2:4] += enemies[:, 0:2] # (gauche, haut, droite, bas)
+                        nearby = self.__nearby(enemies, starts, ends)
+                        if len(nearby):
+                                times = self.sweep(starts, steps, enemies[nearby])
+                                firstEnemies = times.argmin(axis = 1)
+                                enemyTimes = times[np.arange(count), firstEnemies]
+                                hits = enemyTimes <= wallTimes # Un ennemis caché derrière un mur n'est pas touché
+                                hits &= enemyTimes < np.inf
+                                for bulletIndex in np.nonzero(hits)[0].tolist(): # Seules les collisions effectives sont parcourues en Python
+                                        map.enemies[nearby[firstEnemies[bulletIndex]]].health -= self.damages[bulletIndex]
+                                hitTimes = np.minimum(hitTimes, enemyTimes)
+
+                dead = hitTimes < np.inf
+                positions[:] = starts + steps * np.where(dead, hitTimes, 1)[:, None] # Les balles arrêtées restent au point d'impact
+                travel = positions - self.origins[:count]
+                dead |= (travel * travel).sum(axis = 1) > self.maxRange * self.maxRange
+
+                if dead.any(): # Range les balles restantes au début des tableaux
+                        alive = ~dead
+                        self.count = int(alive.sum())
+                        for values in (self.positions, self.velocities, self.origins, self.damages):
+                                values[:self.count] = values[:count][alive]
+
+        def screenRects(self, screenRect): # Rectangles écran des balles visibles
+                rects = []
+                for x, y in self.positions[:self.count].tolist():
+                        rect = pygame.Rect(int(x) - screenRect[0], int(y) - screenRect[1], self.size, self.size)
+                        if rect.colliderect((0, 0), screenRect.size):
+                                rects.append(rect)
+                return rects
+
+        def draw(self, screenRect, screen):
+                for x, y in self.positions[:self.count].tolist():
+                        screen.fill(pygame.Color("black"), (int(x) - screenRect[0], int(y) - screenRect[1], self.size, self.size))
+
+
+class AreaEffects: # Explosions d'une map. Les entités touchées sont cherchées dans les index spatiaux et les explosifs pris dans une explosion explosent à leur tour
+        radiusFactor = 3 # Rayon d'une explosion, en multiple de la puissance de l'explosif
+
+        def __init__(self, map):
+                self.map = map
+                self.armed = {} # Explosifs posés par les joueurs, qui explosent au contact d'un ennemis (dictionnaire utilisé comme ensemble ordonné)
+                self.queue = collections.deque() # Explosions en attente (centre, rayon, dégâts), traitées dans l'ordre
+                self.explosions = 0 # Nombre d'explosions depuis le début de la partie
+                self.hits = 0 # Nombre de fois qu'une entité a été touchée par une explosion
+
+        def arm(self, explosive): # Pose un explosif sur la map
+                self.map.items.append(explosive)
+                self.armed[explosive] = True
+
+        def disarm(self, explosive): # Oublie un explosif posé, sans le faire exploser
+                self.armed.pop(explosive, None)
+
+        def detonate(self, explosive): # Enlève l'explosif de la map et met son explosion en attente
+                self.disarm(explosive)
+                if explosive in self.map.items: # L'explosif a pu être enlevé de la map entre temps
+                        self.map.items.remove(explosive)
+                self.explode(explosive.rect.center, explosive.value * self.radiusFactor, explosive.value)
+
+        def explode(self, center, radius, damage): # Met une explosion en attente, traitée au prochain update()
+                self.queue.append((center, radius, damage))
+
+        def update(self): # Déclenche les explosifs touchés par un ennemis, puis applique en une seule fois les dégâts de toutes les explosions en chaîne
+                for explosive in [x for x in self.armed if self.map.enemyHash.collideRect(x.rect)]:
+                        self.detonate(explosive)
+                damages = {} # Dégâts cumulés de chaque entité touchée
+                while self.queue:
+                        center, radius, damage = self.queue.popleft()
+                        self.explosions += 1
+                        for obj in self.map.enemyHash.queryRadius(center, radius) + [x for x in self.map.players if SpatialHash.rectInCircle(x.rect, center, radius)]:
+                                damages[obj] = damages.get(obj, 0) + damage
+                        for explosive in [x for x in self.map.itemHash.queryRadius(center, radius) if x in self.armed]: # Les explosifs proches explosent à leur tour
+                                self.detonate(explosive)
+                for obj, damage in damages.items():
+                        obj.health -= damage
+                self.hits += len(damages)
 
 
 class Bouton:  # Classe permettant de créer des boutons 
@@ -678,9 +2305,9 @@ class List:
                 if list and len(list) > 0:
                         for item in list:
                                 if item.name == "Ammo":
-                                        self.list.append((copy.deepcopy(item.rect), item.sprite, item.name, item.value))
+                                        self.list.append((item.rect.copy(), item.sprite, item.name, item.value))
                                 else:
-                                        self.list.append((copy.deepcopy(item.rect), item.sprite, item.name))
+                                        self.list.append((item.rect.copy(), item.sprite, item.name))
                 else:
                         self.list = None
         